@@ -0,0 +1,266 @@
+"""Several EA units sharing one RS-485 bus. The EaDevice classes assume one device per serial port; EaBus instead owns
+the port and addresses each unit by its device node.
+
+RS-485 is half duplex, so only one query may be waiting for a reply at a time. Queries and sets are queued with a
+priority and a scheduler thread works through them one at a time. The highest priority (lowest number) goes first.
+Nodes with the same priority take turns, so a node with a long queue cannot starve the others. Units which acknowledge
+sets keep the bus until their acknowledge has arrived, so it cannot collide with the next telegram.
+
+Telegrams to one unit use the same start delimiter as its EaDevice driver. Bit 5 of the start delimiter (the cast type)
+is set on queries, on control object 54 and on every PS2400B set, and cleared on PSI8000/EL9000 set values; a unit
+answers on its own device node either way, so the bit does not select a broadcast. Broadcasting is therefore off unless
+the bus is created with a broadcast_node, a device node which every unit has been configured to accept set telegrams on.
+Setpoint and output changes sent there are applied by all units at the same moment and none of them answers.
+"""
+
+import collections
+import threading
+
+import serial
+
+from .EA_codec import EaCodec
+from .EA_comms import EaDevice
+from .EA_transport import EaRequest, EaTransport
+
+BUS_MODELS = ('PSI8000', 'EL9000', 'PS2400B')
+ACK_MODELS = ('PS2400B',)  # answer every set telegram with an acknowledge
+
+
+class EaBus:
+    make_SD = EaDevice.make_SD
+
+    def __init__(self, ser=None, retries=1, broadcast_node=None):
+        """
+        ser - an open serial.Serial (or compatible) connection, otherwise call connect
+        retries - int   times a query is resent if no valid reply arrives within the serial timeout
+        broadcast_node - int    device node every unit accepts set telegrams on, enables the broadcast methods
+        """
+        self.ser = ser if ser is not None else serial.Serial()
+        self.retries = retries
+        self.broadcast_node = broadcast_node
+        self.nodes = {}  # device node: {'model', 'volt_nom', 'curr_nom', 'p_nom', 'name'}
+        self.codec = EaCodec()
+        self.transport = None
+        self._queues = {}  # priority: OrderedDict of device node: deque of jobs, rotated for round-robin
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def connect(self, port_string, brate=57600, parity='O', tout=2):
+        """Opens up a serial connection to the bus"""
+        try:
+            self.ser.port = port_string
+            self.ser.baudrate = brate
+            self.ser.parity = parity
+            self.ser.timeout = tout
+            self.ser.open()
+            if self.ser.isOpen():
+                print('Opened serial connection over port ', port_string)
+            else:
+                print('Failed to open serial connection')
+        except serial.serialutil.SerialException as se:
+            print('Error occurred while trying to open serial connection.\nError:\n', se)
+
+    def disconnect(self):
+        """Stops the scheduler and closes the serial connection"""
+        self.stop()
+        try:
+            self.ser.close()
+        except serial.serialutil.SerialException as se:
+            print('Error occurred while trying to close serial connection.\nError:\n', se)
+
+    def add(self, device_node, model='PSI8000', volt_nom=720, curr_nom=15, p_nom=3000, name=None):
+        """
+        Registers a unit on the bus
+        model - str 'PSI8000', 'EL9000' or 'PS2400B', selects the layout of the actual values reply
+        volt_nom, curr_nom, p_nom - float   nominal values of the unit, used to scale setpoints and readings
+        """
+        if model not in BUS_MODELS:
+            raise ValueError("model must be one of " + str(BUS_MODELS))
+        if device_node in self.nodes:
+            raise ValueError("Device node " + str(device_node) + " is already on the bus")
+        if device_node == self.broadcast_node:
+            raise ValueError("Device node " + str(device_node) + " is the broadcast node")
+        self.nodes[device_node] = {'model': model, 'volt_nom': volt_nom, 'curr_nom': curr_nom, 'p_nom': p_nom,
+                                   'name': name if name is not None else model + '_' + str(device_node)}
+
+    def start(self):
+        """Starts the transport and the scheduler thread. The serial connection must already be open"""
+        if self._thread is not None:
+            return
+        # One query in flight at a time, replies from two units would collide on a half duplex bus
+        self.transport = EaTransport(self.ser, max_outstanding=1)
+        self.transport.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._schedule, name='EaBus', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the scheduler, failing anything still queued"""
+        with self._condition:
+            self._running = False
+            jobs = [job for nodes in self._queues.values() for queue in nodes.values() for job in queue]
+            self._queues = {}
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for query, request in jobs:
+            request._finish(error=ConnectionError("EA bus stopped"))
+        if self.transport is not None:
+            self.transport.stop()
+            self.transport = None
+
+    # Queueing
+    def submit(self, device_node, obj, data=None, query=False, priority=0):
+        """Queues a telegram for a unit and returns an EaRequest. For a query its result is the reply data, for a set
+        it completes with None once the telegram has been written, or for a unit in ACK_MODELS once it has been
+        acknowledged"""
+        if device_node not in self.nodes:
+            raise ValueError("No device on the bus with node " + str(device_node))
+        if query:
+            SD = self.make_SD(6, 1, 1, 1)
+            message = self.codec.frame(SD, device_node, obj)
+        else:
+            SD = self._set_SD(device_node, obj, len(data))
+            message = bytes(self.codec.encode(SD, device_node, obj, data))
+        return self._enqueue(device_node, priority, query, EaRequest(message, (device_node, obj)))
+
+    def broadcast(self, obj, data, priority=0):
+        """Queues a set telegram to the broadcast node, which every unit on the bus applies at once. Completes when it
+        has been written. Raises ValueError if the bus has no broadcast_node"""
+        if self.broadcast_node is None:
+            raise ValueError("The bus has no broadcast_node, set the units one by one")
+        SD = self.make_SD(len(data), 1, 1, 3)
+        message = bytes(self.codec.encode(SD, self.broadcast_node, obj, data))
+        return self._enqueue(None, priority, False, EaRequest(message, (None, obj)))
+
+    def _set_SD(self, device_node, obj, data_length):
+        """Start delimiter of a set telegram to one unit, as its EaDevice driver encodes it"""
+        if obj == 54 or self.nodes[device_node]['model'] == 'PS2400B':
+            return self.make_SD(data_length, 1, 1, 3)
+        return self.make_SD(data_length, 1, 0, 3)
+
+    def _enqueue(self, device_node, priority, query, request):
+        with self._condition:
+            if not self._running:
+                raise ConnectionError("EA bus not started")
+            nodes = self._queues.setdefault(priority, collections.OrderedDict())
+            nodes.setdefault(device_node, collections.deque()).append((query, request))
+            self._condition.notify()
+        return request
+
+    def _next_job(self):
+        """Returns the next (query, request) to run, or None. Must be called with the condition held"""
+        for priority in sorted(self._queues):
+            nodes = self._queues[priority]
+            while nodes:
+                device_node, queue = next(iter(nodes.items()))
+                if not queue:
+                    del nodes[device_node]
+                    continue
+                nodes.move_to_end(device_node)  # this node goes to the back of the line for its priority
+                return queue.popleft()
+            del self._queues[priority]
+        return None
+
+    def _schedule(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None and self._running:
+                    self._condition.wait()
+                    job = self._next_job()
+                if not self._running:
+                    if job is not None:
+                        job[1]._finish(error=ConnectionError("EA bus stopped"))
+                    return
+            query, request = job
+            try:
+                if query:
+                    request._finish(data=self.transport.query(request.message, self.retries))
+                elif request.key[0] is not None and self.nodes[request.key[0]]['model'] in ACK_MODELS:
+                    # Hold the bus until the acknowledge is in, it would collide with the next telegram
+                    self.transport.send_acknowledged(request.message)
+                    request._finish()
+                else:
+                    self.transport.send(request.message)
+                    request._finish()
+            except Exception as e:
+                request._finish(error=e)
+
+    # Per-unit commands, each returns an EaRequest
+    def set_v(self, device_node, voltage, priority=0):
+        return self.submit(device_node, 50, self._word(voltage, self.nodes[device_node]['volt_nom']), priority=priority)
+
+    def set_i(self, device_node, current, priority=0):
+        return self.submit(device_node, 51, self._word(current, self.nodes[device_node]['curr_nom']), priority=priority)
+
+    def set_p(self, device_node, power, priority=0):
+        return self.submit(device_node, 52, self._word(power, self.nodes[device_node]['p_nom']), priority=priority)
+
+    def output_on(self, device_node, output, priority=0):
+        return self.submit(device_node, 54, (0x01, 0x01 if output else 0), priority=priority)
+
+    def set_remote(self, device_node, remote, priority=0):
+        return self.submit(device_node, 54, (0x10, 0x10 if remote else 0), priority=priority)
+
+    def query_output(self, device_node, priority=0):
+        """Queues a query of the actual values. Use read_output to get them scaled"""
+        return self.submit(device_node, 71, query=True, priority=priority)
+
+    def read_output(self, device_node, priority=0, timeout=None):
+        """Reads the actual values of a unit, returning {'v', 'i', 'p'}. Blocks until the reply arrives"""
+        return self._scale_output(device_node, self.query_output(device_node, priority).result(timeout))
+
+    def read_all(self, priority=0, timeout=None):
+        """Reads the actual values of every unit, returning {device node: {'v', 'i', 'p'}}. The queries are all queued
+        before waiting so the bus is never idle between them"""
+        requests = {n: self.query_output(n, priority) for n in self.nodes}
+        return {n: self._scale_output(n, request.result(timeout)) for n, request in requests.items()}
+
+    def _scale_output(self, device_node, data):
+        info = self.nodes[device_node]
+        if info['model'] == 'PS2400B':
+            state0, state1, v, i = self.codec.decode_status_values(data)
+            p = v * info['volt_nom'] * i * info['curr_nom'] / info['p_nom'] / 25600
+        else:
+            v, i, p = self.codec.decode_actual_values(data)
+        return {'v': info['volt_nom'] * v / 25600, 'i': info['curr_nom'] * i / 25600, 'p': info['p_nom'] * p / 25600}
+
+    # Broadcast commands, one telegram for every unit on the bus
+    def broadcast_output(self, output, priority=0):
+        return self.broadcast(54, (0x01, 0x01 if output else 0), priority)
+
+    def broadcast_remote(self, remote, priority=0):
+        return self.broadcast(54, (0x10, 0x10 if remote else 0), priority)
+
+    def broadcast_set_v(self, voltage, priority=0):
+        return self.broadcast(50, self._word(voltage, self._common_nominal('volt_nom')), priority)
+
+    def broadcast_set_i(self, current, priority=0):
+        return self.broadcast(51, self._word(current, self._common_nominal('curr_nom')), priority)
+
+    def broadcast_set_p(self, power, priority=0):
+        return self.broadcast(52, self._word(power, self._common_nominal('p_nom')), priority)
+
+    def _common_nominal(self, key):
+        """A setpoint is sent as a fraction of nominal, so it can only be broadcast if every unit has the same one"""
+        nominals = {info[key] for info in self.nodes.values()}
+        if len(nominals) != 1:
+            raise ValueError("Units on the bus have different " + key + " " + str(nominals) + ", set them one by one")
+        return nominals.pop()
+
+    @staticmethod
+    def _word(value, nominal):
+        if value > nominal:
+            raise ValueError("Requested value " + str(value) + " is greater than device maximum " + str(nominal))
+        word = int(25600 * value / nominal)
+        return word >> 8, word & 255
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
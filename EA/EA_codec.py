@@ -0,0 +1,131 @@
+"""Encoder/decoder for the EA binary telegram protocol which avoids per-telegram allocation. Query telegrams never
+change so they are built once and cached, set value telegrams are packed into a reusable buffer with precompiled
+struct layouts, and replies are read straight into a preallocated buffer with readinto.
+
+Telegram layout: SD (start delimiter), DN (device node), OBJ (object), 1-16 data bytes, 2 checksum bytes (big endian
+sum of all preceding bytes). The low nibble of SD is the data length - 1.
+
+An EaCodec is not thread safe, each device object owns its own.
+"""
+
+import struct
+
+ERROR_OBJ = 0xFF  # Object used by the devices for error/acknowledge telegrams, data byte 0 is the error code
+
+_HEADER = struct.Struct('>BBB')  # SD, DN, OBJ
+_WORD_TELEGRAM = struct.Struct('>BBBHH')  # SD, DN, OBJ, one 16 bit value (set values and thresholds), checksum
+_CHECKSUM = struct.Struct('>H')
+ACTUAL_VALUES = struct.Struct('>HHH')  # Object 71 on PSI8000/EL9000: voltage, current, power in 1/25600 of nominal
+STATUS_VALUES = struct.Struct('>BBHH')  # Object 71 on PS2400B: state bytes 0 and 1, voltage, current
+MAX_TELEGRAM = 21  # 3 header bytes, up to 16 data bytes, 2 checksum bytes
+
+
+class EaProtocolError(ConnectionError):
+    """A telegram received from an EA device could not be decoded"""
+
+
+class EaChecksumError(EaProtocolError):
+    pass
+
+
+class EaLengthError(EaProtocolError):
+    pass
+
+
+class EaDeviceError(EaProtocolError):
+    """The device replied with an error telegram"""
+    def __init__(self, device_node, code):
+        super().__init__("EA device node " + str(device_node) + " returned error code " + str(code))
+        self.device_node = device_node
+        self.code = code
+
+
+class EaCodec:
+    def __init__(self):
+        self._frames = {}
+        self._tx = bytearray(MAX_TELEGRAM)
+        self._tx_view = memoryview(self._tx)
+        self._rx = bytearray(MAX_TELEGRAM)
+        self._rx_view = memoryview(self._rx)
+
+    def frame(self, SD, device_node, obj, data=None):
+        """Returns the telegram as immutable bytes, building it only the first time it is requested. Use for
+        telegrams which never change such as queries"""
+        key = (SD, device_node, obj, data)
+        message = self._frames.get(key)
+        if message is None:
+            message = bytes(self.encode(SD, device_node, obj, data))
+            self._frames[key] = message
+        return message
+
+    def encode(self, SD, device_node, obj, data=None):
+        """Packs a telegram into the reusable transmit buffer and returns a view of it. The view is only valid until
+        the next call to encode or encode_word, so write it out straight away"""
+        _HEADER.pack_into(self._tx, 0, SD, device_node, obj)
+        n = 3
+        if data is not None:
+            n += len(data)
+            self._tx[3:n] = data
+        _CHECKSUM.pack_into(self._tx, n, sum(self._tx_view[0:n]))
+        return self._tx_view[0:n + 2]
+
+    def encode_word(self, SD, device_node, obj, value):
+        """As encode, for the common telegram with a single 16 bit value (set voltage, current, power, thresholds)"""
+        CS = SD + device_node + obj + (value >> 8) + (value & 255)
+        _WORD_TELEGRAM.pack_into(self._tx, 0, SD, device_node, obj, value, CS)
+        return self._tx_view[0:7]
+
+    def read(self, ser, n):
+        """Reads up to n bytes from the serial connection into the receive buffer and returns a view of the bytes
+        received. The view is only valid until the next call to read"""
+        view = self._rx_view[0:n]
+        received = 0
+        while received < n:
+            count = ser.readinto(view[received:])
+            if not count:
+                break  # timed out
+            received += count
+        return view[0:received]
+
+    def decode(self, message):
+        """Checks the length and checksum of a received telegram and returns its data as bytes, a copy which stays valid
+        after the next read. Raises EaLengthError, EaChecksumError, or EaDeviceError if the device replied with an error
+        telegram"""
+        n = len(message)
+        if n < 6:
+            raise EaLengthError("Received " + str(n) + " bytes from EA device, shorter than any telegram")
+        if n != (message[0] & 0b00001111) + 6:
+            raise EaLengthError("Received data does not match stated length in EA device telegram")
+        CS_high = message[n - 2]
+        CS_low = message[n - 1]
+        # Sum of the whole telegram less the checksum bytes, without slicing off the data
+        if sum(message) - CS_high - CS_low != (CS_high << 8) | CS_low:
+            raise EaChecksumError("Received checksum does not match transmission in EA device")
+        if message[2] == ERROR_OBJ and message[3] != 0:
+            raise EaDeviceError(message[1], message[3])
+        return bytes(message[3:n - 2])
+
+    def split(self, buffer):
+        """Yields views of the valid telegrams in a buffer holding several replies back-to-back. Bytes which do not
+        start a telegram with a correct checksum are skipped, so a corrupted reply does not hide the ones after it"""
+        buffer = memoryview(buffer)
+        n = len(buffer)
+        start = 0
+        while n - start >= 6:
+            size = (buffer[start] & 0b00001111) + 6
+            if n - start < size:
+                return
+            end = start + size
+            if sum(buffer[start:end - 2]) == _CHECKSUM.unpack_from(buffer, end - 2)[0]:
+                yield buffer[start:end]
+                start = end
+            else:
+                start += 1
+
+    def decode_actual_values(self, data):
+        """Unpacks the data of an object 71 reply from a PSI8000/EL9000 into raw (voltage, current, power)"""
+        return ACTUAL_VALUES.unpack_from(data)
+
+    def decode_status_values(self, data):
+        """Unpacks the data of an object 71 reply from a PS2400B into raw (state0, state1, voltage, current)"""
+        return STATUS_VALUES.unpack_from(data)
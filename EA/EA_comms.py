@@ -2,13 +2,24 @@ import serial
 import array
 import time
 import pdb
+import struct
+
+import numpy as np
+
+from .EA_codec import EaCodec, EaProtocolError
+from .EA_transport import EaTransport
 
 WAITTIME = 2# wait interval between retries
 RESPONSE_WAIT = 0.1 # wait interval between writing and reading to power supply
 CHECK_DELAY = 1 # wait between setting a value and checking it
+FAST_VERIFY_BACKOFF = 0.01 # first wait before re-reading a setpoint that failed fast verification, doubled each time
+# Record layout returned by PSB9000.poll, t is the host time (time.time()) at the middle of the exchange
+TELEMETRY_DTYPE = np.dtype([('t', 'f8'), ('v', 'f8'), ('i', 'f8'), ('p', 'f8')])
 # This is the base class for the PSI8000 and EL9000 EaDevices, and contains
 # common functionality implementing the RS232 communications
 class EaDevice:
+    transport = None  # EaTransport used instead of blocking reads and writes when set by use_transport
+
     def __init__(self):
         self.ser = serial.Serial()
         self.state = {}
@@ -16,6 +27,7 @@ class EaDevice:
         self.volt_nom = 720
         self.curr_nom = 15
         self.p_nom = 3000
+        self.codec = EaCodec()
 
     def connect(self, port_string, brate=57600, parity='O', tout=2):
         """Opens up a serial connection to the device"""
@@ -33,7 +45,16 @@ class EaDevice:
             print('Error occurred while trying to open serial connection.\nError:\n', se)
 
     def disconnect(self):
-        """Closes the serial connection to the device"""
+        """Closes the serial connection to the device. A transport shared with other device objects is left running, and
+        the port left open if it is the transport's, until the last of them disconnects"""
+        if self.transport is not None:
+            transport = self.transport
+            self.transport = None
+            if transport.detach():
+                transport.stop()
+            elif transport.ser is self.ser:
+                print('Serial connection still used by other devices, left open.')
+                return
         try:
             self.ser.close()
             if not self.ser.isOpen():
@@ -43,6 +64,21 @@ class EaDevice:
         except serial.serialutil.SerialException as se:
             print('Error occurred while trying to close serial connection.\nError:\n', se)
 
+    def use_transport(self, transport=None, max_outstanding=8):
+        """Routes all telegrams through a pipelined EaTransport instead of blocking reads with fixed sleeps. If no
+        transport is given one is created on this device's serial connection, which must already be open. A transport
+        can be shared by several device objects on the same port, it is stopped when the last of them disconnects"""
+        if transport is not None and transport is self.transport:
+            return transport
+        if self.transport is not None and self.transport.detach():
+            self.transport.stop()
+        if transport is None:
+            transport = EaTransport(self.ser, max_outstanding=max_outstanding)
+        transport.start()
+        transport.attach()
+        self.transport = transport
+        return transport
+
     def get_dev_info(self):
         """Not Implemented. Queries device to get factory information from it"""
 
@@ -51,6 +87,10 @@ class EaDevice:
         send_byte = (transmission_type << 6) | (broadcast << 5) | (direction << 4) | data_length - 1
         return send_byte
 
+    def make_set_SD(self):
+        """Start delimiter of the set value telegrams (objects 50 and 51) sent by set_v and set_i"""
+        return self.make_SD(2, 1, 0, 3)
+
     def make_message(self, SD, device_node, obj, data=None):
         message = array.array('B', (SD, device_node, obj))  # First part of message
         if data != None:
@@ -60,46 +100,40 @@ class EaDevice:
         return message
 
     def decode_message(self, message):
-        # Check that checksum is correct
-        CS = sum(message[0:-2])
-        if (CS >> 8 != message[-2]) or (CS & 255 != message[-1]):
-            print('WARNING: Received checksum does not match transmission in EA device')
-            return 1
-        SD = message[0]
-        data_length = (SD & 0b00001111) + 1
-        direction = SD & 0b00010000  # direction (1 means from PC to device)
-        broadcast = SD & 0b00100000
-        t_type = (SD & 0b11000000) >> 6  # Transmission type (00 reserved, 1 Query, 2 Query answer, 3 send data)
-        DN = message[1]
-        OBJ = message[2]
-        data = message[3:-2]
-        # Sanity checks
-        if len(data) != data_length:
-            print('WARNING: Received data does not match stated length in EAdevice')
+        """Returns the data bytes of a received telegram, or 1 if it is corrupted"""
+        try:
+            return self.codec.decode(message)
+        except EaProtocolError as e:
+            print('WARNING:', e)
             return 1
-        return data
 
-    def query_output(self):
+    def query_output(self, quiet=False):
+        """Reads the actual voltage, current and power into self.output and prints them unless quiet"""
         SD = self.make_SD(6, 1, 1, 1)
         OBJ = 71
-        out_message = self.make_message(SD, 1, OBJ)
-        self.ser.write(out_message)
-        in_message = self.ser.read(11)
-        data = self.decode_message(in_message)
-        if data == 1:
+        out_message = self.codec.frame(SD, 1, OBJ)
+        if self.transport is not None:
+            data = self.transport.query(out_message)
+        else:
             self.ser.write(out_message)
-            in_message = self.ser.read(11)
+            in_message = self.codec.read(self.ser, 11)
             data = self.decode_message(in_message)
             if data == 1:
-                raise ConnectionError("An error occurred in EAdevice.query_output(), one retry attempted")
-        time.sleep(0.01)
-        if self.ser.inWaiting() > 0:
-            extra = self.ser.read_all()
-            print('WARNING: Unexpected data received. Data:\n', extra)
-        self.output['v'] = self.volt_nom * (data[0] * (16 ** 2) + data[1]) / 25600
-        self.output['i'] = self.curr_nom * (data[2] * (16 ** 2) + data[3]) / 25600
-        self.output['p'] = self.p_nom * (data[4] * (16 ** 2) + data[5]) / 25600
-        print(self.output)
+                self.ser.write(out_message)
+                in_message = self.codec.read(self.ser, 11)
+                data = self.decode_message(in_message)
+                if data == 1:
+                    raise ConnectionError("An error occurred in EAdevice.query_output(), one retry attempted")
+            time.sleep(0.01)
+            if self.ser.inWaiting() > 0:
+                extra = self.ser.read_all()
+                print('WARNING: Unexpected data received. Data:\n', extra)
+        v, i, p = self.codec.decode_actual_values(data)
+        self.output['v'] = self.volt_nom * v / 25600
+        self.output['i'] = self.curr_nom * i / 25600
+        self.output['p'] = self.p_nom * p / 25600
+        if not quiet:
+            print(self.output)
 
     def set_remote(self, remote):
         SD = self.make_SD(2, 1, 1, 3)
@@ -108,7 +142,10 @@ class EaDevice:
             data = (0x10, 0x10)  # Mask:0x10, remote on:1
         elif remote == 0:
             data = (0x10, 0)  # Mask:0x10, remote off:0
-        out_message = self.make_message(SD, 1, OBJ, data)
+        out_message = self.codec.encode(SD, 1, OBJ, data)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -122,7 +159,10 @@ class EaDevice:
             data = (0x01, 1)  # Mask, output
         elif output == 0:
             data = (0x01, 0)  # Mask, output
-        out_message = self.make_message(SD, 1, OBJ, data)
+        out_message = self.codec.encode(SD, 1, OBJ, data)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -133,11 +173,13 @@ class EaDevice:
         if voltage > self.volt_nom:
             print('WARNING: Requested voltage is greater than device maximum. Ignoring request.')
             return
-        SD = self.make_SD(2, 1, 0, 3)
+        SD = self.make_set_SD()
         OBJ = 50
         v = int(25600 * voltage / self.volt_nom)
-        data = (v >> 8, v & 0b0000000011111111)
-        out_message = self.make_message(SD, 1, OBJ, data)
+        out_message = self.codec.encode_word(SD, 1, OBJ, v)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -149,11 +191,13 @@ class EaDevice:
         if current > self.curr_nom:
             print('WARNING: Requested current is greater than device maximum.')  # Ignoring request.')
             # return
-        SD = self.make_SD(2, 1, 0, 3)
+        SD = self.make_set_SD()
         OBJ = 51
         i = int(25600 * current / self.curr_nom)
-        data = (i >> 8, i & 0b11111111)
-        out_message = self.make_message(SD, 1, OBJ, data)
+        out_message = self.codec.encode_word(SD, 1, OBJ, i)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -167,8 +211,10 @@ class EaDevice:
         SD = self.make_SD(2, 1, 0, 3)
         OBJ = 52
         p = int(25600 * power / self.p_nom)
-        data = (p >> 8, p & 0b0000000011111111)
-        out_message = self.make_message(SD, 1, OBJ, data)
+        out_message = self.codec.encode_word(SD, 1, OBJ, p)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -186,8 +232,10 @@ class EaDevice:
         else:
             raise ValueError("Not a valid channel")
         OVP_thre = int(25600 * OVC / self.volt_nom)
-        data = (OVP_thre >> 8, OVP_thre & 0b0000000011111111)
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode_word(SD, DN, OBJ, OVP_thre)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -206,8 +254,10 @@ class EaDevice:
         else:
             raise ValueError("Not a valid channel")
         OVC_thre = int(25600 * OVC / self.set_i(1, channel))
-        data = (OVC_thre >> 8, OVC_thre & 0b0000000011111111)
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode_word(SD, DN, OBJ, OVC_thre)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -225,25 +275,29 @@ class PSI8000(EaDevice):
         self.volt_nom = 720
         self.curr_nom = 15
         self.p_nom = 3000
+        self.codec = EaCodec()
 
     def query_state(self):
         SD = self.make_SD(2, 1, 1, 1)
         DN = 0  # device node
         OBJ = 70  # Status object
-        out_message = self.make_message(SD, DN, OBJ)
-        self.ser.write(out_message)
-        in_message = self.ser.read(7)
-        data = self.decode_message(in_message)
-        if data == 1:
+        out_message = self.codec.frame(SD, DN, OBJ)
+        if self.transport is not None:
+            data = self.transport.query(out_message)
+        else:
             self.ser.write(out_message)
-            in_message = self.ser.read(7)
+            in_message = self.codec.read(self.ser, 7)
             data = self.decode_message(in_message)
             if data == 1:
-                raise ConnectionError("an error occured in EL9000.query_state(), 1 retry attempted")
-        time.sleep(0.01)
-        if self.ser.inWaiting() > 0:
-            extra = self.ser.read_all()
-            print('WARNING: Unexpected data received. Data:\n', extra)
+                self.ser.write(out_message)
+                in_message = self.codec.read(self.ser, 7)
+                data = self.decode_message(in_message)
+                if data == 1:
+                    raise ConnectionError("an error occured in EL9000.query_state(), 1 retry attempted")
+            time.sleep(0.01)
+            if self.ser.inWaiting() > 0:
+                extra = self.ser.read_all()
+                print('WARNING: Unexpected data received. Data:\n', extra)
         self.state['remote'] = data[0] & 0b00000011  # 1 if device is in remote control mode
         self.state['analogue_control'] = data[0] & 32  # controlled by analogue interface?
         self.state['func_man_active'] = data[0] & 64  # function manager
@@ -268,20 +322,23 @@ class EL9000(EaDevice):
         SD = self.make_SD(2, 1, 1, 1)
         DN = 0  # device node
         OBJ = 70  # Status object
-        out_message = self.make_message(SD, DN, OBJ)
-        self.ser.write(out_message)
-        in_message = self.ser.read(7)
-        data = self.decode_message(in_message)
-        if data == 1:
+        out_message = self.codec.frame(SD, DN, OBJ)
+        if self.transport is not None:
+            data = self.transport.query(out_message)
+        else:
             self.ser.write(out_message)
-            in_message = self.ser.read(7)
+            in_message = self.codec.read(self.ser, 7)
             data = self.decode_message(in_message)
             if data == 1:
-                raise ConnectionError("an error occured in EL9000.query_state(), 1 retry attempted")
-        time.sleep(0.01)
-        if self.ser.inWaiting() > 0:
-            extra = self.ser.read_all()
-            print('WARNING: Unexpected data received. Data:\n', extra)
+                self.ser.write(out_message)
+                in_message = self.codec.read(self.ser, 7)
+                data = self.decode_message(in_message)
+                if data == 1:
+                    raise ConnectionError("an error occured in EL9000.query_state(), 1 retry attempted")
+            time.sleep(0.01)
+            if self.ser.inWaiting() > 0:
+                extra = self.ser.read_all()
+                print('WARNING: Unexpected data received. Data:\n', extra)
         self.state['remote'] = data[0] & 0b00000011  # 1 if device is in remote control mode
         self.state['input_on'] = data[1] & 0b00000001
         controller_states = {0: 'CV',
@@ -324,13 +381,36 @@ class EL9000(EaDevice):
 # This class is for the PSB9000 bidirectional DC supply/load, using SCPI comms. It also works for the PSI9750-06DT
 # On the PSI9750-06DT it was found necessary to increase the timeout to 500ms in the power supply communications menu
 class PSB9000():
-    def __init__(self, V_nom =750,I_nom=60):
+    # SCPI commands for the arbitrary function generator, from the EA programming guide. Sequence points are numbered
+    # from 1 and take AC start, AC end, frequency start, frequency end, start angle, DC start, DC end and time in us
+    ARB_SELECT = 'FUNC:GEN:SEL ARB'
+    ARB_LEVEL = 'FUNC:GEN:WAVE:LEV:SEL {quantity}'
+    ARB_POINT = 'FUNC:ARB:SEQ{index}:DATA 0,0,0,0,0,{dc_start},{dc_end},{time_us}'
+    ARB_RANGE = 'FUNC:ARB:STAR 1;:FUNC:ARB:END {last}'
+    ARB_REPEAT = 'FUNC:ARB:REP {cycles}'
+    ARB_SUBMIT = 'FUNC:ARB:SUBM'
+    ARB_RUN = 'FUNC:GEN:STAT RUN'
+    ARB_STOP = 'FUNC:GEN:STAT STOP'
+    ARB_STATE = 'FUNC:GEN:STAT?'
+    ARB_MAX_POINTS = 99  # sequence points in the generator table
+    ARB_MIN_STEP = 1e-4  # shortest sequence point, seconds
+
+    def __init__(self, V_nom =750,I_nom=60, fast_verify=False):
+        """
+        fast_verify - bool  if True set_v, set_i and output_on send the setting and its read back in one message
+                            terminated by *OPC? instead of waiting CHECK_DELAY before checking, see _verified_set
+        """
         self.ser = serial.Serial()
         self.state = {}
         self.output = {'v': 0, 'i': 0, 'p': 0}
         self.volt_nom = V_nom
         self.curr_nom = I_nom
         self.p_nom = 15000
+        self.fast_verify = fast_verify
+        self.profile = None
+        self.profile_cycles = 1
+        self.profile_interpolate = False
+        self._profile_start = None
 
     def connect(self, port_string, brate=57600, parity='O', tout=2):
         """Opens up a serial connection to the device"""
@@ -374,6 +454,9 @@ class PSB9000():
         volt - int  Output voltage setpoint
         RETRIES - int   Optional arguement specifying the number of retries before raising an erro
         """
+        if self.fast_verify:
+            return self._verified_set('SOUR:VOLT ' + str(volt) + 'V', 'SOUR:VOLT?',
+                                      lambda resp: abs(float(resp.split('V')[0]) - volt) < 0.1, 'voltage', RETRIES)
         retry_counter = 0
         while retry_counter < RETRIES:
             self.ser.write(bytes('SOUR:VOLT ' + str(volt) + 'V\n', 'ascii'))
@@ -398,6 +481,15 @@ class PSB9000():
         output - int    1 or 0, where 0 turns the PS off and 1 turns the PS on)
         RETRIES - int   Optional arguement specifying the number of retries before raising an erro
         """
+        if self.fast_verify:
+            if direction == "SINK":
+                command, query = 'SINK:CURR ' + str(current), 'SINK:CURR?'
+            elif direction == "SOURCE":
+                command, query = 'SOUR:CURR ' + str(current), 'SOURCE:CURRENT?'
+            else:
+                raise ValueError("direction must be SINK or SOURCE")
+            return self._verified_set(command, query, lambda resp: abs(float(resp.split('A')[0]) - current) < 0.1,
+                                      direction.lower() + ' current', RETRIES)
         retry_counter = 0
         while retry_counter < RETRIES:
             if direction == "SINK":
@@ -447,6 +539,40 @@ class PSB9000():
         self.output['p'] = p
         return self.output
 
+    def query_output_array(self, command='MEAS:ARR?'):
+        """
+        As query_output but reads voltage, current and power in one exchange so they come from the same instant and
+        take one round trip instead of three. The reply is of the form '12.00 V, 1.00 A, 12.00 W'.
+        command - str   'MEAS:ARR?' or, for firmware without it, ':MEAS:VOLT?;:MEAS:CURR?;:MEAS:POW?'
+        """
+        self.ser.write(bytes(command + '\n', 'ascii'))
+        resp = self.ser.readline().decode('utf-8')
+        try:
+            v, i, p = [float(field.split()[0]) for field in resp.replace(';', ',').split(',')]
+        except (ValueError, IndexError):
+            raise ConnectionError("Unexpected reply to " + command + ": " + resp)
+        self.output['v'] = v
+        self.output['i'] = i
+        self.output['p'] = p
+        return self.output
+
+    def poll(self, n, period=0, command='MEAS:ARR?'):
+        """
+        Reads the output n times, once every period seconds (as fast as possible if 0), and returns a NumPy structured
+        array with fields t, v, i, p (see TELEMETRY_DTYPE) where t is the host time of each reading
+        """
+        readings = np.zeros(n, dtype=TELEMETRY_DTYPE)
+        next_poll = time.monotonic()
+        for k in range(n):
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            t_sent = time.time()
+            output = self.query_output_array(command)
+            readings[k] = ((t_sent + time.time()) / 2, output['v'], output['i'], output['p'])
+            next_poll += period
+        return readings
+
     def output_on(self, output: int, RETRIES:int =2):
         """
         Turns on or off the output of the power supply and checks that this has taken affect will retry a set number of
@@ -454,6 +580,10 @@ class PSB9000():
         output - int    1 or 0, where 0 turns the PS off and 1 turns the PS on)
         RETRIES - int   Optional arguement specifying the number of retries before raising an erro
         """
+        if self.fast_verify:
+            expected = "ON" if output == 1 else "OFF"
+            return self._verified_set('OUTP ' + expected, 'OUTPUT?', lambda resp: resp.strip() == expected, 'output',
+                                      RETRIES)
         retry_counter = 0
         while retry_counter < RETRIES:
             if output == 1:
@@ -473,11 +603,138 @@ class PSB9000():
             retry_counter += 1
         raise ConnectionError("After "+str(RETRIES) + " retries the output of the PS could not be set")
 
+    def _verified_set(self, command, query, check, name, RETRIES):
+        """
+        Sends a setting and its read back in one compound message terminated by *OPC?, so the reply arrives as soon as
+        the device has applied the setting rather than after a fixed CHECK_DELAY. Only if the read back does not pass
+        check(resp) is the query repeated, with a backoff starting at FAST_VERIFY_BACKOFF, for up to CHECK_DELAY
+        before the setting is resent. Raises ConnectionError after RETRIES attempts, as the slow path does
+        """
+        retry_counter = 0
+        while retry_counter < RETRIES:
+            # ';:' so the query is not taken relative to the path of the setting, e.g. SOUR:SOUR:VOLT?
+            self.ser.write(bytes(command + ';:' + query + ';*OPC?\n', 'ascii'))
+            resp = self._read_compound()
+            deadline = time.monotonic() + CHECK_DELAY
+            delay = FAST_VERIFY_BACKOFF
+            while True:
+                try:
+                    if resp != '' and check(resp):
+                        return 0
+                except ValueError:
+                    pass  # garbled read back, treat as not yet verified
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(delay, remaining))
+                delay *= 2
+                self.ser.write(bytes(query + '\n', 'ascii'))
+                resp = self.ser.readline().decode('utf-8')
+            print("Failed to set " + name + ", retrying. Response:", resp)
+            retry_counter += 1
+        raise ConnectionError("After " + str(RETRIES) + " retries the " + name + " of the PS could not be set")
+
+    def _read_compound(self):
+        """Reads the reply to '<setting>;:<query>;*OPC?' and returns the query part. Depending on firmware the *OPC?
+        result arrives on the same line separated by ';' or on the following line"""
+        resp = self.ser.readline().decode('utf-8')
+        parts = resp.rstrip('\n').split(';')
+        if len(parts) < 2 and resp != '':
+            self.ser.readline()
+        return parts[0]
+
+    def upload_profile(self, profile, quantity='VOLT', interpolate=False, cycles=1):
+        """
+        Uploads a setpoint profile to the arbitrary function generator so it is timed by the supply itself rather
+        than by per-step serial commands. Start it with start_profile.
+        profile - array like of shape (N, 2), rows of (time in s from the start, setpoint). The setpoint of row k is
+                  applied from its time until the time of row k+1, so the last row only marks the end of the profile
+        quantity - str  'VOLT' or 'CURR', the setpoint the profile is applied to
+        interpolate - bool  if True ramp linearly between rows instead of stepping
+        cycles - int    number of times to run the profile, 0 repeats until stop_profile is called
+        """
+        profile = np.asarray(profile, dtype=float)
+        if profile.ndim != 2 or profile.shape[1] != 2 or len(profile) < 2:
+            raise ValueError("profile must have shape (N, 2) with N >= 2")
+        if quantity == 'VOLT':
+            limit = self.volt_nom
+        elif quantity == 'CURR':
+            limit = self.curr_nom
+        else:
+            raise ValueError("quantity must be 'VOLT' or 'CURR'")
+        times, values = profile[:, 0], profile[:, 1]
+        durations = np.diff(times)
+        if len(durations) > self.ARB_MAX_POINTS:
+            raise ValueError("profile has " + str(len(durations)) + " steps, the generator holds at most " +
+                             str(self.ARB_MAX_POINTS))
+        if np.any(durations < self.ARB_MIN_STEP):
+            raise ValueError("profile times must increase by at least " + str(self.ARB_MIN_STEP) + " s per row")
+        if np.any(np.abs(values) > limit):
+            raise ValueError("profile setpoints exceed the nominal value of " + str(limit))
+        ends = values[1:] if interpolate else values[:-1]
+
+        commands = [self.ARB_SELECT, self.ARB_LEVEL.format(quantity=quantity)]
+        for k in range(len(durations)):
+            commands.append(self.ARB_POINT.format(index=k + 1, dc_start=values[k], dc_end=ends[k],
+                                                  time_us=int(round(durations[k] * 1e6))))
+        commands.append(self.ARB_RANGE.format(last=len(durations)))
+        commands.append(self.ARB_REPEAT.format(cycles=cycles))
+        commands.append(self.ARB_SUBMIT)
+        for command in commands:
+            self.ser.write(bytes(command + '\n', 'ascii'))
+        self.ser.write(bytes('*OPC?\n', 'ascii'))
+        resp = self.ser.readline().decode('utf-8')
+        if resp.strip() != '1':
+            raise ConnectionError("Function generator upload was not confirmed. Response: " + resp)
+        self.profile = profile
+        self.profile_cycles = cycles
+        self.profile_interpolate = interpolate
+        self._profile_start = None
+
+    def start_profile(self):
+        """Starts the uploaded profile. The output must be switched on with output_on for it to take effect"""
+        if self.profile is None:
+            raise ValueError("No profile uploaded, call upload_profile first")
+        self.ser.write(bytes(self.ARB_RUN + '\n', 'ascii'))
+        self._profile_start = time.monotonic()
+
+    def stop_profile(self):
+        self.ser.write(bytes(self.ARB_STOP + '\n', 'ascii'))
+        self._profile_start = None
+
+    def query_profile_progress(self):
+        """
+        Returns a dict describing how far through the profile the supply is: 'running' as reported by the device, and
+        from the host clock since start_profile 'elapsed' (s), 'cycle' (from 0), 'step' (row of the profile being
+        applied) and 'setpoint' (the value the generator should be at)
+        """
+        self.ser.write(bytes(self.ARB_STATE + '\n', 'ascii'))
+        running = self.ser.readline().decode('utf-8').strip().upper().startswith('RUN')
+        progress = {'running': running, 'elapsed': 0.0, 'cycle': 0, 'step': 0, 'setpoint': None}
+        if self.profile is None or self._profile_start is None:
+            return progress
+        times, values = self.profile[:, 0], self.profile[:, 1]
+        length = times[-1] - times[0]
+        elapsed = time.monotonic() - self._profile_start
+        cycle = int(elapsed // length)
+        if self.profile_cycles and cycle >= self.profile_cycles:
+            cycle, position = self.profile_cycles - 1, length
+        else:
+            position = elapsed - cycle * length
+        step = min(int(np.searchsorted(times - times[0], position, side='right')) - 1, len(times) - 2)
+        if self.profile_interpolate:
+            setpoint = float(np.interp(position, times - times[0], values))
+        else:
+            setpoint = float(values[step])
+        progress.update(elapsed=elapsed, cycle=cycle, step=step, setpoint=setpoint)
+        return progress
+
     def read_alarm(self):
         # Read status subregister condition byte
         self.ser.write(bytes('STAT:QUES?\n', 'ascii'))
         err = self.ser.readline().decode('utf-8')
         err = int(err)
+        err_mess = ''
         if err == 0:
             print('No alarm detected')
         else:
@@ -532,21 +789,24 @@ class PS2400B(EaDevice):
         SD = self.make_SD(2, 1, 1, 1)
         DN = 1  # device node is not necessarily 0. Needs to be set externally
         OBJ = 71  # Actual Values and Device State Object
-        out_message = self.make_message(SD, DN, OBJ)
-        self.ser.write(out_message)
-        in_message = self.ser.read(11)
-        data = self.decode_message(in_message)  # The order is >>Remote
-        if data == 1:
+        out_message = self.codec.frame(SD, DN, OBJ)
+        if self.transport is not None:
+            data = self.transport.query(out_message)
+        else:
             self.ser.write(out_message)
-            in_message = self.ser.read(11)
-            data = self.decode_message(in_message)
+            in_message = self.codec.read(self.ser, 11)
+            data = self.decode_message(in_message)  # The order is >>Remote
             if data == 1:
-                raise ConnectionError("an error occured in EL9000.query_state_ps(), 1 retry attempted")
-        time.sleep(0.01)
-        if self.ser.inWaiting() > 0:
-            extra = self.ser.read_all()
-            # print('WARNING: Unexpected data received. Data:\n',extra)
-            # print ("Query state (PS) message: ", extra)
+                self.ser.write(out_message)
+                in_message = self.codec.read(self.ser, 11)
+                data = self.decode_message(in_message)
+                if data == 1:
+                    raise ConnectionError("an error occured in EL9000.query_state_ps(), 1 retry attempted")
+            time.sleep(0.01)
+            if self.ser.inWaiting() > 0:
+                extra = self.ser.read_all()
+                # print('WARNING: Unexpected data received. Data:\n',extra)
+                # print ("Query state (PS) message: ", extra)
         # build byte 0 which checks whether the device is in remote mode
         self.state['remote'] = data[0] & 0b00000011  # 1 if device is in remote control mode (this is in byte 0)
         # build byte 1 which checks whether the device is on, in which controller state, whether it's tracking, and whether protections for overcurrent, overvoltage, overpower etc are on
@@ -562,6 +822,9 @@ class PS2400B(EaDevice):
 
         print(self.state)
 
+    def make_set_SD(self):
+        return self.make_SD(2, 1, 1, 3)
+
     def set_remote(self, remote, channel):
         SD = self.make_SD(2, 1, 1, 3)
         OBJ = 54
@@ -579,7 +842,10 @@ class PS2400B(EaDevice):
             data = (0x10, 0x10)  # Mask:0x10, remote on:1
         elif remote == 0:
             data = (0x10, 0)  # Mask:0x10, remote off:0
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode(SD, DN, OBJ, data)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)  # This pyserial method writes to the output
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -589,7 +855,7 @@ class PS2400B(EaDevice):
         if voltage >= self.volt_nom:
             print('WARNING: Requested voltage is greater than device maximum. Ignoring request.')
             return
-        SD = self.make_SD(2, 1, 1, 3)
+        SD = self.make_set_SD()
         OBJ = 50
         if channel == 1:
             DN = 0
@@ -598,8 +864,10 @@ class PS2400B(EaDevice):
         else:
             raise ValueError("Not a valid channel")
         v = int(25600 * voltage / self.volt_nom)
-        data = (v >> 8, v & 0b0000000011111111)
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode_word(SD, DN, OBJ, v)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return v
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -613,7 +881,7 @@ class PS2400B(EaDevice):
             print('WARNING: Requested current is greater than device maximum. Ignoring request.')
             print("Nominal current: "+str(self.curr_nom))
             return
-        SD = self.make_SD(2, 1, 1, 3)
+        SD = self.make_set_SD()
         OBJ = 51
         if channel == 1:
             DN = 0
@@ -624,8 +892,10 @@ class PS2400B(EaDevice):
 
 
         i = int(25600 * current / self.curr_nom)
-        data = (i >> 8, i & 0b11111111)
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode_word(SD, DN, OBJ, i)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return i
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -647,7 +917,10 @@ class PS2400B(EaDevice):
             data = (0x01, 0x01)  # Mask, output
         elif output == 0:
             data = (0x01, 0)  # Mask, output
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode(SD, DN, OBJ, data)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -672,7 +945,10 @@ class PS2400B(EaDevice):
             data = (0x10, 0x10)  # Mask:0x10, remote on:1
         elif remote == 0:
             data = (0x10, 0)  # Mask:0x10, remote off:0
-        out_message = self.make_message(SD, DN, OBJ, data)
+        out_message = self.codec.encode(SD, DN, OBJ, data)
+        if self.transport is not None:
+            self.transport.send(out_message)
+            return
         self.ser.write(out_message)  # This pyserial method writes to the output
         time.sleep(0.01)
         if self.ser.inWaiting() > 0:
@@ -691,50 +967,103 @@ class PS2400B(EaDevice):
             # A conditional statement is needed in this area to account for the fact that the device node may
         #  be 1 for the power supply
 
-        out_message = self.make_message(SD, DN, OBJ)
-        self.ser.write(out_message)
-        in_message = self.ser.read(11)
-        data = self.decode_message(in_message)
-
-        if data == 1:
-            print("Expected data length:", (SD & 0b00001111) + 1)
-            print("in_message: ", in_message)
+        out_message = self.codec.frame(SD, DN, OBJ)
+        if self.transport is not None:
+            data = self.transport.query(out_message, retries=2)
+        else:
             self.ser.write(out_message)
-            in_message = self.ser.read(11)
+            in_message = self.codec.read(self.ser, 11)
             data = self.decode_message(in_message)
+
             if data == 1:
-                time.sleep(0.1)
                 print("Expected data length:", (SD & 0b00001111) + 1)
                 print("in_message: ", in_message)
                 self.ser.write(out_message)
-                in_message = self.ser.read(11)
+                in_message = self.codec.read(self.ser, 11)
                 data = self.decode_message(in_message)
                 if data == 1:
-                    raise ConnectionError(
-                        "Receiving an int from the power supply, 2 reattempt made in PS2400B.query_output")
-        if type(data) is bytes:
-            if len(data) < 2:
-                print("Expected data length:", (SD & 0b00001111) + 1)
-                print("in_message: ", in_message)
-                self.ser.write(out_message)
-                in_message = self.ser.read(11)
-                data = self.decode_message(in_message)
+                    time.sleep(0.1)
+                    print("Expected data length:", (SD & 0b00001111) + 1)
+                    print("in_message: ", in_message)
+                    self.ser.write(out_message)
+                    in_message = self.codec.read(self.ser, 11)
+                    data = self.decode_message(in_message)
+                    if data == 1:
+                        raise ConnectionError(
+                            "Receiving an int from the power supply, 2 reattempt made in PS2400B.query_output")
+            if data != 1:
                 if len(data) < 2:
-                    raise ConnectionError("Receiving less than two bytes frm from the power supply, 1 reattempt made")
+                    print("Expected data length:", (SD & 0b00001111) + 1)
+                    print("in_message: ", in_message)
+                    self.ser.write(out_message)
+                    in_message = self.codec.read(self.ser, 11)
+                    data = self.decode_message(in_message)
+                    if len(data) < 2:
+                        raise ConnectionError("Receiving less than two bytes frm from the power supply, 1 reattempt made")
 
-        time.sleep(0.01)
-        if self.ser.inWaiting() > 0:
-            extra = self.ser.read_all()
-        #    print('WARNING: Unexpected data received. Data:\n',extra)
-        #    print ("Query output (PS) message: ", extra)
+            time.sleep(0.01)
+            if self.ser.inWaiting() > 0:
+                extra = self.ser.read_all()
+            #    print('WARNING: Unexpected data received. Data:\n',extra)
+            #    print ("Query output (PS) message: ", extra)
         try:
-            self.output['V_ps'] = self.volt_nom * (data[2] * (16 ** 2)) / 25600
-            self.output['I_ps'] = self.curr_nom * (data[4] * (16 ** 2)) / 25600
-        except IndexError as e:
+            status = self.decode_status(data)
+        except struct.error as e:
             print("data: ", data)
             print("datatype:", type(data))
             raise e
-        self.output['V_ps'] = self.volt_nom * (data[2] * (16 ** 2)) / 25600
-        self.output['I_ps'] = self.curr_nom * (data[4] * (16 ** 2)) / 25600
+        self.output['V_ps'] = status['V_ps']
+        self.output['I_ps'] = status['I_ps']
 
         return self.output
+
+    def decode_status(self, data):
+        """Converts the data of an object 71 reply into {'V_ps', 'I_ps', 'remote', 'output_on', 'controller_state'}.
+        The actual values use the full 16 bit words, a resolution of 1/25600 of the nominal value"""
+        controller_states = {0: 'CV',
+                             2: 'CC'}
+        state0, state1, v, i = self.codec.decode_status_values(data)
+        return {'V_ps': self.volt_nom * v / 25600,
+                'I_ps': self.curr_nom * i / 25600,
+                'remote': state0 & 0b00000011,
+                'output_on': state1 & 0b00000001,
+                'controller_state': controller_states.get((state1 & 0b00000110) >> 1)}
+
+    def query_all(self, retries=2):
+        """
+        Reads the actual values and state of both outputs in one go. The query telegrams for both device nodes are sent
+        back-to-back and both replies are collected in one read window, rather than one round-trip and settle time per
+        channel. If a reply is missing or corrupt only that node is queried again, up to 'retries' times.
+        Returns {channel: {'V_ps', 'I_ps', 'remote', 'output_on', 'controller_state'}} for channels 1 and 2
+        """
+        SD = self.make_SD(6, 1, 1, 1)
+        OBJ = 71
+        messages = {DN: self.codec.frame(SD, DN, OBJ) for DN in (0, 1)}
+        replies = {}
+        attempt = 0
+        while True:
+            missing = [DN for DN in messages if DN not in replies]
+            if self.transport is not None:
+                requests = [self.transport.request(messages[DN]) for DN in missing]
+                for request in requests:
+                    try:
+                        replies[request.key[0]] = request.result(self.transport.timeout)
+                    except TimeoutError:
+                        self.transport.cancel(request)
+            else:
+                self.ser.write(b''.join(messages[DN] for DN in missing))
+                in_message = self.ser.read(11 * len(missing))
+                for telegram in self.codec.split(in_message):
+                    if telegram[1] in missing and telegram[2] == OBJ and len(telegram) == 11:
+                        replies[telegram[1]] = bytes(telegram[3:-2])
+            missing = [DN for DN in messages if DN not in replies]
+            if not missing:
+                break
+            attempt += 1
+            if attempt > retries:
+                raise ConnectionError("No valid reply from PS2400B device node(s) " + str(missing) + ", " +
+                                      str(retries) + " reattempts made in PS2400B.query_all")
+            if self.transport is None and self.ser.inWaiting() > 0:
+                self.ser.read_all()  # drop the rest of a late or corrupted reply before resending
+
+        return {DN + 1: self.decode_status(replies[DN]) for DN in sorted(replies)}
@@ -0,0 +1,280 @@
+"""Setpoint path for software control loops running at tens of Hz. The setters in EA_comms sleep and drain the port
+after every telegram (EaDevice) or wait over a second to read the setting back (PSB9000), which sets the loop rate.
+SetpointChannel writes a setpoint and returns without waiting. A background checker reads the settings back now and
+then and resends any the device has not taken. ControlLoop calls a step function at a fixed period on its own thread
+and keeps jitter and overrun statistics.
+
+    channel = SetpointChannel(ps)
+    def step(t):
+        v, i, p = channel.read_output()
+        channel.set_i(controller(i))
+    with channel, ControlLoop(step, 0.02) as loop:
+        time.sleep(60)
+        print(loop.stats())
+"""
+
+import math
+import threading
+import time
+
+from .EA_codec import EaCodec
+from .EA_comms import PSB9000, PS2400B
+
+
+class SetpointChannel:
+    def __init__(self, device, channel=None, direction='SOURCE', check_period=0.5, tolerance=0.1):
+        """
+        device - connected PSI8000, EL9000, PS2400B or PSB9000. EaDevice based devices are switched to an EaTransport
+                 if they do not use one already, so the checker and the control loop can share the port
+        channel - int   output channel, required for PS2400B
+        direction - str 'SOURCE' or 'SINK', the current setpoint written by set_i on a PSB9000
+        check_period - float    seconds between read backs of the settings by the checker
+        tolerance - float   volts or amps a PSB9000 read back may differ from the setting. EA telegram settings are
+                            compared as raw words
+        """
+        self.device = device
+        self.direction = direction
+        self.check_period = check_period
+        self.tolerance = tolerance
+        self.stats = {'writes': 0, 'checks': 0, 'mismatches': 0, 'resends': 0, 'errors': 0, 'last_error': None}
+        self.lock = threading.Lock()  # held for every exchange on a PSB9000 port
+        self._commanded = {}  # 'v' or 'i': (value, telegram or command, write count when sent)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.scpi = isinstance(device, PSB9000)
+        if self.scpi:
+            if direction not in ('SOURCE', 'SINK'):
+                raise ValueError("direction must be SINK or SOURCE")
+            return
+        if isinstance(device, PS2400B):
+            if channel not in (1, 2):
+                raise ValueError("Not a valid channel")
+            self.device_node = channel - 1
+        else:
+            self.device_node = 1
+        if device.transport is None:
+            device.use_transport()
+        # Own codec, the device's one is not thread safe. Queries are built now so the checker only reads the cache.
+        # The data length of a query's SD is that of the reply: 2 bytes for a set value, 6 for the actual values
+        self.codec = EaCodec()
+        self._SD_set = device.make_set_SD()
+        SD_readback = device.make_SD(2, 1, 0, 1)
+        self._readback = {'v': self.codec.frame(SD_readback, self.device_node, 50),
+                          'i': self.codec.frame(SD_readback, self.device_node, 51)}
+        self._actual = self.codec.frame(device.make_SD(6, 1, 1, 1), self.device_node, 71)
+
+    def set_v(self, voltage):
+        """Writes the voltage setpoint and returns straight away"""
+        self._set('v', voltage, self.device.volt_nom, 50, 'SOUR:VOLT ' + str(voltage) + 'V')
+
+    def set_i(self, current):
+        """Writes the current setpoint (source or sink on a PSB9000, see direction) and returns straight away"""
+        prefix = 'SOUR:CURR ' if self.direction == 'SOURCE' else 'SINK:CURR '
+        self._set('i', current, self.device.curr_nom, 51, prefix + str(current))
+
+    def _set(self, quantity, value, nominal, obj, command):
+        if value > nominal:
+            raise ValueError("Requested value " + str(value) + " is greater than device maximum " + str(nominal))
+        if self.scpi:
+            message = bytes(command + '\n', 'ascii')
+            with self.lock:
+                self.device.ser.write(message)
+        else:
+            message = bytes(self.codec.encode_word(self._SD_set, self.device_node, obj, int(25600 * value / nominal)))
+            self.device.transport.send(message)
+        self.stats['writes'] += 1
+        self._commanded[quantity] = (value, message, self.stats['writes'])
+
+    def read_output(self):
+        """Reads the actual values, returning (v, i, p). Use this rather than the device's own query while the checker
+        is running"""
+        device = self.device
+        if self.scpi:
+            with self.lock:
+                output = device.query_output_array()
+            return output['v'], output['i'], output['p']
+        data = device.transport.query(self._actual)
+        if isinstance(device, PS2400B):
+            state0, state1, v, i = self.codec.decode_status_values(data)
+            v = device.volt_nom * v / 25600
+            i = device.curr_nom * i / 25600
+            return v, i, v * i
+        v, i, p = self.codec.decode_actual_values(data)
+        return device.volt_nom * v / 25600, device.curr_nom * i / 25600, device.p_nom * p / 25600
+
+    def start(self):
+        """Starts the background checker"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._check_loop, name='SetpointChannel', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self):
+        """Reads back every setting written so far and resends those the device does not hold. Returns the number of
+        mismatches found"""
+        mismatches = 0
+        for quantity in ('v', 'i'):
+            commanded = self._commanded.get(quantity)
+            if commanded is None:
+                continue
+            value, message, count = commanded
+            try:
+                ok = self._read_back(quantity, value, message)
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = e
+                continue
+            self.stats['checks'] += 1
+            if ok or self._commanded[quantity][2] != count:
+                continue  # held, or a newer setting was written while reading back
+            mismatches += 1
+            self.stats['mismatches'] += 1
+            print('WARNING: ' + quantity + ' setpoint ' + str(value) + ' not held by device, resending')
+            if self.scpi:
+                with self.lock:
+                    self.device.ser.write(message)
+            else:
+                self.device.transport.send(message)
+            self.stats['resends'] += 1
+        return mismatches
+
+    def _read_back(self, quantity, value, message):
+        if self.scpi:
+            if quantity == 'v':
+                query, unit = 'SOUR:VOLT?', 'V'
+            else:
+                query, unit = ('SOURCE:CURRENT?' if self.direction == 'SOURCE' else 'SINK:CURR?'), 'A'
+            with self.lock:
+                self.device.ser.write(bytes(query + '\n', 'ascii'))
+                resp = self.device.ser.readline().decode('utf-8')
+            return resp != '' and abs(float(resp.split(unit)[0]) - value) < self.tolerance
+        data = self.device.transport.query(self._readback[quantity])
+        return data[0:2] == message[3:5]
+
+    def _check_loop(self):
+        while not self._stop_event.wait(self.check_period):
+            self.check()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class ControlLoop:
+    def __init__(self, step, period, spin=0.0005, name='ControlLoop'):
+        """
+        step - function called once per period with the scheduled time of the iteration (time.monotonic seconds)
+        period - float  seconds
+        spin - float    the last 'spin' seconds before each iteration are busy-waited rather than slept, trading CPU
+                        for less jitter. 0 to always sleep
+        """
+        self.step = step
+        self.period = period
+        self.spin = spin
+        self.name = name
+        self.error = None  # exception raised by step, which stops the loop
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.error = None
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def reset_stats(self):
+        with self._lock:
+            self._iterations = 0
+            self._overruns = 0
+            self._missed = 0
+            self._jitter_mean = 0.0
+            self._jitter_m2 = 0.0
+            self._jitter_max = 0.0
+            self._duration_mean = 0.0
+            self._duration_max = 0.0
+
+    def stats(self):
+        """
+        Returns a dict of
+        iterations - calls of step so far
+        overruns - iterations which finished after the next one was due
+        missed - iterations skipped because of overruns
+        jitter_mean, jitter_std, jitter_max - seconds between the scheduled and the actual start of an iteration
+        duration_mean, duration_max - seconds spent in step
+        """
+        with self._lock:
+            n = self._iterations
+            return {'iterations': n, 'overruns': self._overruns, 'missed': self._missed,
+                    'jitter_mean': self._jitter_mean, 'jitter_std': math.sqrt(self._jitter_m2 / n) if n else 0.0,
+                    'jitter_max': self._jitter_max, 'duration_mean': self._duration_mean,
+                    'duration_max': self._duration_max}
+
+    def _run(self):
+        due = time.monotonic()
+        while True:
+            delay = due - time.monotonic() - self.spin
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+            if self._stop_event.is_set():
+                return
+            while time.monotonic() < due:
+                pass
+            start = time.monotonic()
+            try:
+                self.step(due)
+            except Exception as e:
+                self.error = e
+                print('Error in', self.name, 'step, loop stopped.\nError:\n', e)
+                return
+            end = time.monotonic()
+            jitter = start - due
+            due += self.period
+            missed = 0
+            if end > due:
+                missed = math.ceil((end - due) / self.period)
+                due += missed * self.period  # drop the iterations that were missed rather than bunching them up
+            self._record(jitter, end - start, missed)
+
+    def _record(self, jitter, duration, missed):
+        with self._lock:
+            self._iterations += 1
+            n = self._iterations
+            delta = jitter - self._jitter_mean
+            self._jitter_mean += delta / n
+            self._jitter_m2 += delta * (jitter - self._jitter_mean)
+            self._jitter_max = max(self._jitter_max, jitter)
+            self._duration_mean += (duration - self._duration_mean) / n
+            self._duration_max = max(self._duration_max, duration)
+            if missed:
+                self._overruns += 1
+                self._missed += missed
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,166 @@
+"""Concurrent telemetry poller for EA power supplies and loads. Each serial port gets its own thread, so devices on
+different ports are read at the same time and the rig-wide update period is set by the slowest device rather than
+the sum of all of them. Readings are stored with host timestamps in a TelemetryStore shared by all devices.
+"""
+
+import heapq
+import threading
+import time
+
+import numpy as np
+
+from ..ring_buffer import RingBuffer
+from .EA_comms import PSB9000, PS2400B, TELEMETRY_DTYPE
+
+
+class TelemetryStore:
+    """Ring buffers of (t, v, i, p) readings, one per device name, returned as TELEMETRY_DTYPE structured arrays"""
+    def __init__(self, length=10000):
+        self.length = length
+        self.buffers = {}
+
+    def add(self, name):
+        if name in self.buffers:
+            raise ValueError("A device called " + name + " is already in the store")
+        self.buffers[name] = RingBuffer(self.length, len(TELEMETRY_DTYPE.names))
+
+    def append(self, name, t, v, i, p):
+        self.buffers[name].append((t, v, i, p))
+
+    def latest(self, name):
+        """Returns the newest reading of a device as a structured scalar with fields t, v, i, p, or None"""
+        row = self.buffers[name].latest()
+        if row is None:
+            return None
+        return self._structured(row[np.newaxis])[0]
+
+    def latest_all(self):
+        """Returns {name: newest reading} for every device"""
+        return {name: self.latest(name) for name in self.buffers}
+
+    def history(self, name, n=None):
+        """Returns the newest n readings of a device, oldest first"""
+        return self._structured(self.buffers[name].last(n))
+
+    def window(self, name, seconds):
+        """Returns the readings of a device taken in the last 'seconds' of host time"""
+        return self._structured(self.buffers[name].window(time.time() - seconds))
+
+    @staticmethod
+    def _structured(rows):
+        out = np.zeros(len(rows), dtype=TELEMETRY_DTYPE)
+        for k, field in enumerate(TELEMETRY_DTYPE.names):
+            out[field] = rows[:, k]
+        return out
+
+
+def _default_reader(device, channel):
+    """Returns a function reading (v, i, p) from the device with the quickest query its class offers"""
+    if isinstance(device, PSB9000):
+        def read():
+            output = device.query_output_array()
+            return output['v'], output['i'], output['p']
+    elif isinstance(device, PS2400B):
+        if channel is None:
+            raise ValueError("channel must be given for PS2400B devices")
+
+        def read():
+            output = device.query_output(channel)
+            return output['V_ps'], output['I_ps'], output['V_ps'] * output['I_ps']
+    else:
+        def read():
+            device.query_output(quiet=True)  # PSI8000 and EL9000 store the reading in device.output
+            return device.output['v'], device.output['i'], device.output['p']
+    return read
+
+
+class _PolledDevice:
+    def __init__(self, name, device, period, read):
+        self.name = name
+        self.device = device
+        self.period = period
+        self.read = read
+        self.reads = 0
+        self.errors = 0
+        self.last_error = None
+
+
+class EaPoller:
+    def __init__(self, store=None):
+        """store - TelemetryStore to write readings to, a new one is made if not given"""
+        self.store = store if store is not None else TelemetryStore()
+        self.ports = {}  # id of the serial object: list of _PolledDevice sharing that port
+        self._threads = []
+        self._stop_event = threading.Event()
+
+    def add(self, name, device, rate, channel=None, reader=None):
+        """
+        Adds a connected device to be polled
+        name - str  key for the device's readings in the store
+        rate - float    readings per second
+        channel - int   output channel, required for PS2400B
+        reader - optional function returning (v, i, p), by default the device's own query is used
+        """
+        if self._threads:
+            raise RuntimeError("Devices cannot be added while the poller is running")
+        if reader is None:
+            reader = _default_reader(device, channel)
+        self.store.add(name)
+        # Devices sharing a serial port (e.g. both PS2400B channels) must be read from the same thread
+        self.ports.setdefault(id(device.ser), []).append(_PolledDevice(name, device, 1 / rate, reader))
+
+    def start(self):
+        self._stop_event.clear()
+        for polled in self.ports.values():
+            thread = threading.Thread(target=self._poll_port, args=(polled,), name='EaPoller', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def latest(self, name=None):
+        """Returns the newest reading of one device, or of all of them as a dict if name is not given"""
+        if name is None:
+            return self.store.latest_all()
+        return self.store.latest(name)
+
+    def stats(self):
+        """Returns {name: {'reads', 'errors', 'last_error'}} for every device"""
+        return {p.name: {'reads': p.reads, 'errors': p.errors, 'last_error': p.last_error}
+                for polled in self.ports.values() for p in polled}
+
+    def _poll_port(self, polled):
+        now = time.monotonic()
+        schedule = [(now, k) for k in range(len(polled))]  # (due time, index) heap
+        heapq.heapify(schedule)
+        while not self._stop_event.is_set():
+            due, k = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            device = polled[k]
+            t_sent = time.time()
+            try:
+                v, i, p = device.read()
+            except Exception as e:
+                device.errors += 1
+                device.last_error = e
+                print('WARNING: Failed to read', device.name, ':', e)
+            else:
+                self.store.append(device.name, (t_sent + time.time()) / 2, v, i, p)
+                device.reads += 1
+            due += device.period
+            if due < time.monotonic():
+                due = time.monotonic()  # overran, read again as soon as the other devices on the port allow
+            heapq.heappush(schedule, (due, k))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,391 @@
+"""In-process stand-ins for the serial port of the EA devices, so the drivers in EA_comms can be exercised and
+benchmarked without hardware. Assign one to a device's ser attribute in place of the serial.Serial it creates:
+
+    ps = PS2400B(42, 4)
+    ps.ser = SimulatedEaSerial('PS2400B', 42, 4, 160, latency=0.002)
+
+SimulatedEaSerial emulates the binary telegram protocol of PSI8000, EL9000 and PS2400B (EaDevice), and
+SimulatedPSB9000Serial the SCPI dialect of the PSB9000. Writes take the time to send their bytes at the configured
+baud rate, responses are delayed by a fixed latency plus their own transmission time, and can be corrupted with bit
+errors and dropped bytes.
+"""
+
+import random
+import threading
+import time
+
+from .EA_codec import ERROR_OBJ
+
+
+class SimulatedSerial:
+    """pyserial compatible port whose responses are generated by handle(data) in a subclass"""
+    def __init__(self, latency=0.0, bit_error_rate=0.0, drop_rate=0.0, baudrate=57600, timeout=2, seed=None):
+        """
+        latency - float     seconds between the end of a write and the first byte of its response
+        bit_error_rate - float  probability of each response bit being flipped
+        drop_rate - float   probability of each response byte being lost
+        baudrate - int  used to add the transmission time of each byte written and each response byte (10 bits per
+                        byte), 0 to disable
+        """
+        self.port = 'SIM'
+        self.baudrate = baudrate
+        self.parity = 'N'
+        self.timeout = timeout
+        self.latency = latency
+        self.bit_error_rate = bit_error_rate
+        self.drop_rate = drop_rate
+        self.is_open = True
+        self.stats = {'written': 0, 'responses': 0, 'flipped_bits': 0, 'dropped_bytes': 0}
+        self._random = random.Random(seed)
+        self._pending = []  # (time the bytes become readable, bytes), in order
+        self._buffer = bytearray()  # bytes which have arrived
+        self._tx_free = 0.0  # time.monotonic() at which the bytes written so far have all been sent
+        self._cv = threading.Condition()
+
+    # Port control, as pyserial
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def isOpen(self):
+        return self.is_open
+
+    def reset_input_buffer(self):
+        with self._cv:
+            self._pending = []
+            self._buffer.clear()
+
+    # Writing
+    def write(self, data):
+        data = bytes(data)
+        self.stats['written'] += len(data)
+        if self.baudrate:
+            # The device only acts on the data once it has been sent, and like a port with a small output buffer the
+            # write returns at that point
+            with self._cv:
+                self._tx_free = max(time.monotonic(), self._tx_free) + len(data) * 10 / self.baudrate
+                sent = self._tx_free
+            delay = sent - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        response = self.handle(data)
+        if response:
+            self._respond(response)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def wait_idle(self, timeout=None):
+        """Blocks until every response generated so far has arrived in the input buffer, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cv:
+            return self._wait_for(lambda: not self._pending, deadline)
+
+    def handle(self, data):
+        """Returns the bytes the device sends in response to data"""
+        raise NotImplementedError
+
+    def _respond(self, response):
+        response = self._corrupt(response)
+        with self._cv:
+            start = time.monotonic() + self.latency
+            if self._pending:
+                start = max(start, self._pending[-1][0])
+            byte_time = 10 / self.baudrate if self.baudrate else 0
+            self._pending.append((start + len(response) * byte_time, response))
+            self.stats['responses'] += 1
+            self._cv.notify_all()
+
+    def _corrupt(self, response):
+        if not self.bit_error_rate and not self.drop_rate:
+            return response
+        out = bytearray()
+        for byte in response:
+            if self.drop_rate and self._random.random() < self.drop_rate:
+                self.stats['dropped_bytes'] += 1
+                continue
+            if self.bit_error_rate:
+                for bit in range(8):
+                    if self._random.random() < self.bit_error_rate:
+                        byte ^= 1 << bit
+                        self.stats['flipped_bits'] += 1
+            out.append(byte)
+        return bytes(out)
+
+    # Reading
+    def _arrive(self):
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] <= now:
+            self._buffer.extend(self._pending.pop(0)[1])
+
+    def _wait_for(self, ready, deadline):
+        """Waits on the condition until ready() or the deadline, returns ready()"""
+        while True:
+            self._arrive()
+            if ready():
+                return True
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            wait = None if deadline is None else deadline - now
+            if self._pending:
+                until_next = self._pending[0][0] - now
+                wait = until_next if wait is None else min(wait, until_next)
+            self._cv.wait(wait)
+
+    def _deadline(self):
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def read(self, size=1):
+        with self._cv:
+            self._wait_for(lambda: len(self._buffer) >= size, self._deadline())
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        with self._cv:
+            self._wait_for(lambda: b'\n' in self._buffer, self._deadline())
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def read_all(self):
+        with self._cv:
+            self._arrive()
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        return data
+
+    def inWaiting(self):
+        with self._cv:
+            self._arrive()
+            return len(self._buffer)
+
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+
+class SimulatedEaSerial(SimulatedSerial):
+    """Emulates the binary telegram protocol of the PSI8000, EL9000 and PS2400B"""
+    def __init__(self, model='PSI8000', volt_nom=720, curr_nom=15, p_nom=3000, ack_sets=None, load_resistance=10.0,
+                 bus_nodes=None, broadcast_node=None, **kwargs):
+        """
+        model - str 'PSI8000', 'EL9000' or 'PS2400B', selects the layout of the object 71 reply
+        ack_sets - bool     reply to set telegrams with an error telegram carrying code 0. By default only the
+                            PS2400B does, whose driver discards the reply silently
+        load_resistance - float     ohms, used to work out the actual current from the set voltage
+        bus_nodes - list of int     device nodes of units sharing one RS-485 bus (see EaBus)
+        broadcast_node - int        device node on which set telegrams are applied to every unit in bus_nodes and not
+                                    answered, as with EaBus broadcast_node
+        Other keyword arguments are passed to SimulatedSerial
+        """
+        super().__init__(**kwargs)
+        if model not in ('PSI8000', 'EL9000', 'PS2400B'):
+            raise ValueError("model must be 'PSI8000', 'EL9000' or 'PS2400B'")
+        self.model = model
+        self.volt_nom = volt_nom
+        self.curr_nom = curr_nom
+        self.p_nom = p_nom
+        self.ack_sets = model == 'PS2400B' if ack_sets is None else ack_sets
+        self.load_resistance = load_resistance
+        self.bus_nodes = bus_nodes
+        self.broadcast_node = broadcast_node
+        self.nodes = {}
+        for device_node in bus_nodes or ():
+            self.node(device_node)
+        self._input = bytearray()
+
+    def node(self, device_node):
+        """Returns the state dict of a device node, creating it on first use"""
+        if device_node not in self.nodes:
+            self.nodes[device_node] = {'v': 0, 'i': 0, 'p': 25600, 'output': 0, 'remote': 0, 'ovp': 0, 'ocp': 0}
+        return self.nodes[device_node]
+
+    def handle(self, data):
+        self._input.extend(data)
+        response = bytearray()
+        buf = self._input
+        while len(buf) >= 5:
+            SD = buf[0]
+            size = 5 if SD >> 6 == 1 else (SD & 0b00001111) + 6  # queries carry no data
+            if len(buf) < size:
+                break
+            telegram = bytes(buf[:size])
+            if sum(telegram[:-2]) != (telegram[-2] << 8) | telegram[-1]:
+                del buf[0]  # corrupted, resynchronise
+                continue
+            del buf[:size]
+            response.extend(self._telegram(telegram))
+        return bytes(response)
+
+    def _telegram(self, telegram):
+        SD, DN, OBJ = telegram[0], telegram[1], telegram[2]
+        t_type = SD >> 6
+        data = telegram[3:-2]
+        broadcast = self.bus_nodes is not None and DN == self.broadcast_node
+        if t_type == 1:
+            return self._query(DN, OBJ)
+        if t_type != 3:
+            return self._frame(DN, ERROR_OBJ, (3,))
+        nodes = [self.node(n) for n in self.bus_nodes] if broadcast else [self.node(DN)]
+        for node in nodes:
+            if OBJ in (50, 51, 52, 38, 39):
+                value = (data[0] << 8) | data[1]
+                node[{50: 'v', 51: 'i', 52: 'p', 38: 'ovp', 39: 'ocp'}[OBJ]] = value
+            elif OBJ == 54:
+                mask, value = data[0], data[1]
+                if mask & 0x01:
+                    node['output'] = value & 0x01
+                if mask & 0x10:
+                    node['remote'] = 1 if value & 0x10 else 0
+            else:
+                return b'' if broadcast else self._frame(DN, ERROR_OBJ, (3,))
+        if broadcast or not self.ack_sets:
+            return b''
+        return self._frame(DN, ERROR_OBJ, (0,))
+
+    def _actual(self, node):
+        """Returns the actual (voltage, current, power) of a node in units of 1/25600 of nominal"""
+        if not node['output']:
+            return 0, 0, 0
+        v = node['v'] * self.volt_nom / 25600
+        i = min(node['i'] * self.curr_nom / 25600, v / self.load_resistance)
+        p = min(v * i, node['p'] * self.p_nom / 25600)
+        return (int(25600 * v / self.volt_nom), int(25600 * i / self.curr_nom), int(25600 * p / self.p_nom))
+
+    def _query(self, DN, OBJ):
+        node = self.node(DN)
+        state0 = node['remote']
+        state1 = node['output']
+        v, i, p = self._actual(node)
+        if OBJ == 70:
+            return self._frame(DN, OBJ, (state0, state1))
+        if OBJ == 71:
+            if self.model == 'PS2400B':
+                return self._frame(DN, OBJ, (state0, state1, v >> 8, v & 255, i >> 8, i & 255))
+            return self._frame(DN, OBJ, (v >> 8, v & 255, i >> 8, i & 255, p >> 8, p & 255))
+        if OBJ in (50, 51, 52):  # set values read back
+            value = node[{50: 'v', 51: 'i', 52: 'p'}[OBJ]]
+            return self._frame(DN, OBJ, (value >> 8, value & 255))
+        return self._frame(DN, ERROR_OBJ, (3,))
+
+    @staticmethod
+    def _frame(DN, OBJ, data):
+        SD = (2 << 6) | (len(data) - 1)  # query answer, device to PC
+        telegram = bytearray((SD, DN, OBJ))
+        telegram.extend(data)
+        CS = sum(telegram)
+        telegram.extend((CS >> 8, CS & 255))
+        return bytes(telegram)
+
+
+class SimulatedPSB9000Serial(SimulatedSerial):
+    """Emulates the SCPI dialect used by PSB9000, including compound ';' messages, MEAS:ARR? and the function
+    generator commands"""
+    def __init__(self, volt_nom=750, curr_nom=60, p_nom=15000, load_resistance=10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.volt_nom = volt_nom
+        self.curr_nom = curr_nom
+        self.p_nom = p_nom
+        self.load_resistance = load_resistance
+        self.settings = {'SOUR:VOLT': 0.0, 'SOUR:CURR': 0.0, 'SINK:CURR': 0.0, 'OUTP': 'OFF', 'SYST:LOCK': '0',
+                         'VOLT:PROT': volt_nom * 1.1, 'SOUR:CURR:PROT': curr_nom * 1.1, 'FUNC:GEN:STAT': 'STOP'}
+        self.arb = {}  # function generator commands received, command: argument
+        self._input = bytearray()
+        self.errors = []  # SCPI error queue, read with SYST:ERR?
+
+    def handle(self, data):
+        self._input.extend(data)
+        response = bytearray()
+        while b'\n' in self._input:
+            end = self._input.index(b'\n')
+            line = self._input[:end].decode('ascii').strip()
+            del self._input[:end + 1]
+            replies = [r for r in (self._command(c) for c in self._resolve(line)) if r is not None]
+            if replies:
+                response.extend((';'.join(replies) + '\n').encode('ascii'))
+        return bytes(response)
+
+    @staticmethod
+    def _resolve(line):
+        """Splits a compound message into commands with full headers. As on the device, a header without a leading ':'
+        is taken relative to the path of the previous command in the message, e.g. 'SOUR:VOLT 12V;CURR 1A' sets
+        SOUR:CURR. Common * commands do not change the path"""
+        path = ''
+        for command in line.split(';'):
+            command = command.strip()
+            if not command:
+                continue
+            if command.startswith('*'):
+                yield command
+                continue
+            if command.startswith(':'):
+                command = command[1:]
+            else:
+                command = path + command
+            header = command.split(' ', 1)[0]
+            path = header[:header.rfind(':') + 1]
+            yield command
+
+    def _measure(self):
+        if self.settings['OUTP'] != 'ON':
+            return 0.0, 0.0, 0.0
+        v = self.settings['SOUR:VOLT']
+        i = min(self.settings['SOUR:CURR'], v / self.load_resistance)
+        return v, i, min(v * i, self.p_nom)
+
+    def _command(self, command):
+        """Applies one SCPI command and returns its reply or None"""
+        header, _, argument = command.partition(' ')
+        header = header.upper()
+        aliases = {'SOURCE:CURRENT?': 'SOUR:CURR?', 'OUTPUT?': 'OUTP?', 'OUTPUT': 'OUTP'}
+        header = aliases.get(header, header)
+        if header == '*IDN?':
+            return 'EA Elektro-Automatik,PSB 9000 (simulated),0,1.0'
+        if header == '*OPC?':
+            return '1'
+        if header in ('*RST', '*CLS'):
+            return None
+        v, i, p = self._measure()
+        if header == 'MEAS:VOLT?':
+            return '%.2f V' % v
+        if header == 'MEAS:CURR?':
+            return '%.2f A' % i
+        if header == 'MEAS:POW?':
+            return '%.2f W' % p
+        if header == 'MEAS:ARR?':
+            return '%.2f V, %.2f A, %.2f W' % (v, i, p)
+        if header == 'STAT:QUES?':
+            return '0'
+        if header == 'SYST:ERR?':
+            return self.errors.pop(0) if self.errors else '0,"No error"'
+        if header in ('SOUR:VOLT?', 'SOUR:CURR?', 'SINK:CURR?'):
+            unit = 'V' if header == 'SOUR:VOLT?' else 'A'
+            return '%.2f %s' % (self.settings[header[:-1]], unit)
+        if header == 'OUTP?':
+            return self.settings['OUTP']
+        if header == 'FUNC:GEN:STAT?':
+            return self.settings['FUNC:GEN:STAT']
+        if header in ('SOUR:VOLT', 'SOUR:CURR', 'SINK:CURR', 'VOLT:PROT', 'SOUR:CURR:PROT'):
+            self.settings[header] = float(argument.rstrip('VA').strip())
+            return None
+        if header in ('OUTP', 'SYST:LOCK', 'FUNC:GEN:STAT'):
+            self.settings[header] = argument.upper()
+            return None
+        if header.startswith('FUNC:'):
+            self.arb[header] = argument
+            return None
+        # Unknown commands are ignored (a query gets no reply), as the device does after logging an error
+        self.errors.append('-113,"Undefined header;' + header + '"')
+        return None
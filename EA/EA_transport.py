@@ -0,0 +1,247 @@
+"""Pipelined request/response engine for the EA binary telegram protocol used by EaDevice and its subclasses.
+
+A reader thread frames every incoming telegram using the data length in its start delimiter, checks the checksum and
+hands the data to the oldest outstanding request with the same device node and object. Several requests can be in
+flight at once and setters do not need the fixed sleep and drain used by the blocking code in EA_comms.
+
+An error telegram carries no object, so it is matched to the oldest telegram still outstanding on that device node,
+whether a query or a set. A set is outstanding until a reply to a later telegram on the same node arrives, as the device
+answers in order.
+"""
+
+import collections
+import threading
+
+from .EA_codec import ERROR_OBJ, EaDeviceError
+
+
+class EaRequest:
+    """Handle for a query which has been sent and is waiting for its reply"""
+    def __init__(self, message, key):
+        self.message = message
+        self.key = key  # (device node, object)
+        self.seq = None  # position in the order telegrams were sent, set by the transport
+        self.data = None
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Blocks until the reply arrives and returns its data, raising TimeoutError if it does not arrive in time or
+        ConnectionError if the device reported an error"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("No reply from EA device node " + str(self.key[0]) + " to object " + str(self.key[1]))
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+    def _finish(self, data=None, error=None):
+        self.data = data
+        self.error = error
+        self._done.set()
+
+
+class EaTransport:
+    def __init__(self, ser, timeout=None, max_outstanding=8):
+        """
+        ser - an open serial.Serial (or compatible) connection, owned by the transport while it is running
+        timeout - float     seconds to wait for each reply, defaults to the serial timeout
+        max_outstanding - int   number of queries which may be waiting for a reply at the same time
+        """
+        self.ser = ser
+        self.timeout = timeout if timeout is not None else ser.timeout
+        self.max_outstanding = max_outstanding
+        self.pending = {}  # (device node, object): deque of EaRequest, oldest first
+        self.stats = {'sent': 0, 'received': 0, 'checksum_errors': 0, 'unmatched': 0, 'device_errors': 0}
+        self.last_error = None  # EaDeviceError of the last set the device refused
+        self.users = 0  # device objects using the transport, see attach and detach
+        self._sets = {}  # device node: deque of (seq, telegram) of sets with no reply yet, oldest first
+        self._seq = 0
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_outstanding)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the reader thread, discarding anything already waiting on the port"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.ser.inWaiting() > 0:
+            self.ser.read_all()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._read_loop, name='EaTransport', daemon=True)
+        self._thread.start()
+
+    def attach(self):
+        """Registers a device object using the transport"""
+        with self._lock:
+            self.users += 1
+
+    def detach(self):
+        """Unregisters a device object, returns True if no other device object is using the transport"""
+        with self._lock:
+            self.users = max(self.users - 1, 0)
+            return self.users == 0
+
+    def stop(self):
+        """Stops the reader thread. Outstanding requests are failed"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            requests = [r for queue in self.pending.values() for r in queue]
+            self.pending = {}
+            self._sets = {}
+        for request in requests:
+            self._release(request, error=ConnectionError("EA transport stopped"))
+
+    def send(self, message):
+        """Writes a telegram which has no reply (set values, control object). Does not wait. If the device refuses it the
+        error is printed and kept in last_error"""
+        with self._lock:
+            self._seq += 1
+            self._sets.setdefault(message[1], collections.deque(maxlen=64)).append((self._seq, message))
+        self._write(message)
+
+    def _write(self, message):
+        with self._write_lock:
+            self.ser.write(message)
+        with self._lock:
+            self.stats['sent'] += 1
+
+    def request(self, message, key=None):
+        """Writes a query telegram and returns an EaRequest for its reply without waiting. Blocks only if
+        max_outstanding queries are already waiting
+        key - (device node, object) of the expected reply, by default those of the telegram"""
+        if self._thread is None:
+            raise ConnectionError("EA transport not started")
+        request = EaRequest(message, key if key is not None else (message[1], message[2]))
+        self._slots.acquire()
+        with self._lock:
+            self._seq += 1
+            request.seq = self._seq
+            self.pending.setdefault(request.key, collections.deque()).append(request)
+        try:
+            self._write(message)
+        except Exception as e:
+            self.cancel(request)
+            raise e
+        return request
+
+    def send_acknowledged(self, message):
+        """Writes a set telegram to a device which answers sets with an acknowledge (the PS2400B) and waits for it, so
+        the acknowledge cannot collide with the next telegram on a half duplex bus. Raises TimeoutError if it does not
+        arrive, or EaDeviceError if the device replies with an error instead"""
+        request = self.request(message, (message[1], ERROR_OBJ))
+        try:
+            return request.result(self.timeout)
+        except TimeoutError as e:
+            self.cancel(request)
+            raise e
+
+    def query(self, message, retries=1):
+        """Sends a query telegram and returns the data of its reply, resending up to 'retries' times if no valid reply
+        arrives within the timeout"""
+        attempt = 0
+        while True:
+            request = self.request(message)
+            try:
+                return request.result(self.timeout)
+            except TimeoutError as e:
+                self.cancel(request)
+                attempt += 1
+                if attempt > retries:
+                    raise ConnectionError(str(e) + ", " + str(retries) + " retries attempted")
+
+    def cancel(self, request):
+        """Stops waiting for the reply to request, e.g. after a timeout, so a late reply is not matched to it"""
+        with self._lock:
+            queue = self.pending.get(request.key)
+            if queue is None or request not in queue:
+                return
+            queue.remove(request)
+        self._release(request, error=TimeoutError("Request cancelled"))
+
+    def _release(self, request, data=None, error=None):
+        if not request.done():
+            request._finish(data, error)
+            self._slots.release()
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                chunk = self.ser.read(max(1, self.ser.inWaiting()))
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                print('Error occurred while reading from EA device, transport stopped.\nError:\n', e)
+                break
+            if chunk:
+                self._buffer.extend(chunk)
+                self._parse()
+
+    def _parse(self):
+        buf = self._buffer
+        while len(buf) >= 6:  # smallest telegram: SD, DN, OBJ, one data byte and two checksum bytes
+            size = (buf[0] & 0b00001111) + 6
+            if len(buf) < size:
+                return
+            CS = sum(buf[0:size - 2])
+            if (CS >> 8) != buf[size - 2] or (CS & 255) != buf[size - 1]:
+                # Corrupted or out of step, resynchronise one byte further on
+                with self._lock:
+                    self.stats['checksum_errors'] += 1
+                del buf[0]
+                continue
+            frame = bytes(buf[0:size])
+            del buf[0:size]
+            with self._lock:
+                self.stats['received'] += 1
+            self._dispatch(frame)
+
+    def _dispatch(self, frame):
+        DN = frame[1]
+        OBJ = frame[2]
+        data = frame[3:-2]
+        error = OBJ == ERROR_OBJ and data[0] != 0
+        refused = None
+        with self._lock:
+            sets = self._sets.get(DN)
+            if OBJ == ERROR_OBJ and not error:
+                # Acknowledge of a sent telegram, only of interest to send_acknowledged
+                queue = self.pending.get((DN, ERROR_OBJ))
+                if not queue:
+                    if sets:
+                        sets.popleft()  # acknowledge of the oldest set sent with send
+                    return
+            elif error:
+                self.stats['device_errors'] += 1
+                # An error reply carries no object, blame the oldest telegram outstanding on that device node
+                queue = min((q for key, q in self.pending.items() if key[0] == DN and q),
+                            key=lambda q: q[0].seq, default=None)
+                if sets and (queue is None or sets[0][0] < queue[0].seq):
+                    refused = sets.popleft()[1]
+                    queue = None
+            else:
+                queue = self.pending.get((DN, OBJ))
+            request = queue.popleft() if queue else None
+            if request is not None and sets:
+                # Replies come in order, so sets sent before this request were accepted
+                while sets and sets[0][0] < request.seq:
+                    sets.popleft()
+            if request is None and refused is None:
+                self.stats['unmatched'] += 1
+        if refused is not None:
+            self.last_error = EaDeviceError(DN, data[0])
+            print('WARNING: EA device refused a set. Telegram:\n', refused, '\nError:', self.last_error)
+        elif request is None:
+            print('WARNING: Unexpected data received. Data:\n', frame)
+        elif error:
+            self._release(request, error=EaDeviceError(DN, data[0]))
+        else:
+            self._release(request, data=data)
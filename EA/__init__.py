@@ -1 +1,7 @@
 from .EA_comms import *
+from .EA_codec import *
+from .EA_transport import *
+from .EA_poller import *
+from .EA_simulator import *
+from .EA_bus import *
+from .EA_control import *
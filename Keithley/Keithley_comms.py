@@ -12,18 +12,24 @@ except ImportError as e:
           'it has been found that pyvisa-py backend cannot connect to some of the lab equipment')
 
 import time
-import matplotlib.pyplot as plt
 import numpy as np
 
+from ..scpi_batch import BatchMixin
 
-class Keithley:
-    def __init__(self, _v_range=100, _i_range=3):
+
+class Keithley(BatchMixin):
+    def __init__(self, _v_range=100, _i_range=3, rm=None):
+        """
+        rm - pyvisa ResourceManager, or a stand-in such as visa_simulator.SimulatedResourceManager. A new
+        pyvisa.ResourceManager if not given
+        """
         self.v_range = _v_range
         self.i_range = _i_range
         self.sample_rate = 20
         self.apperture = 1/self.sample_rate
         self.n_samples = 100
-        rm = pyvisa.ResourceManager()
+        if rm is None:
+            rm = pyvisa.ResourceManager()
         self.inst = rm.open_resource(self.RESOURCE_STRING)
         # self.inst.read_termination ="\n"
         # self.inst.write_termination = "\n"
@@ -80,54 +86,57 @@ class Keithley:
         self.inst.write('SENSE:AZER:ONCE')
 
     def configureBuffers_SCPI_Trig_Digitize(self):
-        self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
-        self.inst.write(':SENSE:VOLT:RANG %f' % self.v_range)
+        with self.batch():
+            self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
+            self.inst.write(':SENSE:VOLT:RANG %f' % self.v_range)
 
-        self.inst.write(':SENS:DIG:FUNC "VOLT"')
-        self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
-        self.inst.write(':SENSE:DIG:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
+            self.inst.write(':SENS:DIG:FUNC "VOLT"')
+            self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
+            self.inst.write(':SENSE:DIG:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
 
-        # self.inst.write(':TRACE:CLEAR')
-        self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
-        self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", COMMAND, 0, ENTER, 0, "defbuffer1"')
-        self.inst.write(':DISPlay:SCReen GRAPh')
-        self.inst.write('*WAI')
-        self.inst.write(':INIT')
+            # self.inst.write(':TRACE:CLEAR')
+            self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
+            self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", COMMAND, 0, ENTER, 0, "defbuffer1"')
+            self.inst.write(':DISPlay:SCReen GRAPh')
+            self.inst.write('*WAI')
+            self.inst.write(':INIT')
 
     def configureBuffers_Ext_Trig_Digitize(self):
         """Digitize gives 4.5 digit accuracy """
-        self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
-        self.inst.write(':SENS:DIG:FUNC "VOLT"')
-        self.inst.write(':SENSE:DIG:VOLT:RANG %f' % self.v_range)
-
-
-        self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
-        self.inst.write(':SENSE:DIG:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
-        # #
-        # self.inst.write(':TRACE:CLEAR')
-        self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
-        self.inst.write(':TRIGGER:EXT:IN:EDGE RISING')
-        self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", EXTERNAL, 50, ENTER, 0, "defbuffer1"')
-        self.inst.write(':DISPlay:SCReen GRAPh')
-        self.inst.write('*WAI')
-        self.inst.write(':INIT')
+        with self.batch():
+            self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
+            self.inst.write(':SENS:DIG:FUNC "VOLT"')
+            self.inst.write(':SENSE:DIG:VOLT:RANG %f' % self.v_range)
+
+
+            self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
+            self.inst.write(':SENSE:DIG:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
+            # #
+            # self.inst.write(':TRACE:CLEAR')
+            self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
+            self.inst.write(':TRIGGER:EXT:IN:EDGE RISING')
+            self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", EXTERNAL, 50, ENTER, 0, "defbuffer1"')
+            self.inst.write(':DISPlay:SCReen GRAPh')
+            self.inst.write('*WAI')
+            self.inst.write(':INIT')
 
     def configureBuffers_Ext_Trig_Measure(self):
         """Measure gives higher accuracy but does not control the sample rate and is slower than digitize"""
-        self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
-        self.inst.write(':SENS:DIG:FUNC "VOLT"')
-        self.inst.write(':SENSE:DIG:VOLT:RANG %f' % self.v_range)
-
-
-        self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
-        self.inst.write(':SENSE:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
-        # #
-        # self.inst.write(':TRACE:CLEAR')
-        self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
-        self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", EXTERNAL, 50, ENTER, 0, "defbuffer1"')
-        self.inst.write(':DISPlay:SCReen GRAPh')
-        self.inst.write('*WAI')
-        self.inst.write(':INIT')
+        with self.batch():
+            self.inst.write(':SENSE:VOLT:AZER OFF')  # Turns off autozero
+            self.inst.write(':SENS:DIG:FUNC "VOLT"')
+            self.inst.write(':SENSE:DIG:VOLT:RANG %f' % self.v_range)
+
+
+            self.inst.write(':SENSE:DIG:VOLT:SRATE  %f' % self.sample_rate)
+            self.inst.write(':SENSE:VOLT:APER AUTO')# %f' % self.apperture) #set the apperture duration (duration the adc intergrates over)
+            # #
+            # self.inst.write(':TRACE:CLEAR')
+            self.inst.write(':TRACE:POINTS %f, "defbuffer1"' % self.n_samples)
+            self.inst.write(':TRIGGER:LOAD "LoopUntilEvent", EXTERNAL, 50, ENTER, 0, "defbuffer1"')
+            self.inst.write(':DISPlay:SCReen GRAPh')
+            self.inst.write('*WAI')
+            self.inst.write(':INIT')
 
     def trigger(self):
         self.inst.write('*TRG')
@@ -178,21 +187,24 @@ class DMM6500(Keithley):
         Asset code 28859 resource string = 'USB0::0x05E6::0x6500::04497105::INSTR'
         No asset code resource string = 'USB0::0x05E6::0x6500::04396331::INSTR'
     """
-    def __init__(self, _Resource_String = 'USB0::0x05E6::0x6500::04396331::INSTR',AssetSticker=False,_v_range=100):
+    def __init__(self, _Resource_String = 'USB0::0x05E6::0x6500::04396331::INSTR',AssetSticker=False,_v_range=100,
+                 rm=None):
         """ Can input Resource sting manually and this will set the resource sting or can set Asset sticker true or
         false, if asset sticker set true then it will override an input resource string """
         if AssetSticker:
             self.RESOURCE_STRING ="USB0::0x05E6::0x6500::04497105::INSTR"
         else:
             self.RESOURCE_STRING = _Resource_String
-        super().__init__(_v_range)
+        super().__init__(_v_range, rm=rm)
 
 class MM2000(Keithley):
-    def __init__(self):
+    def __init__(self, rm=None):
         self.n_sample = 300
         self.interval_in_ms = 5e-3
+        self.COMMAND_BUFFER = 256  # the RS-232 input buffer is small
         self.RESOURCE_STRING = 'ASRL10::INSTR'
-        rm = pyvisa.ResourceManager()
+        if rm is None:
+            rm = pyvisa.ResourceManager()
         self.inst = rm.open_resource(self.RESOURCE_STRING)
         try:
             print("Opened connection with ", self.inst.query('*IDN?;'))
@@ -202,24 +214,25 @@ class MM2000(Keithley):
         self.inst.write("*rst; status:preset; *cls")
 
     def configureBuffers(self):
-        #todo not convinced below code is correctly setting the sample rate
-        self.inst.write(':SYSTEM:AZERO:STATE OFF')
-        # self.inst.write(':SENSE:VOLT:DC:NPLC 0.01')
-        self.inst.write(':DISPLAY:ENABLE OFF')
-        self.inst.write(':SENSE:FUNC "VOLT:DC"')
-        self.inst.write(':SENSE:VOLT:DC:RANGE:AUTO OFF')
-        self.inst.write(':VOLT:DC:RANGE 5')
-        self.inst.write(':VOLT:DC:DIGITS 6')
-        self.inst.write(':TRACE:CLEAR')
-        self.inst.write(':TRACE:POINTS %f' % self.n_sample)
-        self.inst.write(':TRACE:FEED SENSE')
-        self.inst.write(':INIT:CONT OFF')
-        # self.inst.write(':TRIG:SOURCE IMMEDIATE')
-        self.inst.write(':TRIG:SOURCE BUS')
-        self.inst.write(':SAMPLE:COUNT %f' % self.n_sample)
-        self.inst.write("TRIG:DELAY %f" % (self.interval_in_ms / 1000.0))
-        self.inst.write('*WAI') #wait for all previous commands to execute
-        self.inst.write(':ABORT')
+        with self.batch():
+            #todo not convinced below code is correctly setting the sample rate
+            self.inst.write(':SYSTEM:AZERO:STATE OFF')
+            # self.inst.write(':SENSE:VOLT:DC:NPLC 0.01')
+            self.inst.write(':DISPLAY:ENABLE OFF')
+            self.inst.write(':SENSE:FUNC "VOLT:DC"')
+            self.inst.write(':SENSE:VOLT:DC:RANGE:AUTO OFF')
+            self.inst.write(':VOLT:DC:RANGE 5')
+            self.inst.write(':VOLT:DC:DIGITS 6')
+            self.inst.write(':TRACE:CLEAR')
+            self.inst.write(':TRACE:POINTS %f' % self.n_sample)
+            self.inst.write(':TRACE:FEED SENSE')
+            self.inst.write(':INIT:CONT OFF')
+            # self.inst.write(':TRIG:SOURCE IMMEDIATE')
+            self.inst.write(':TRIG:SOURCE BUS')
+            self.inst.write(':SAMPLE:COUNT %f' % self.n_sample)
+            self.inst.write("TRIG:DELAY %f" % (self.interval_in_ms / 1000.0))
+            self.inst.write('*WAI') #wait for all previous commands to execute
+            self.inst.write(':ABORT')
 
 
     def trigger(self):
@@ -239,6 +252,8 @@ class MM2000(Keithley):
         return {'data': dataList, 'time': times}
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
     keith = DMM6500('USB0::0x05E6::0x6500::04497105::INSTR', _v_range=100)
     kenny = DMM6500('USB0::0x05E6::0x6500::04396331::INSTR', _v_range=100)
     # keith.zero_measurement()
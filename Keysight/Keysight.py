@@ -1,14 +1,25 @@
 ### Interface code for Keysight Oscilloscope ###
 # @author: J Bruford
 
-import pyvisa
+try:
+    import pyvisa
+except ImportError as e:
+    # Not needed to run against visa_simulator.SimulatedResourceManager
+    print("Error -> ", e)
+    print('It is recommended to install pyvisa using pip install -U pyvisa')
 import numpy as np
 import time
 from struct import unpack
 
+from ..scpi_batch import BatchMixin
 
-class KeysightScope:
-    def __init__(self, samplerate):
+
+class KeysightScope(BatchMixin):
+    def __init__(self, samplerate, rm=None):
+        """
+        rm - pyvisa ResourceManager, or a stand-in such as visa_simulator.SimulatedResourceManager. A new
+        pyvisa.ResourceManager if not given
+        """
         self.samplerate = samplerate
         self.N_SAMP = 1250  # number of samplestocapture
         self.BIT_NR = 12  # Numberofbitsperwaveformpoint
@@ -18,7 +29,7 @@ class KeysightScope:
         self.wave = {}  # output waveform data from scope
         self.status = []
 
-        self.rm = pyvisa.ResourceManager()
+        self.rm = rm if rm is not None else pyvisa.ResourceManager()
 
     def open(self):
         if hasattr(self, 'inst'):
@@ -66,15 +77,16 @@ class KeysightScope:
             delattr(self, 'inst')
 
     def set(self, trigger_voltage=-1):
-        # Currently assumes most setup is done through scope screen interface
-        # Setup trigger - complicated - best done on screen for now
-        self.inst.write('TRIG:MODE EDGE')
-        self.inst.write(':TRIG:EDGE:SOUR CHAN1')
-        self.inst.write('TRIG:EDGE:SLOPE NEG')
-        self.inst.write('TRIG:EDGE:LEVEL '+str(trigger_voltage))
-        self.inst.write('TRIG:SWEEP NORMAL')
+        with self.batch():
+            # Currently assumes most setup is done through scope screen interface
+            # Setup trigger - complicated - best done on screen for now
+            self.inst.write('TRIG:MODE EDGE')
+            self.inst.write(':TRIG:EDGE:SOUR CHAN1')
+            self.inst.write('TRIG:EDGE:SLOPE NEG')
+            self.inst.write('TRIG:EDGE:LEVEL '+str(trigger_voltage))
+            self.inst.write('TRIG:SWEEP NORMAL')
 
-        # self.inst.write('ACQuire:StopAfter Sequence')
+            # self.inst.write('ACQuire:StopAfter Sequence')
 
     def run(self):
         """
@@ -470,15 +482,15 @@ class KeysightScope:
 
 
 class DSOX2024A(KeysightScope):
-    def __init__(self):
+    def __init__(self, rm=None):
         self.samplerate = 1e9  # interleaved samplerate
-        super().__init__(self.samplerate)
+        super().__init__(self.samplerate, rm)
         self.RESOURCE_STRING = 'USB0::0x0957::0x1796::MY56202075::INSTR'  # Use pyvisa Resource Manager to find the resource string for Keysight scope
 
 
 class MSOX4024A(KeysightScope):
-    def __init__(self):
+    def __init__(self, rm=None):
         self.samplerate = 2.5e9
-        super().__init__(self.samplerate)
+        super().__init__(self.samplerate, rm)
         self.RESOURCE_STRING = 'USB0::0x0957::0x17B6::MY53110104::INSTR'  # Use pyvisa Resource Manager to find the resource string for Keysight scope
         # interleaved samplerate
@@ -1 +1,3 @@
 from .pico_comms import *
+from .pico_acquisition import *
+from .pico_group import *
@@ -0,0 +1,131 @@
+"""This file provides class PicoAcquisition, a background service which owns an opened and configured tc08 or ADC_20
+logger, polls it at the logger's sample interval and stores the measurements in a ring buffer. Several consumers
+(a control loop, a file logger, a live plot) can then share one logger without each one adding USB traffic.
+"""
+
+import threading
+import time
+
+from ..ring_buffer import RingBuffer
+from .pico_comms import ADC_20
+
+
+class PicoAcquisition:
+    def __init__(self, logger, buffer_length=10000, stall_periods=10):
+        """
+        logger - tc08 or ADC_20 that has been opened and had setChannels and setSampleInterval called
+        buffer_length - int     number of measurements kept in the ring buffer
+        stall_periods - float   sample periods without new data (at least 2) after which the service gives up and sets
+                                error. Polls without data in between are retried and counted in stats
+        """
+        if logger.numchannels is None or logger.interval is None:
+            raise ValueError("setChannels and setSampleInterval must be called on the logger before acquisition")
+        self.logger = logger
+        self.period = logger.interval / 1000
+        self.stall_time = max(stall_periods, 2) * self.period
+        self.buffer = RingBuffer(buffer_length, logger.numchannels + 1)
+        self.subscribers = []
+        self.error = None  # exception which stopped the acquisition
+        self.stats = {'samples': 0, 'empty_polls': 0, 'longest_gap': 0.0}  # longest_gap in seconds between samples
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Runs the logger in streaming mode and starts the acquisition thread"""
+        if self._thread is not None and self._thread.is_alive():
+            print('Acquisition already running')
+            return
+        self.error = None
+        self._stop_event.clear()
+        self.logger.run()
+        self._thread = threading.Thread(target=self._acquire, name='PicoAcquisition', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the acquisition thread and the logger"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.logger.stop()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        """Registers callback(row) to be called from the acquisition thread with each new measurement, where row is
+        a NumPy array of the form [TIME, DATA1, DATA2...]"""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def latest(self):
+        """Returns the newest measurement [TIME, DATA1, DATA2...] without touching the logger, None before the first
+        measurement has been received"""
+        return self.buffer.latest()
+
+    def history(self, n=None):
+        """Returns the newest n measurements as a 2D array with one row per measurement"""
+        return self.buffer.last(n)
+
+    def window(self, seconds):
+        """Returns the measurements taken in the last 'seconds' of logger time"""
+        latest = self.buffer.latest()
+        if latest is None:
+            return self.buffer.last(0)
+        return self.buffer.window(latest[0] - seconds)
+
+    def _record(self):
+        if isinstance(self.logger, ADC_20):
+            # Misses are timed here rather than counted by ADC_20.record so that a slow USB response does not raise
+            return self.logger.record(failures=float('inf'))
+        return self.logger.record()
+
+    def _acquire(self):
+        last_time = None
+        last_data = time.monotonic()
+        next_poll = last_data + self.period
+        while not self._stop_event.is_set():
+            delay = next_poll - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            try:
+                measurement = self._record()
+            except ConnectionError as e:
+                self.error = e
+                print('Acquisition stopped, error while reading logger:', e)
+                break
+            now = time.monotonic()
+            if measurement is None or measurement[0] == last_time:
+                # No new data yet, try again part way through the next interval rather than a whole period later
+                self.stats['empty_polls'] += 1
+                if now - last_data > self.stall_time:
+                    self.error = ConnectionError("No new data from the logger for " + str(round(now - last_data, 2)) +
+                                                 " s")
+                    print('Acquisition stopped:', self.error)
+                    break
+                next_poll = now + self.period / 4
+                continue
+            self.stats['samples'] += 1
+            self.stats['longest_gap'] = max(self.stats['longest_gap'], now - last_data)
+            last_data = now
+            last_time = measurement[0]
+            self.buffer.append(measurement)
+            row = self.buffer.latest()
+            for callback in list(self.subscribers):
+                try:
+                    callback(row)
+                except Exception as e:
+                    print('Error in acquisition subscriber', callback, ':', e)
+            next_poll += self.period
+            if next_poll < time.monotonic():
+                next_poll = time.monotonic() + self.period
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
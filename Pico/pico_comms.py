@@ -34,6 +34,10 @@ class tc08():
             print('Unit open')
         print(op)
         self.handle = op
+        self.setMains()
+
+    def setMains(self):
+        '''Sets the mains frequency rejection of the open unit'''
         rej = self.picodll.usb_tc08_set_mains(self.handle, 0)
         if not rej:
             print("Failed to set mains frequency rejection")
@@ -43,6 +47,14 @@ class tc08():
         else:
             print('Mains rejection set correctly')
 
+    def getSerial(self):
+        '''Returns the batch and serial number of the open unit, used to tell units apart when several are attached'''
+        serial = ctypes.create_string_buffer(256)
+        length = self.picodll.usb_tc08_get_unit_info2(self.handle, serial, len(serial), 4)  # 4: batch and serial
+        if length <= 0:
+            raise ConnectionError("Could not read serial number of temperature logger")
+        return serial.value.decode('ascii')
+
     def setChannels(self, channels):
         '''Sets the channel arrangement as specified by the dictionary 'channels'. 
         The dictionary should take the form {0:'C', 1:'K, 2:'K'...}. The number key 
@@ -215,6 +227,10 @@ class ADC_20():
         else:
             print('Unit open')
         self.handle = op
+        self.setMains()
+
+    def setMains(self):
+        '''Sets the mains frequency rejection of the open unit'''
         rej = self.picodll.HRDLSetMains(self.handle, 0)
         if not rej:
             print("Failed to set mains frequency rejection")
@@ -225,6 +241,14 @@ class ADC_20():
         else:
             print('Mains rejection set correctly')
 
+    def getSerial(self):
+        '''Returns the batch and serial number of the open unit, used to tell units apart when several are attached'''
+        serial = ctypes.create_string_buffer(256)
+        length = self.picodll.HRDLGetUnitInfo(self.handle, serial, len(serial), 4)  # 4: batch and serial
+        if length <= 0:
+            raise ConnectionError("Could not read serial number of data logger")
+        return serial.value.decode('ascii')
+
     def setChannels(self, channels, range, numsamples=1):
         '''Sets the channel arrangement as specified by the dictionary 'channels'. 
         The dictionary should take the form {0:'C', 1:'K, 2:'K'...}. The number key 
@@ -0,0 +1,151 @@
+"""This file provides class PicoLoggerGroup which opens every attached tc08 (or ADC_20) logger, configures them together
+and polls them concurrently. Measurements from all units are merged into one time-aligned row of the form
+[TIME, UNIT1_DATA1, UNIT1_DATA2..., UNIT2_DATA1...] so adding loggers does not stretch the sampling period.
+
+The units are started together so their time bases agree, but each is polled for its newest sample and one may be a
+sample ahead of another. The last few samples of every unit are kept, TIME is the newest time every unit has reached,
+and each unit contributes its sample nearest to TIME. If that is further than the tolerance (half the sample interval
+by default) from TIME the row is not returned.
+The group has the same run/record/stop interface as a single logger so it can be passed to PicoAcquisition.
+"""
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .pico_comms import tc08, ADC_20
+
+
+class PicoLoggerGroup:
+    def __init__(self, logger_class=tc08, tolerance=None, history=4):
+        """
+        logger_class - tc08 or ADC_20, the type of logger in the group
+        tolerance - float   seconds a unit's sample may be from the row TIME, half the group interval if None
+        history - int   samples kept per unit to choose from
+        """
+        if logger_class is not tc08 and logger_class is not ADC_20:
+            raise ValueError("logger_class must be tc08 or ADC_20")
+        self.logger_class = logger_class
+        self.units = {}  # serial number: logger, in the order the units were opened
+        self.columns = []  # (serial number, channel) for each data column of a merged measurement
+        self.numchannels = None
+        self.interval = None
+        self.tolerance = tolerance
+        self.history = history
+        self.stats = {'rows': 0, 'unaligned': 0, 'max_skew': 0.0}
+        self._samples = {}  # serial number: deque of that unit's newest measurements
+        self._pool = None
+
+    def openUnits(self, max_units=None):
+        '''Opens every attached unit (up to max_units) and identifies each one by its serial number'''
+        if self.units:
+            print('Logger group already open')
+            return
+        while max_units is None or len(self.units) < max_units:
+            logger = self.logger_class()
+            if self.logger_class is tc08:
+                handle = logger.picodll.usb_tc08_open_unit()
+            else:
+                handle = logger.picodll.HRDLOpenUnit()
+            if handle == 0:
+                # No unopened units left. Only an error if nothing was found
+                if not self.units:
+                    raise ConnectionError("No loggers found")
+                break
+            if handle < 0:
+                message = "Could not open logger " + str(len(self.units) + 1)
+                self.closeUnits()
+                raise ConnectionError(message)
+            logger.handle = handle
+            logger.setMains()
+            serial = logger.getSerial()
+            print('Opened unit', serial)
+            self.units[serial] = logger
+        self._pool = ThreadPoolExecutor(max_workers=len(self.units), thread_name_prefix='PicoLoggerGroup')
+
+    def serials(self):
+        return list(self.units)
+
+    def setChannels(self, channels, *args, **kwargs):
+        '''Sets the channel arrangement of every unit in one call. channels is either a single dictionary applied to
+        all units, or a dictionary of the form {serial: channels} to configure each unit separately. Any further
+        arguments (e.g. the range dictionary of ADC_20) are passed to each unit's setChannels'''
+        if set(channels).issubset(self.units) and channels:
+            per_unit = channels
+        else:
+            per_unit = {serial: channels for serial in self.units}
+        columns = []
+        for serial, logger in self.units.items():
+            if serial not in per_unit:
+                raise ValueError("No channel arrangement given for unit " + serial)
+            logger.setChannels(per_unit[serial], *args, **kwargs)
+            if logger.numchannels is None:
+                raise ValueError("Failed to set channels on unit " + serial)
+            columns.extend((serial, c + 1) for c in range(logger.numchannels))
+        self.columns = columns
+        self.numchannels = len(columns)
+
+    def setSampleInterval(self, interval=0):
+        '''Sets the sample interval of every unit. The group interval is the slowest of the units' intervals'''
+        for logger in self.units.values():
+            logger.setSampleInterval(interval)
+        self.interval = max(logger.interval for logger in self.units.values())
+
+    def _map(self, func):
+        """Calls func(logger) for every unit concurrently and returns the results in unit order"""
+        futures = [self._pool.submit(func, logger) for logger in self.units.values()]
+        return [f.result() for f in futures]
+
+    def run(self):
+        '''Starts all units streaming together so that their time bases are aligned'''
+        if self.logger_class is tc08:
+            # Run every unit at the common interval, otherwise faster units would drift ahead of slower ones
+            for logger in self.units.values():
+                logger.interval = self.interval
+        self._samples = {serial: collections.deque(maxlen=self.history) for serial in self.units}
+        self._map(lambda logger: logger.run())
+        return self.interval
+
+    def _record_unit(self, logger):
+        if self.logger_class is ADC_20:
+            # Missed samples are reported as None, the caller decides when to give up
+            return logger.record(failures=float('inf'))
+        return logger.record()
+
+    def record(self):
+        '''Polls all units concurrently and returns a NumPy array of the form [TIME, UNIT1_DATA1, ..., UNIT2_DATA1...]
+        aligned on TIME as described at the top of this file. Returns None until every unit has a sample within the
+        tolerance of TIME'''
+        for serial, m in zip(self.units, self._map(self._record_unit)):
+            samples = self._samples[serial]
+            if m is not None and (not samples or m[0] != samples[-1][0]):
+                samples.append(m)
+        if not all(self._samples.values()):
+            return None
+        t_ref = min(samples[-1][0] for samples in self._samples.values())
+        chosen = [min(samples, key=lambda m: abs(m[0] - t_ref)) for samples in self._samples.values()]
+        skew = max(abs(m[0] - t_ref) for m in chosen)
+        tolerance = self.tolerance if self.tolerance is not None else self.interval / 2000  # interval is in ms
+        if skew > tolerance:
+            self.stats['unaligned'] += 1
+            return None
+        self.stats['rows'] += 1
+        self.stats['max_skew'] = max(self.stats['max_skew'], skew)
+        merged = [t_ref]
+        for m in chosen:
+            merged.extend(m[1:])
+        return np.array(merged)
+
+    def stop(self):
+        '''Stops all units streaming'''
+        self._map(lambda logger: logger.stop())
+
+    def closeUnits(self):
+        '''Closes the connection to every unit in the group'''
+        for logger in self.units.values():
+            logger.closeUnit()
+        self.units = {}
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -1,15 +1,26 @@
 ### Interface code for Tektronix MSO54 Oscilloscope ###
 # @author: J Bruford, based on MATLAB script written by: G Jones
 import time
-import pyvisa
+try:
+    import pyvisa
+except ImportError as e:
+    # Not needed to run against visa_simulator.SimulatedResourceManager
+    print("Error -> ", e)
+    print('It is recommended to install pyvisa using pip install -U pyvisa')
 import numpy as np
 import copy
 
 from struct import unpack
 
+from ..scpi_batch import BatchMixin
 
-class MSO54:
-    def __init__(self):
+
+class MSO54(BatchMixin):
+    def __init__(self, rm=None):
+        """
+        rm - pyvisa ResourceManager, or a stand-in such as visa_simulator.SimulatedResourceManager. A new
+        pyvisa.ResourceManager if not given
+        """
         self.N_SAMP = 1250  # number of samplestocapture
         self.BIT_NR = 12  # Numberofbitsperwaveformpoint
         self.BYTE_NR = 2  # Number of bytes per waveform point - NOTE: Must change binblockread() precision if this value
@@ -18,7 +29,7 @@ class MSO54:
         self.CHAN = []  # Oscilloscope channels to use - all channels listed must be enabled on scope first otherwise might crash
         self.wave = {}  # output waveform data from scope
         self.status = []
-        self.rm = pyvisa.ResourceManager()
+        self.rm = rm if rm is not None else pyvisa.ResourceManager()
 
     def open(self):
         if hasattr(self, 'inst'):
@@ -49,14 +60,15 @@ class MSO54:
             delattr(self, 'inst')
 
     def set(self):
-        # Currently assumes most setup is done through scope screen interface
-        # Setup trigger - complicated - best done on screen for now
-        self.inst.write('TRIG:A:TYPE EDGE')
-        self.inst.write('TRIG:A:EDGE:SOURCE CH1')
-        self.inst.write('TRIG:A:EDGE:SLOPE FALL')
-        self.inst.write('TRIG:A:LEVEL:CH1 10')
-        self.inst.write('TRIG:A:MODE NORMAL')
-        self.inst.write('ACQuire:StopAfter Sequence')
+        with self.batch():
+            # Currently assumes most setup is done through scope screen interface
+            # Setup trigger - complicated - best done on screen for now
+            self.inst.write('TRIG:A:TYPE EDGE')
+            self.inst.write('TRIG:A:EDGE:SOURCE CH1')
+            self.inst.write('TRIG:A:EDGE:SLOPE FALL')
+            self.inst.write('TRIG:A:LEVEL:CH1 10')
+            self.inst.write('TRIG:A:MODE NORMAL')
+            self.inst.write('ACQuire:StopAfter Sequence')
 
     def set_edge_trigger(self,source,direction, level, coupling="NOISEREJ"):
         """
@@ -72,13 +84,14 @@ class MSO54:
             trigger signal amplitude.)
 
         """
-        self.inst.write('TRIG:A:TYPE EDGE')
-        self.inst.write('TRIG:A:EDGE:SOURCE CH'+str(source))
-        self.inst.write('TRIG:A:EDGE:SLOPE ' +  direction)
-        self.inst.write('TRIG:A:EDGE:COUPLING '+ coupling)
-        self.inst.write('TRIG:A:LEVEL ' + str(level))
-        self.inst.write('TRIG:A:MODE NORMAL')
-        self.inst.write('ACQuire:StopAfter Sequence')
+        with self.batch():
+            self.inst.write('TRIG:A:TYPE EDGE')
+            self.inst.write('TRIG:A:EDGE:SOURCE CH'+str(source))
+            self.inst.write('TRIG:A:EDGE:SLOPE ' +  direction)
+            self.inst.write('TRIG:A:EDGE:COUPLING '+ coupling)
+            self.inst.write('TRIG:A:LEVEL ' + str(level))
+            self.inst.write('TRIG:A:MODE NORMAL')
+            self.inst.write('ACQuire:StopAfter Sequence')
 
     def set_pulsewidth_trigger(self,source,level, when="LESS", highLimit=0,lowLimit=150e-9,logicQualification="OFF",polarity="POSITIVE"):
         """
@@ -93,16 +106,17 @@ class MSO54:
         logicQualification: specifies whether to use logic qualification for a pulse width trigger (ON or OFF)
         polarity: NEGATIVE or POSITIVE
         """
-        self.inst.write('TRIG:A:TYPE WIDTH')
-        self.inst.write('TRIG:A:PULSEWIDTH:HIGHLIMIT '+str(highLimit))
-        self.inst.write('TRIG:A:PULSEWIDTH:LOWLIMIT '+str(lowLimit))
-        self.inst.write('TRIG:A:PULSEWIDTH:LOGICQUALIFICATION '+str(logicQualification))
-        self.inst.write('TRIG:A:PULSEWIDTH:POLARITY '+str(polarity))
-        self.inst.write('TRIG:A:PULSEWIDTH:SOURCE CH'+str(source))
-        self.inst.write('TRIG:A:PULSEWIDTH:WHEN '+str(when))
-        self.inst.write('TRIG:A:LEVEL:CH'+str(source)+' '+str(level))
-        self.inst.write('TRIG:A:MODE NORMAL')
-        self.inst.write('ACQuire:StopAfter Sequence')
+        with self.batch():
+            self.inst.write('TRIG:A:TYPE WIDTH')
+            self.inst.write('TRIG:A:PULSEWIDTH:HIGHLIMIT '+str(highLimit))
+            self.inst.write('TRIG:A:PULSEWIDTH:LOWLIMIT '+str(lowLimit))
+            self.inst.write('TRIG:A:PULSEWIDTH:LOGICQUALIFICATION '+str(logicQualification))
+            self.inst.write('TRIG:A:PULSEWIDTH:POLARITY '+str(polarity))
+            self.inst.write('TRIG:A:PULSEWIDTH:SOURCE CH'+str(source))
+            self.inst.write('TRIG:A:PULSEWIDTH:WHEN '+str(when))
+            self.inst.write('TRIG:A:LEVEL:CH'+str(source)+' '+str(level))
+            self.inst.write('TRIG:A:MODE NORMAL')
+            self.inst.write('ACQuire:StopAfter Sequence')
 
 
     def run(self):
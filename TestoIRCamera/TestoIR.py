@@ -1,75 +1,265 @@
+import collections
+import threading
 import time
 
-import cv2
 import datetime
-import scipy.io
 
-def test(log=False, imagetype="gray", Speriod = 0, cameraNum =0):
-    frames2log = []
-    times2log = []
+from .ir_calibration import IRCalibration
+from .ir_codec import IRCodecReader, IRCodecWriter
+from .ir_recorder import IRFrameRecorder, IRFrameStore
 
-    cv2.namedWindow("preview")
-    vc = cv2.VideoCapture(cameraNum)
-    if vc.isOpened():
-        rval, frame = vc.read()
-        if imagetype == "gray":
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        elif imagetype =="rgb":
-            pass
+def test(log=False, imagetype="gray", Speriod = 0, cameraNum =0, export_mat=False, display=True, display_period=0.05,
+         duration=None, compress=False):
+    """
+    Shows the camera feed until ESC is pressed (or Ctrl+C, or for duration seconds). If log is True a frame is recorded
+    every Speriod seconds, streamed to an IRframes_<date> directory by IRFrameRecorder (read it back with IRFrameStore).
+    If export_mat is True the recording is also saved as IRframes_<date>.mat at the end. With display False nothing is
+    shown, and frames which are not logged are never decoded, see CaptureScheduler. With compress True the frames are
+    written losslessly compressed to IRframes_<date>.irc instead (read it back with IRCodecReader)
+    """
+    if imagetype not in ("gray", "rgb"):
+        raise ValueError("imagetype is not a valid input")
+    import cv2  # imported on use, so the rest of the package works on machines without OpenCV
+    recorder = None
+    if log:
+        name = 'IRframes_' + datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        if compress:
+            name += '.irc'
+            recorder = IRCodecWriter(name)
         else:
-            raise ValueError("imagetype is not a valid input")
-        if log:
-            frames2log.append(frame)
-            times2log.append(time.time())
-
-
-    else:
-        rval = False
-
-    t = time.time()
-    while rval:
-        cv2.imshow("preview", frame)
-        rval, frame = vc.read()
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        if log and time.time()-t > Speriod:
-            frames2log.append(frame)
-            times2log.append(time.time())
-            t = time.time()
-        key = cv2.waitKey(20)
-        if key == 27: # exit on ESC
-            break
+            recorder = IRFrameRecorder(name)
+        recorder.start()
+
+    vc = cv2.VideoCapture(cameraNum)
+    scheduler = CaptureScheduler(vc, Speriod if log else None, imagetype, display_period if display else None)
+    try:
+        if vc.isOpened():
+            scheduler.run(recorder.write if log else None, duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if display:
+            cv2.destroyWindow(scheduler.window)
+        vc.release()
     if log:
-        filename = 'IRframes_' + datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + '.mat'
-        datadict = {"IRframes": frames2log,
-                    "frameTimes": times2log}
-        # save to mat file
-        scipy.io.savemat(filename, datadict)
-    cv2.destroyWindow("preview")
-    vc.release()
+        recorder.stop()
+        print('Recorded', recorder.stats['written'], 'frames to', name)
+        if export_mat:
+            store = IRCodecReader(name) if compress else IRFrameStore(name)
+            store.export_mat(name.replace('.irc', '') + '.mat')
+
+
+class CaptureScheduler:
+    """
+    Reads a camera at its own frame rate but only decodes and converts the frames which are kept or shown. Every frame
+    is taken from the driver with grab(), which does not decode it, so the newest frame is always the one retrieved.
+    retrieve() and the colour conversion run only when a frame is due to be kept (every Speriod seconds) or displayed
+    (every display_period seconds). Frame times are taken from time.monotonic() at the grab and given as wall clock
+    time, so they are evenly spaced even if the system clock is adjusted during a run
+    """
+    def __init__(self, vc, Speriod=0, imagetype="gray", display_period=None, window="preview"):
+        """
+        vc - opened cv2.VideoCapture
+        Speriod - float     seconds between kept frames, 0 to keep every frame, None to keep none
+        display_period - float  seconds between display updates, None for no display
+        """
+        if imagetype not in ("gray", "rgb"):
+            raise ValueError("imagetype parameter must be 'rgb' or 'gray'")
+        self.vc = vc
+        self.Speriod = Speriod
+        self.imagetype = imagetype
+        self.display_period = display_period
+        self.window = window
+        self.stats = {'grabbed': 0, 'kept': 0, 'displayed': 0, 'failures': 0}
+        self._wall0 = time.time()
+        self._mono0 = time.monotonic()
+
+    def timestamp(self, monotonic):
+        """Converts a time.monotonic() reading to wall clock time on the scheduler's time base"""
+        return self._wall0 + (monotonic - self._mono0)
+
+    def run(self, on_frame=None, duration=None):
+        """
+        Captures until ESC is pressed in the display window, duration seconds have passed or the camera fails.
+        on_frame(frame, t) is called with every kept frame and its time
+        """
+        import cv2
+        if self.display_period is not None:
+            cv2.namedWindow(self.window)
+        start = time.monotonic()
+        next_keep = start
+        next_show = start
+        while duration is None or time.monotonic() - start < duration:
+            if not self.vc.grab():
+                self.stats['failures'] += 1
+                break
+            now = time.monotonic()
+            self.stats['grabbed'] += 1
+            keep = self.Speriod is not None and now >= next_keep
+            show = self.display_period is not None and now >= next_show
+            if not (keep or show):
+                continue
+            rval, frame = self.vc.retrieve()
+            if not rval:
+                self.stats['failures'] += 1
+                break
+            if self.imagetype == "gray":
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if keep:
+                if on_frame is not None:
+                    on_frame(frame, self.timestamp(now))
+                self.stats['kept'] += 1
+                next_keep = self._next(next_keep, self.Speriod, now)
+            if show:
+                cv2.imshow(self.window, frame)
+                self.stats['displayed'] += 1
+                next_show = self._next(next_show, self.display_period, now)
+                if cv2.waitKey(1) == 27:  # exit on ESC
+                    break
+
+    @staticmethod
+    def _next(due, period, now):
+        """Next due time on the period grid after now, skipping slots that were missed"""
+        if period <= 0:
+            return now
+        due += period
+        if due <= now:
+            due += (int((now - due) / period) + 1) * period
+        return due
+
 
 class TestoIR:
-    def __init__(self, cameraNum =0):
+    def __init__(self, cameraNum =0, threaded=False, buffer_frames=4, calibration=None):
+        """
+        threaded - bool     start a background capture thread straight away, see startCapture
+        buffer_frames - int number of newest frames kept by the capture thread
+        calibration - IRCalibration or path of a calibration file, used by getTemperatureFrame
+        """
+        import cv2
         self.vc = cv2.VideoCapture(cameraNum)
         if self.vc.isOpened():
             pass
         else:
             raise IOError("Could not connect to camera, try alternative camera input")
-    def getFrame(self, imagetype = "gray"):
-        """ imagetype can be rgb or grey"""
-        if self.vc.isOpened():
+        self.stats = {'captured': 0, 'read_failures': 0, 'dropped': 0}
+        self.frames = collections.deque(maxlen=buffer_frames)  # (index, time.time(), rgb frame, gray frame)
+        self._delivered = -1  # index of the newest frame returned by getFrame
+        self._cv = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.calibration = None
+        if calibration is not None:
+            self.setCalibration(calibration)
+        if threaded:
+            self.startCapture()
+
+    def setCalibration(self, calibration):
+        """calibration - IRCalibration or path of a calibration file"""
+        if isinstance(calibration, str):
+            calibration = IRCalibration.from_file(calibration)
+        self.calibration = calibration
+
+    def getTemperatureFrame(self, fresh=False, timeout=1.0, out=None):
+        """As getFrame, converted to degC with the calibration lookup table. out is an optional float32 array the
+        size of a frame to write into"""
+        if self.calibration is None:
+            raise ValueError("No calibration set, see setCalibration")
+        return self.calibration.apply(self.getFrame("gray", fresh, timeout), out)
+
+    def startCapture(self):
+        """
+        Starts a thread which reads frames continuously into self.frames with their capture time, so getFrame returns
+        the newest frame at once instead of waiting a frame period for a frame which OpenCV may have buffered for a
+        while. The grayscale conversion is done on the capture thread
+        """
+        if self._thread is not None:
+            return
+        import cv2
+        self.vc.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # ignored by backends which do not support it
+        self._running = True
+        self._thread = threading.Thread(target=self._capture, name='TestoIR', daemon=True)
+        self._thread.start()
+
+    def stopCapture(self):
+        with self._cv:
+            self._running = False
+            self._cv.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def release(self):
+        """Stops the capture thread and releases the camera"""
+        self.stopCapture()
+        self.vc.release()
+
+    def _capture(self):
+        import cv2
+        index = 0
+        while self._running:
             rval, frame = self.vc.read()
-        else:
-            rval = False
-        if not rval:
-            raise IOError("Could not get frame from camera")
-        else:
+            t = time.time()
+            if not rval:
+                self.stats['read_failures'] += 1
+                time.sleep(0.01)
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            with self._cv:
+                if self.frames and self.frames[-1][0] > self._delivered:
+                    self.stats['dropped'] += 1  # the previous newest frame was never returned
+                self.frames.append((index, t, frame, gray))
+                self.stats['captured'] += 1
+                self._cv.notify_all()
+            index += 1
+
+    def waitForFrame(self, after=None, timeout=1.0):
+        """Blocks until the capture thread has a frame captured later than time 'after' (time.time(), any frame if None)
+        and returns its capture time"""
+        with self._cv:
+            if not self._cv.wait_for(lambda: self.frames and (after is None or self.frames[-1][1] > after)
+                                     or not self._running, timeout):
+                raise IOError("Could not get frame from camera, none captured within " + str(timeout) + " s")
+            if not self.frames or (after is not None and self.frames[-1][1] <= after):
+                raise IOError("Could not get frame from camera, capture stopped")
+            return self.frames[-1][1]
+
+    def bufferedFrames(self, imagetype = "gray"):
+        """Returns [(capture time, frame)] for the frames held by the capture thread, oldest first"""
+        with self._cv:
+            frames = list(self.frames)
+        return [(t, gray if imagetype == "gray" else frame) for index, t, frame, gray in frames]
+
+    def getFrame(self, imagetype = "gray", fresh=False, timeout=1.0):
+        """ imagetype can be rgb or grey
+        With the capture thread running the newest frame is returned without waiting, or if fresh is True the first
+        frame captured after the call, waiting up to timeout seconds for it"""
+        return self.getTimedFrame(imagetype, fresh, timeout)[1]
+
+    def getTimedFrame(self, imagetype = "gray", fresh=False, timeout=1.0):
+        """ As getFrame but returns (capture time, frame), the time being time.time() when the frame was read"""
+        if imagetype not in ("gray", "rgb"):
+            raise ValueError("imagetype parameter must be 'rgb' or 'gray'")
+        if self._thread is None:
+            if self.vc.isOpened():
+                rval, frame = self.vc.read()
+            else:
+                rval = False
+            if not rval:
+                raise IOError("Could not get frame from camera")
+            t = time.time()
             if imagetype == "gray":
+                import cv2
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            elif imagetype == "rgb":
-                pass
-            else:
-                raise ValueError("imagetype parameter must be 'rgb' or 'gray'")
-            return frame
+            return t, frame
+        with self._cv:
+            after = self.frames[-1][0] if fresh and self.frames else -1
+            if not self._cv.wait_for(lambda: self.frames and self.frames[-1][0] > after or not self._running, timeout):
+                raise IOError("Could not get frame from camera, none captured within " + str(timeout) + " s")
+            if not self.frames or self.frames[-1][0] <= after:
+                raise IOError("Could not get frame from camera, capture stopped")
+            index, t, frame, gray = self.frames[-1]
+            self._delivered = index
+        return t, gray if imagetype == "gray" else frame
 
 if __name__ == "__main__":
     test(log=True, Speriod= 10)
\ No newline at end of file
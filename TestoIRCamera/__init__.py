@@ -1 +1,6 @@
-from .TestoIR import *
\ No newline at end of file
+from .TestoIR import *
+from .ir_recorder import *
+from .ir_analytics import *
+from .ir_calibration import *
+from .ir_group import *
+from .ir_codec import *
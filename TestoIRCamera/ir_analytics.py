@@ -0,0 +1,144 @@
+"""Vectorised analysis of IR frame stacks: per-ROI statistics and hotspot position for every frame, per-pixel maximum
+and the frame it occurred in, and a per-pixel rate of rise (least squares slope against time).
+
+The source can be a frames x height x width NumPy array or a recording (IRFrameStore or IRCodecReader). It is
+processed in blocks of block_frames frames converted to float32, so memory use is set by the block size and the
+per-frame results rather than the recording length. ThermalSummary can also be fed blocks as they arrive for live use,
+and summarise_latest analyses only the newest frames of a recording in progress.
+
+Values are in the units of the frames, raw camera counts unless they have been calibrated.
+"""
+
+import numpy as np
+
+from .ir_codec import IRCodecReader
+from .ir_recorder import IRFrameStore
+
+
+def frame_blocks(source, times=None, start=0, stop=None, block_frames=64):
+    """
+    Yields (index of the first frame, frames, times) for consecutive blocks of a frame stack or a recording
+    (IRFrameStore or IRCodecReader)
+    times - array of frame times for an array source, the frame index is used if not given. A recording has its own
+    """
+    n = len(source)
+    if stop is None or stop > n:
+        stop = n
+    if start < 0:
+        start = max(n + start, 0)
+    for first in range(start, stop, block_frames):
+        last = min(first + block_frames, stop)
+        if isinstance(source, (IRFrameStore, IRCodecReader)):
+            yield first, source.frames(first, last), source.times(first, last)
+        else:
+            block_times = np.arange(first, last, dtype=np.float64) if times is None else np.asarray(times[first:last])
+            yield first, np.asarray(source[first:last]), block_times
+
+
+class ThermalSummary:
+    def __init__(self, rois=None):
+        """
+        rois - dict of name: (row start, row stop, column start, column stop) or a boolean mask the size of a frame
+        """
+        self.rois = rois or {}
+        self.frames = 0
+        self.max_map = None
+        self.argmax_map = None  # index of the frame each pixel's maximum was in
+        self.time_of_max = None
+        self._roi_blocks = {name: [] for name in self.rois}
+        self._hotspot_blocks = []
+        self._time_blocks = []
+        self._t0 = None
+        # Running sums for the per-pixel least squares slope
+        self._s_t = 0.0
+        self._s_tt = 0.0
+        self._s_y = None
+        self._s_ty = None
+
+    def update(self, frames, times, first=None):
+        """Adds a block of frames (frames x height x width) with their times. first is the index of the block's first
+        frame, by default the number of frames seen so far"""
+        if first is None:
+            first = self.frames
+        frames = np.asarray(frames, dtype=np.float32)
+        times = np.asarray(times, dtype=np.float64)
+        n, height, width = frames.shape
+        if self.max_map is None:
+            self.max_map = np.full((height, width), -np.inf)
+            self.argmax_map = np.zeros((height, width), dtype=np.int64)
+            self.time_of_max = np.full((height, width), np.nan)
+            self._s_y = np.zeros((height, width))
+            self._s_ty = np.zeros((height, width))
+            self._t0 = times[0]
+
+        # Per-ROI statistics of every frame
+        for name, roi in self.rois.items():
+            if isinstance(roi, np.ndarray):
+                pixels = frames[:, roi]
+            else:
+                r0, r1, c0, c1 = roi
+                pixels = frames[:, r0:r1, c0:c1].reshape(n, -1)
+            self._roi_blocks[name].append(np.stack((pixels.mean(axis=1, dtype=np.float64),
+                                                    pixels.std(axis=1, dtype=np.float64),
+                                                    pixels.min(axis=1), pixels.max(axis=1)), axis=1))
+
+        # Hotspot of every frame
+        flat = frames.reshape(n, -1)
+        hottest = flat.argmax(axis=1)
+        self._hotspot_blocks.append(np.stack((hottest // width, hottest % width, flat[np.arange(n), hottest]), axis=1))
+        self._time_blocks.append(times)
+
+        # Per-pixel maximum over time
+        block_max = frames.max(axis=0)
+        block_argmax = frames.argmax(axis=0)
+        newer = block_max > self.max_map
+        self.max_map[newer] = block_max[newer]
+        self.argmax_map[newer] = first + block_argmax[newer]
+        self.time_of_max[newer] = times[block_argmax[newer]]
+
+        t = times - self._t0
+        self._s_t += t.sum()
+        self._s_tt += (t * t).sum()
+        self._s_y += frames.sum(axis=0, dtype=np.float64)
+        self._s_ty += np.tensordot(t.astype(np.float32), frames, axes=1)
+        self.frames += n
+
+    def rise_rate(self):
+        """Returns the least squares slope of every pixel against time, in frame units per time unit"""
+        n = self.frames
+        denominator = n * self._s_tt - self._s_t ** 2
+        if n < 2 or denominator == 0:
+            return np.zeros_like(self._s_y) if self._s_y is not None else None
+        return (n * self._s_ty - self._s_t * self._s_y) / denominator
+
+    def result(self):
+        """
+        Returns a dict of
+        times - time of every frame
+        roi - {name: frames x 4 array of mean, std, min, max}
+        hotspot - frames x 3 array of row, column and value of the hottest pixel
+        max_map, argmax_map, time_of_max - per-pixel maximum, the frame index and time it occurred at
+        rise_rate - per-pixel slope against time
+        """
+        def joined(blocks, width):
+            return np.concatenate(blocks) if blocks else np.zeros((0, width))
+        return {'times': np.concatenate(self._time_blocks) if self._time_blocks else np.zeros(0),
+                'roi': {name: joined(blocks, 4) for name, blocks in self._roi_blocks.items()},
+                'hotspot': joined(self._hotspot_blocks, 3),
+                'max_map': self.max_map, 'argmax_map': self.argmax_map, 'time_of_max': self.time_of_max,
+                'rise_rate': self.rise_rate()}
+
+
+def summarise(source, times=None, rois=None, start=0, stop=None, block_frames=64):
+    """Runs ThermalSummary over frames start to stop-1 of a frame stack or IRFrameStore in one pass, see
+    ThermalSummary.result for what is returned"""
+    summary = ThermalSummary(rois)
+    for first, frames, block_times in frame_blocks(source, times, start, stop, block_frames):
+        summary.update(frames, block_times, first)
+    return summary.result()
+
+
+def summarise_latest(source, n, times=None, rois=None, block_frames=64):
+    """As summarise for the newest n frames. Call store.refresh() first to include frames recorded since the store was
+    opened"""
+    return summarise(source, times, rois, start=max(len(source) - n, 0), block_frames=block_frames)
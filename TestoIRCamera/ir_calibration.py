@@ -0,0 +1,107 @@
+"""Conversion of IR camera grayscale frames to temperature through a precomputed lookup table, so a whole frame is
+converted with one np.take instead of a per-pixel formula in floating point.
+
+A calibration is kept in a JSON file, e.g.
+
+    {"name": "testo 0-100C", "range": [0, 100], "emissivity": 0.95, "reflected_temperature": 21,
+     "reference_points": [[12, 5.0], [240, 95.0]], "bits": 8}
+
+range - temperatures (degC) of the lowest and highest gray level of the camera's scale, used if no reference points
+reference_points - [gray level, degC] pairs measured against a reference, interpolated linearly between points
+emissivity, reflected_temperature - the camera image is taken as the apparent temperature of a black body, corrected
+    for an object of this emissivity reflecting surroundings at reflected_temperature (degC)
+bits - 8 for 256 gray levels or 16 for 65536
+"""
+
+import json
+import os
+
+import numpy as np
+
+_TABLES = {}  # calibration key: lookup table, shared by equal calibrations
+_FILES = {}  # (path, modification time): IRCalibration
+
+
+class IRCalibration:
+    def __init__(self, range=(0.0, 100.0), reference_points=None, emissivity=1.0, reflected_temperature=20.0, bits=8,
+                 name=None):
+        if bits not in (8, 16):
+            raise ValueError("bits must be 8 or 16")
+        if not 0 < emissivity <= 1:
+            raise ValueError("emissivity must be greater than 0 and no more than 1")
+        if reference_points is not None and len(reference_points) < 2:
+            raise ValueError("At least two reference points are needed")
+        self.range = tuple(range)
+        self.reference_points = sorted(tuple(p) for p in reference_points) if reference_points is not None else None
+        self.emissivity = emissivity
+        self.reflected_temperature = reflected_temperature
+        self.bits = bits
+        self.name = name
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads a calibration file. Loaded files are cached until they are modified"""
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        calibration = _FILES.get(key)
+        if calibration is None:
+            with open(path) as f:
+                settings = json.load(f)
+            calibration = cls(**settings)
+            _FILES[key] = calibration
+        return calibration
+
+    def to_file(self, path):
+        with open(path, 'w') as f:
+            json.dump({'name': self.name, 'range': list(self.range), 'reference_points': self.reference_points,
+                       'emissivity': self.emissivity, 'reflected_temperature': self.reflected_temperature,
+                       'bits': self.bits}, f, indent=4)
+
+    def key(self):
+        return (self.range, tuple(self.reference_points or ()), self.emissivity, self.reflected_temperature, self.bits)
+
+    @property
+    def table(self):
+        """float32 array of the temperature (degC) of every gray level, built on first use"""
+        key = self.key()
+        table = _TABLES.get(key)
+        if table is None:
+            table = self._build_table()
+            table.flags.writeable = False
+            _TABLES[key] = table
+        return table
+
+    def _build_table(self):
+        levels = np.arange(2 ** self.bits, dtype=np.float64)
+        if self.reference_points is not None:
+            gray, temperature = zip(*self.reference_points)
+            # np.interp holds the end values, extend the first and last segments instead
+            apparent = np.interp(levels, gray, temperature)
+            below = levels < gray[0]
+            above = levels > gray[-1]
+            apparent[below] = temperature[0] + (levels[below] - gray[0]) * (temperature[1] - temperature[0]) / (
+                gray[1] - gray[0])
+            apparent[above] = temperature[-1] + (levels[above] - gray[-1]) * (temperature[-1] - temperature[-2]) / (
+                gray[-1] - gray[-2])
+        else:
+            t_min, t_max = self.range
+            apparent = t_min + levels * (t_max - t_min) / (2 ** self.bits - 1)
+        if self.emissivity != 1:
+            # Total radiance balance: apparent^4 = e * object^4 + (1 - e) * reflected^4, in kelvin
+            apparent_k4 = (apparent + 273.15) ** 4
+            reflected_k4 = (self.reflected_temperature + 273.15) ** 4
+            object_k4 = np.clip((apparent_k4 - (1 - self.emissivity) * reflected_k4) / self.emissivity, 0, None)
+            apparent = object_k4 ** 0.25 - 273.15
+        return apparent.astype(np.float32)
+
+    def apply(self, frame, out=None):
+        """Returns the frame converted to degC. frame must be an integer grayscale image, out an optional float32 array
+        of the same shape to write into rather than allocating"""
+        if frame.dtype.kind not in 'ui':
+            raise ValueError("frame must be an integer grayscale image, not " + str(frame.dtype))
+        return np.take(self.table, frame, out=out, mode='clip')
+
+
+def clear_calibration_cache():
+    """Forgets cached lookup tables and calibration files"""
+    _TABLES.clear()
+    _FILES.clear()
@@ -0,0 +1,297 @@
+"""Lossless compressed recording format for IR frames. IR scenes change slowly, so most frames are stored as the
+difference from the previous frame, which is mostly zeros and compresses well with zlib. Every keyframe_interval
+frames a whole frame (keyframe) is stored, so any frame can be decoded from the keyframe before it without reading the
+file from the start.
+
+File layout (little endian):
+    b'IRC1', uint16 header length, JSON header {"dtype", "shape", "keyframe_interval"}
+    one record per frame: uint8 kind (0 keyframe, 1 delta), float64 time, uint32 payload length, zlib payload
+    index written on close: b'IDX1', uint64 count, uint64 offsets[count], float64 times[count], uint8 kinds[count],
+    then uint64 position of b'IDX1' and b'IEND'
+A file which was not closed (crash or kill) has no index; the reader rebuilds it by scanning the records and drops a
+truncated last record.
+
+As with IRFrameRecorder, frames are compressed and written by a background thread fed from a bounded queue, and the file
+is flushed every flush_interval seconds, so the capture loop never waits for zlib or the disk.
+
+Differences are taken as unsigned integers of the frame's item size with wrap around, so decoding is exact for any
+dtype.
+"""
+
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .ir_recorder import IRFrameStore
+
+MAGIC = b'IRC1'
+KEYFRAME = 0
+DELTA = 1
+_RECORD = struct.Struct('<BdI')  # kind, time, payload length
+_INDEX_HEAD = struct.Struct('<4sQ')
+_TRAILER = struct.Struct('<Q4s')
+
+
+class IRCodecWriter:
+    def __init__(self, path, keyframe_interval=100, level=1, queue_frames=64, flush_interval=5.0):
+        """
+        path - str  file to create
+        keyframe_interval - int     frames between keyframes, the most frames decoded to seek to any frame
+        level - int zlib compression level, 1 is fastest
+        queue_frames - int  frames waiting for the writer thread before write starts dropping them
+        flush_interval - float  seconds between flushes of the file to disk
+        """
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.flush_interval = flush_interval
+        self.stats = {'written': 0, 'dropped': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'flushes': 0}
+        self.error = None  # exception which stopped the writer thread
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._thread = None
+        self._file = None
+        self._previous = None  # previous frame as unsigned integers
+        self._shape = None
+        self._dtype = None
+        self._offsets = []
+        self._times = []
+        self._kinds = []
+
+    def start(self):
+        """Creates the file and starts the writer thread. The header is written with the first frame, which sets the
+        dtype and shape"""
+        if self._thread is not None:
+            return
+        self._file = open(self.path, 'xb')
+        self._thread = threading.Thread(target=self._write_loop, name='IRCodecWriter', daemon=True)
+        self._thread.start()
+
+    def write(self, frame, t=None):
+        """Queues a frame to be compressed and appended, with its capture time (time.time() now if not given). Never
+        blocks; returns False and counts the frame as dropped if the writer has fallen queue_frames behind. Raises
+        IOError once the writer thread has stopped on an error"""
+        if self._thread is None:
+            raise IOError("Writer not started")
+        if self.error is not None:
+            raise IOError("Writer stopped after an error: " + str(self.error))
+        frame = np.asarray(frame)
+        if self._shape is None:
+            self._shape = frame.shape
+            self._dtype = frame.dtype
+        elif frame.shape != self._shape or frame.dtype != self._dtype:
+            raise ValueError("All frames in a recording must have the same shape and dtype")
+        try:
+            self._queue.put_nowait((time.time() if t is None else t, frame))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        return True
+
+    def stop(self):
+        """Writes out the frames still queued, then the index, and closes the file"""
+        if self._thread is None:
+            return
+        # Not a plain put: if the writer has died (see error) with the queue full it would block forever
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._thread = None
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = False  # nothing arrived, only flush
+                if item is None:
+                    break
+                if item:
+                    self._append(*item)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._file.flush()
+                    self.stats['flushes'] += 1
+                    last_flush = time.monotonic()
+            self._write_index()
+        except Exception as e:
+            self.error = e
+            print('Error occurred while writing IR frames, recording stopped.\nError:\n', e)
+        finally:
+            # Without an index the reader rebuilds it from the records
+            self._file.close()
+            self._file = None
+
+    def _append(self, t, frame):
+        frame = np.ascontiguousarray(frame)
+        if self._previous is None:
+            header = json.dumps({'dtype': frame.dtype.str, 'shape': frame.shape,
+                                 'keyframe_interval': self.keyframe_interval}).encode('ascii')
+            self._file.write(MAGIC + struct.pack('<H', len(header)) + header)
+        unsigned = frame.view('u' + str(frame.dtype.itemsize))
+        if len(self._offsets) % self.keyframe_interval == 0:
+            kind, data = KEYFRAME, unsigned
+        else:
+            kind, data = DELTA, unsigned - self._previous  # wraps around in the unsigned type
+        payload = zlib.compress(data.tobytes(), self.level)
+        self._offsets.append(self._file.tell())
+        self._times.append(t)
+        self._kinds.append(kind)
+        self._file.write(_RECORD.pack(kind, self._times[-1], len(payload)))
+        self._file.write(payload)
+        self._previous = unsigned.copy()
+        self.stats['written'] += 1
+        self.stats['raw_bytes'] += frame.nbytes
+        self.stats['stored_bytes'] += _RECORD.size + len(payload)
+
+    def _write_index(self):
+        position = self._file.tell()
+        count = len(self._offsets)
+        self._file.write(_INDEX_HEAD.pack(b'IDX1', count))
+        self._file.write(np.array(self._offsets, dtype='<u8').tobytes())
+        self._file.write(np.array(self._times, dtype='<f8').tobytes())
+        self._file.write(np.array(self._kinds, dtype='u1').tobytes())
+        self._file.write(_TRAILER.pack(position, b'IEND'))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class IRCodecReader:
+    """Random access to a recording made by IRCodecWriter, with the same frames/times interface as IRFrameStore"""
+    export_mat = IRFrameStore.export_mat
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        if self._file.read(4) != MAGIC:
+            raise IOError(path + " is not an IR codec recording")
+        header_length, = struct.unpack('<H', self._file.read(2))
+        header = json.loads(self._file.read(header_length))
+        self.dtype = np.dtype(header['dtype'])
+        self.shape = tuple(header['shape'])
+        self.keyframe_interval = header['keyframe_interval']
+        self._data_start = 6 + header_length
+        self._unsigned = np.dtype('u' + str(self.dtype.itemsize))
+        self._cached = None  # (index, unsigned frame) of the last frame decoded, for sequential reads
+        if not self._read_index():
+            self._scan()
+
+    def _read_index(self):
+        f = self._file
+        f.seek(0, 2)
+        end = f.tell()
+        if end < self._data_start + _TRAILER.size:
+            return False
+        f.seek(end - _TRAILER.size)
+        position, tag = _TRAILER.unpack(f.read(_TRAILER.size))
+        if tag != b'IEND':
+            return False
+        f.seek(position)
+        magic, count = _INDEX_HEAD.unpack(f.read(_INDEX_HEAD.size))
+        if magic != b'IDX1':
+            return False
+        self._offsets = np.frombuffer(f.read(8 * count), dtype='<u8')
+        self._times = np.frombuffer(f.read(8 * count), dtype='<f8')
+        self._kinds = np.frombuffer(f.read(count), dtype='u1')
+        return True
+
+    def _scan(self):
+        """Rebuilds the index of a file which was not closed, ignoring a truncated last record"""
+        f = self._file
+        f.seek(0, 2)
+        end = f.tell()
+        offsets, times, kinds = [], [], []
+        position = self._data_start
+        while position + _RECORD.size <= end:
+            f.seek(position)
+            kind, t, length = _RECORD.unpack(f.read(_RECORD.size))
+            if position + _RECORD.size + length > end:
+                break
+            offsets.append(position)
+            times.append(t)
+            kinds.append(kind)
+            position += _RECORD.size + length
+        self._offsets = np.array(offsets, dtype='<u8')
+        self._times = np.array(times, dtype='<f8')
+        self._kinds = np.array(kinds, dtype='u1')
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _payload(self, index):
+        self._file.seek(int(self._offsets[index]))
+        kind, t, length = _RECORD.unpack(self._file.read(_RECORD.size))
+        data = np.frombuffer(zlib.decompress(self._file.read(length)), dtype=self._unsigned)
+        return kind, data.reshape(self.shape)
+
+    def _decode(self, index):
+        if self._cached is not None and self._cached[0] <= index and index - self._cached[0] < self.keyframe_interval:
+            first, frame = self._cached  # carry on from the last frame decoded
+            first += 1
+        else:
+            first, frame = index, None
+        # Walk back to the keyframe unless a later keyframe than the cached frame comes first
+        keyframe = index
+        while self._kinds[keyframe] != KEYFRAME:
+            keyframe -= 1
+        if frame is None or keyframe >= first:
+            first = keyframe
+        for k in range(first, index + 1):
+            kind, data = self._payload(k)
+            frame = data.copy() if kind == KEYFRAME else frame + data
+        self._cached = (index, frame)
+        return frame
+
+    def __getitem__(self, index):
+        """reader[k] is frame k, reader[a:b:c] the frames selected as for a list, as one array"""
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            if indices.step == 1 or not indices:
+                return self.frames(indices.start, max(indices.start, indices.stop))
+            if indices.step < 0:
+                # Decode forwards, each delta builds on the frame before it
+                return self[indices[-1]:indices[0] + 1:-indices.step][::-1]
+            out = np.empty((len(indices),) + self.shape, dtype=self.dtype)
+            for n, k in enumerate(indices):
+                out[n] = self._decode(k).view(self.dtype)
+            return out
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return self._decode(index).view(self.dtype).copy()
+
+    def frames(self, start=0, stop=None):
+        """Returns frames start to stop-1 as one array"""
+        if stop is None or stop > len(self):
+            stop = len(self)
+        out = np.empty((max(stop - start, 0),) + self.shape, dtype=self.dtype)
+        for k in range(start, stop):
+            out[k - start] = self._decode(k).view(self.dtype)
+        return out
+
+    def times(self, start=0, stop=None):
+        return np.array(self._times[start:stop])
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
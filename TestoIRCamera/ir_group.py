@@ -0,0 +1,126 @@
+"""Several IR cameras looking at the same DUT. Each camera is read by its own TestoIR capture thread, so adding a camera
+does not slow the others down. Frames are matched across cameras by capture time, and a recording holds one entry per
+synchronised set of frames.
+
+A recording made by IRCameraGroup.startRecording is one IRFrameStore recording whose time is the reference time of each
+set. Entry k is a record with two fields, so a set's frames and camera times are written, or dropped, together:
+frames - a cameras x height x width stack, the frames of set k (all cameras must give the same frame size)
+times - the capture time of each camera's frame in set k
+e.g. IRFrameStore(directory)[k]['frames'], or IRFrameStore(directory).frames()['times'] for the times of every set.
+A set is dropped if the writer falls behind or a camera fails to deliver a frame for it.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from .TestoIR import TestoIR
+from .ir_recorder import IRFrameRecorder
+
+
+class IRCameraGroup:
+    def __init__(self, camera_nums, buffer_frames=8):
+        """
+        camera_nums - list of int   cv2 camera indices
+        buffer_frames - int frames kept per camera to match times from, should cover the largest expected skew
+        """
+        self.stats = {'sets': 0, 'dropped': 0, 'camera_errors': 0, 'max_skew': 0.0}
+        self.error = None  # exception which stopped a recording
+        self.last_camera_error = None  # exception of the last set dropped because a camera failed
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._recorder = None
+        self.cameras = []
+        try:
+            for camera_num in camera_nums:
+                self.cameras.append(TestoIR(camera_num, threaded=True, buffer_frames=buffer_frames))
+        except IOError:
+            self.release()
+            raise
+
+    def getFrames(self, imagetype="gray", fresh=False, timeout=1.0):
+        """
+        Returns (reference time, [frame of each camera], [capture time of each frame]). The reference time is the newest
+        time every camera has a frame for, and each camera's frame is the buffered one captured nearest to it. If fresh
+        is True every camera must have captured a frame after the call
+        """
+        after = time.time() if fresh else None
+        for camera in self.cameras:
+            camera.waitForFrame(after, timeout)
+        buffered = [camera.bufferedFrames(imagetype) for camera in self.cameras]
+        t_ref = min(frames[-1][0] for frames in buffered)
+        chosen = [min(frames, key=lambda item: abs(item[0] - t_ref)) for frames in buffered]
+        times = [t for t, frame in chosen]
+        skew = max(times) - min(times)
+        if skew > self.stats['max_skew']:
+            self.stats['max_skew'] = skew
+        return t_ref, [frame for t, frame in chosen], times
+
+    def startRecording(self, directory, Speriod=0, imagetype="gray", chunk_frames=256):
+        """Records a synchronised set of frames every Speriod seconds (as each new set arrives if 0) on a background
+        thread until stopRecording is called"""
+        if self._thread is not None:
+            raise IOError("Already recording")
+        self._recorder = IRFrameRecorder(directory, chunk_frames)
+        self._recorder.start()
+        self.error = None
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._record, args=(Speriod, imagetype), name='IRCameraGroup',
+                                        daemon=True)
+        self._thread.start()
+
+    def stopRecording(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._recorder is not None:
+            self._recorder.stop()
+            self._recorder = None
+
+    def _record(self, Speriod, imagetype):
+        due = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    t_ref, frames, times = self.getFrames(imagetype, fresh=(Speriod == 0))
+                except IOError as e:
+                    # A camera without a frame in time loses this set, not the recording
+                    self.stats['camera_errors'] += 1
+                    self.stats['dropped'] += 1
+                    self.last_camera_error = e
+                    if Speriod == 0:
+                        self._stop_event.wait(0.1)  # do not spin on a camera which has stopped capturing
+                else:
+                    frames = np.stack(frames)
+                    record = np.empty((), dtype=[('frames', frames.dtype, frames.shape),
+                                                 ('times', np.float64, (len(times),))])
+                    record['frames'] = frames
+                    record['times'] = times
+                    if self._recorder.write(record, t_ref):
+                        self.stats['sets'] += 1
+                    else:
+                        self.stats['dropped'] += 1
+                if Speriod > 0:
+                    due += Speriod
+                    now = time.monotonic()
+                    if due < now:
+                        due += (int((now - due) / Speriod) + 1) * Speriod  # skip the sets that were missed
+                    self._stop_event.wait(due - now)
+        except Exception as e:
+            self.error = e
+            print('Error occurred while recording IR cameras, recording stopped.\nError:\n', e)
+
+    def release(self):
+        """Stops any recording and releases every camera"""
+        self.stopRecording()
+        for camera in self.cameras:
+            camera.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
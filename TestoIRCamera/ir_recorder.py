@@ -0,0 +1,217 @@
+"""Streams camera frames to disk during long runs instead of holding them all in memory until the end.
+
+Frames are written by a background thread into a directory of fixed size chunks, each a pair of .npy files opened as
+memory maps: chunk_NNNNN.npy with the frames and times_NNNNN.npy with their capture times (NaN until written). The maps
+are flushed every flush_interval seconds, so after a crash or kill everything up to the last flush can still be read.
+Only the chunk being written and a bounded queue of frames are held in memory.
+
+IRFrameStore reads a recording back, loading only the frames asked for, and can export it to a .mat file laid out as
+TestoIR.test used to write it.
+"""
+
+import glob
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+FRAME_FILE = 'chunk_{:05d}.npy'
+TIME_FILE = 'times_{:05d}.npy'
+
+
+class IRFrameRecorder:
+    def __init__(self, directory, chunk_frames=256, queue_frames=64, flush_interval=5.0):
+        """
+        directory - str     created if it does not exist, must not already hold a recording
+        chunk_frames - int  frames per chunk file
+        queue_frames - int  frames waiting for the writer thread before write starts dropping them
+        flush_interval - float  seconds between flushes of the open chunk to disk
+        """
+        if glob.glob(os.path.join(directory, 'chunk_*.npy')):
+            raise IOError("Directory " + directory + " already holds a recording")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_frames = chunk_frames
+        self.flush_interval = flush_interval
+        self.stats = {'written': 0, 'dropped': 0, 'chunks': 0, 'flushes': 0}
+        self.error = None  # exception which stopped the writer thread
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._write_loop, name='IRFrameRecorder', daemon=True)
+        self._thread.start()
+
+    def write(self, frame, t=None):
+        """Queues a frame to be written, with its capture time (time.time() now if not given). Never blocks; returns
+        False and counts the frame as dropped if the writer has fallen queue_frames behind. Raises IOError once the
+        writer thread has stopped on an error"""
+        if self._thread is None:
+            raise IOError("Recorder not started")
+        if self.error is not None:
+            raise IOError("Recorder stopped after an error: " + str(self.error))
+        try:
+            self._queue.put_nowait((time.time() if t is None else t, frame))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        return True
+
+    def free(self):
+        """Returns how many frames write can queue now without dropping any. For a single writing thread this can only
+        grow until the next write"""
+        return self._queue.maxsize - self._queue.qsize()
+
+    def stop(self):
+        """Writes out the frames still queued, flushes and closes the recording"""
+        if self._thread is None:
+            return
+        # Not a plain put: if the writer has died (see error) with the queue full it would block forever
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._thread = None
+
+    def _write_loop(self):
+        frames = times = None
+        position = 0
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = False  # nothing arrived, only flush
+                if item is None:
+                    break
+                if item:
+                    t, frame = item
+                    if frames is None or position == self.chunk_frames:
+                        if frames is not None:
+                            self._flush(frames, times)
+                        frames, times = self._open_chunk(self.stats['chunks'], np.asarray(frame))
+                        self.stats['chunks'] += 1
+                        position = 0
+                    frames[position] = frame
+                    times[position] = t
+                    position += 1
+                    self.stats['written'] += 1
+                if frames is not None and time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush(frames, times)
+                    last_flush = time.monotonic()
+        except Exception as e:
+            self.error = e
+            print('Error occurred while writing IR frames, recording stopped.\nError:\n', e)
+        finally:
+            if frames is not None:
+                self._flush(frames, times)
+
+    def _open_chunk(self, number, frame):
+        frames = np.lib.format.open_memmap(os.path.join(self.directory, FRAME_FILE.format(number)), mode='w+',
+                                           dtype=frame.dtype, shape=(self.chunk_frames,) + frame.shape)
+        times = np.lib.format.open_memmap(os.path.join(self.directory, TIME_FILE.format(number)), mode='w+',
+                                          dtype=np.float64, shape=(self.chunk_frames,))
+        times[:] = np.nan
+        return frames, times
+
+    def _flush(self, frames, times):
+        # Frames first, so a time is never on disk before its frame
+        frames.flush()
+        times.flush()
+        self.stats['flushes'] += 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class IRFrameStore:
+    """Read access to a recording made by IRFrameRecorder. Frames are read from the memory mapped chunks on demand"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        """Rescans the directory, e.g. to see frames added since by a recording still in progress"""
+        numbers = sorted(int(os.path.basename(path)[6:11])
+                         for path in glob.glob(os.path.join(self.directory, 'chunk_*.npy')))
+        self._frames = []
+        self._times = []
+        self._starts = []
+        count = 0
+        for number in numbers:
+            times = np.load(os.path.join(self.directory, TIME_FILE.format(number)), mmap_mode='r')
+            written = int(np.count_nonzero(~np.isnan(times)))
+            if written == 0:
+                continue
+            self._frames.append(np.load(os.path.join(self.directory, FRAME_FILE.format(number)), mmap_mode='r'))
+            self._times.append(times)
+            self._starts.append(count)
+            count += written
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """store[k] is frame k, store[a:b:c] the frames selected as for a list, as one array"""
+        if isinstance(index, slice):
+            indices = range(*index.indices(self._count))
+            if indices.step == 1 or not indices:
+                return self.frames(indices.start, max(indices.start, indices.stop))
+            return self._take(self._frames, np.array(indices))
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("frame index out of range")
+        k = np.searchsorted(self._starts, index, side='right') - 1
+        return np.array(self._frames[k][index - self._starts[k]])
+
+    def frames(self, start=0, stop=None):
+        """Returns frames start to stop-1 as one array, reading only the chunks they are in"""
+        return self._read(self._frames, start, stop)
+
+    def times(self, start=0, stop=None):
+        """Returns the capture times of frames start to stop-1"""
+        return self._read(self._times, start, stop)
+
+    def _read(self, chunks, start, stop):
+        if stop is None or stop > self._count:
+            stop = self._count
+        parts = []
+        for k, chunk_start in enumerate(self._starts):
+            chunk_stop = self._starts[k + 1] if k + 1 < len(self._starts) else self._count
+            if chunk_stop <= start or chunk_start >= stop:
+                continue
+            parts.append(chunks[k][max(start, chunk_start) - chunk_start:min(stop, chunk_stop) - chunk_start])
+        if not parts:
+            shape = chunks[0].shape[1:] if chunks else ()
+            return np.zeros((0,) + shape, dtype=chunks[0].dtype if chunks else np.float64)
+        return np.concatenate(parts)
+
+    def _take(self, chunks, indices):
+        """Returns the elements at an array of indices in any order, reading only those"""
+        k = np.searchsorted(self._starts, indices, side='right') - 1
+        out = np.empty((len(indices),) + chunks[0].shape[1:], dtype=chunks[0].dtype)
+        for c in np.unique(k):
+            selected = k == c
+            out[selected] = chunks[c][indices[selected] - self._starts[c]]
+        return out
+
+    def export_mat(self, filename, start=0, stop=None):
+        """Saves frames start to stop-1 to a .mat file with the IRframes and frameTimes variables written by
+        TestoIR.test before recordings were streamed. The range is loaded into memory to do so"""
+        # scipy is only imported here as it is slow to import and not needed for capture
+        import scipy.io
+        scipy.io.savemat(filename, {"IRframes": self.frames(start, stop), "frameTimes": self.times(start, stop)})
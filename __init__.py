@@ -1,5 +1,105 @@
-from .EA import *
-from .Keithley import *
-from .Pico import *
-from .TekScope import *
-from .TestoIRCamera import *
+"""Drivers for the lab equipment. Subpackages are imported on first use of one of their names, so a script that only
+needs e.g. the EA power supplies does not pay for (or fail on) pyvisa, cv2, matplotlib etc.
+"""
+
+import importlib
+
+_SUBPACKAGES = ('EA', 'Keithley', 'Keysight', 'Pico', 'TekScope', 'TestoIRCamera', 'ring_buffer', 'settling',
+               'visa_simulator', 'tracing', 'data_recorder', 'scpi_batch')
+
+# name: module it is defined in, relative to this package
+_LAZY_ATTRS = {
+    'EaDevice': 'EA',
+    'PSI8000': 'EA',
+    'EL9000': 'EA',
+    'PSB9000': 'EA',
+    'PS2400B': 'EA',
+    'WAITTIME': 'EA',
+    'RESPONSE_WAIT': 'EA',
+    'CHECK_DELAY': 'EA',
+    'FAST_VERIFY_BACKOFF': 'EA',
+    'TELEMETRY_DTYPE': 'EA',
+    'EaTransport': 'EA',
+    'EaRequest': 'EA',
+    'EaCodec': 'EA',
+    'EaProtocolError': 'EA',
+    'EaChecksumError': 'EA',
+    'EaLengthError': 'EA',
+    'EaDeviceError': 'EA',
+    'EaPoller': 'EA',
+    'TelemetryStore': 'EA',
+    'SimulatedSerial': 'EA',
+    'SimulatedEaSerial': 'EA',
+    'SimulatedPSB9000Serial': 'EA',
+    'EaBus': 'EA',
+    'SetpointChannel': 'EA',
+    'ControlLoop': 'EA',
+    'Keithley': 'Keithley',
+    'DMM6500': 'Keithley',
+    'MM2000': 'Keithley',
+    'KeysightScope': 'Keysight',
+    'DSOX2024A': 'Keysight',
+    'MSOX4024A': 'Keysight',
+    'tc08': 'Pico',
+    'ADC_20': 'Pico',
+    'PicoAcquisition': 'Pico',
+    'PicoLoggerGroup': 'Pico',
+    'MSO54': 'TekScope',
+    'TestoIR': 'TestoIRCamera',
+    'test': 'TestoIRCamera',
+    'CaptureScheduler': 'TestoIRCamera',
+    'IRFrameRecorder': 'TestoIRCamera',
+    'IRFrameStore': 'TestoIRCamera',
+    'ThermalSummary': 'TestoIRCamera',
+    'frame_blocks': 'TestoIRCamera',
+    'summarise': 'TestoIRCamera',
+    'summarise_latest': 'TestoIRCamera',
+    'IRCalibration': 'TestoIRCamera',
+    'clear_calibration_cache': 'TestoIRCamera',
+    'IRCameraGroup': 'TestoIRCamera',
+    'IRCodecWriter': 'TestoIRCamera',
+    'IRCodecReader': 'TestoIRCamera',
+    'RingBuffer': 'ring_buffer',
+    'SettlingDetector': 'settling',
+    'SimulatedResourceManager': 'visa_simulator',
+    'SimulatedInstrument': 'visa_simulator',
+    'SimulatedMSO54': 'visa_simulator',
+    'SimulatedKeysightScope': 'visa_simulator',
+    'SimulatedKeithley': 'visa_simulator',
+    'SimulatedDMM6500': 'visa_simulator',
+    'SimulatedMM2000': 'visa_simulator',
+    'CommandTracer': 'tracing',
+    'TracedConnection': 'tracing',
+    'DataRecorder': 'data_recorder',
+    'DataStore': 'data_recorder',
+    'BatchMixin': 'scpi_batch',
+    'CommandBatch': 'scpi_batch',
+    'batched': 'scpi_batch',
+}
+
+# Star imports still give every driver, loading all of the subpackages
+__all__ = list(_LAZY_ATTRS)
+
+
+def _load(subpackage):
+    module = importlib.import_module('.' + subpackage, __name__)
+    # Importing a subpackage binds it as an attribute of this package, which for Keithley shadows the class of the
+    # same name. Bind all of the subpackage's names now so they match what a star import would have given
+    for name, source in _LAZY_ATTRS.items():
+        if source == subpackage:
+            globals()[name] = getattr(module, name)
+    return module
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        _load(_LAZY_ATTRS[name])
+        return globals()[name]
+    if name in _SUBPACKAGES:
+        module = _load(name)
+        return globals().get(name, module)
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | set(_SUBPACKAGES))
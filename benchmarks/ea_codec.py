@@ -0,0 +1,70 @@
+"""Micro-benchmark of the EA telegram codec against building telegrams with EaDevice.make_message and decoding them
+with the slicing approach EaDevice.decode_message used before EaCodec.
+
+Run with: python benchmarks/ea_codec.py [--number N]
+"""
+
+import argparse
+import array
+import importlib
+import os
+import sys
+import timeit
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+EA_codec = importlib.import_module(os.path.basename(PACKAGE_DIR) + '.EA.EA_codec')
+
+
+def make_message(SD, device_node, obj, data=None):
+    """Copy of EaDevice.make_message"""
+    message = array.array('B', (SD, device_node, obj))
+    if data != None:
+        message.extend(data)
+    CS = sum(message)
+    message.extend((CS >> 8, CS & 255))
+    return message
+
+
+def slice_decode(message):
+    """The decoding EaDevice.decode_message did before EaCodec"""
+    CS = sum(message[0:-2])
+    if (CS >> 8 != message[-2]) or (CS & 255 != message[-1]):
+        return 1
+    data_length = (message[0] & 0b00001111) + 1
+    data = message[3:-2]
+    if len(data) != data_length:
+        return 1
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200000, help='iterations per case')
+    args = parser.parse_args()
+
+    codec = EA_codec.EaCodec()
+    SD_set = 0xD1
+    SD_query = 0x45
+    v = 12345
+    reply = bytes(codec.encode(0x85, 1, 71, (0x12, 0x34, 0x56, 0x78, 0x12, 0x34)))
+    reply_view = memoryview(bytearray(reply))  # as returned by codec.read
+
+    cases = [
+        ('set value: make_message', lambda: make_message(SD_set, 1, 50, (v >> 8, v & 255))),
+        ('set value: codec.encode_word', lambda: codec.encode_word(SD_set, 1, 50, v)),
+        ('query: make_message', lambda: make_message(SD_query, 1, 71)),
+        ('query: codec.frame (cached)', lambda: codec.frame(SD_query, 1, 71)),
+        ('decode 71: slicing + arithmetic', lambda: (lambda d: (d[0] * 256 + d[1], d[2] * 256 + d[3],
+                                                                 d[4] * 256 + d[5]))(slice_decode(reply))),
+        ('decode 71: codec + struct', lambda: codec.decode_actual_values(codec.decode(reply))),
+        ('decode 71: codec + struct, from read view', lambda: codec.decode_actual_values(codec.decode(reply_view))),
+    ]
+    print('{:<40}{:>12}'.format('case', 'ns/op'))
+    for name, func in cases:
+        t = min(timeit.repeat(func, number=args.number, repeat=3))
+        print('{:<40}{:>12.0f}'.format(name, t / args.number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Throughput of every public method of the EA drivers, run against the loopback simulators in EA/EA_simulator.py.
+EaDevice based drivers are run with the original blocking code and with an EaTransport, PSB9000 with and without
+fast_verify.
+
+Run with: python benchmarks/ea_throughput.py [--latency S] [--budget S] [--bit-error-rate P] [--drop-rate P]
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+EA = importlib.import_module(os.path.basename(PACKAGE_DIR) + '.EA')
+
+METHODS = {
+    'PSI8000': [('set_remote', (1,)), ('output_on', (1,)), ('set_v', (100,)), ('set_i', (5,)), ('set_p', (1000,)),
+                ('query_output', ()), ('query_state', ())],
+    'EL9000': [('set_remote', (1,)), ('input_on', (1,)), ('set_v', (100,)), ('set_i', (5,)), ('set_p', (1000,)),
+               ('query_input', ()), ('query_state', ())],
+    'PS2400B': [('set_remote', (1, 1)), ('output_on', (1, 1)), ('set_v', (12, 1)), ('set_i', (2, 1)),
+                ('query_output', (1,)), ('query_state_ps', ()), ('query_all', ())],
+    'PSB9000': [('set_remote', (1,)), ('set_v', (48,)), ('set_i', (3, 'SOURCE')), ('output_on', (1,)),
+                ('query_output', ()), ('query_output_array', ()), ('read_alarm', ()), ('set_OVP_threshold', (800,)),
+                ('set_OCP_threshold', (66,))],
+}
+
+
+def make_device(model, mode, sim_args):
+    if model == 'PSB9000':
+        device = EA.PSB9000(fast_verify=(mode == 'fast_verify'))
+        device.ser = EA.SimulatedPSB9000Serial(**sim_args)
+        return device
+    if model == 'PS2400B':
+        device = EA.PS2400B(42, 4)
+        device.ser = EA.SimulatedEaSerial('PS2400B', 42, 4, 160, **sim_args)
+    elif model == 'EL9000':
+        device = EA.EL9000()
+        device.ser = EA.SimulatedEaSerial('EL9000', 750, 25, 2400, **sim_args)
+    else:
+        device = EA.PSI8000()
+        device.ser = EA.SimulatedEaSerial('PSI8000', **sim_args)
+    if mode == 'transport':
+        device.use_transport()
+    return device
+
+
+def measure(device, method, args, budget):
+    """Returns (calls per second, error message or '')"""
+    func = getattr(device, method)
+    calls = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the drivers print most replies
+        while True:
+            try:
+                func(*args)
+            except Exception as e:
+                return 0.0, type(e).__name__ + ': ' + str(e)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= budget:
+                return calls / elapsed, ''
+
+
+def drain(device, timeout):
+    """Lets the replies still in flight from one case arrive (acknowledges of set telegrams sent without waiting for
+    them) and discards them, so they are not charged to the next case"""
+    device.ser.wait_idle(timeout)
+    if device.__dict__.get('transport') is None:
+        device.ser.reset_input_buffer()
+    else:
+        time.sleep(0.01)  # the transport's reader thread takes them from the port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated response latency, s')
+    parser.add_argument('--budget', type=float, default=1.0, help='time spent on each method, s')
+    parser.add_argument('--timeout', type=float, default=0.5, help='serial timeout of the simulated ports, s')
+    parser.add_argument('--bit-error-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    sim_args = {'latency': args.latency, 'timeout': args.timeout, 'bit_error_rate': args.bit_error_rate,
+                'drop_rate': args.drop_rate, 'seed': 0}
+
+    print('{:<10}{:<14}{:<22}{:>12}  {}'.format('device', 'mode', 'method', 'calls/s', ''))
+    for model, methods in METHODS.items():
+        modes = ('blocking', 'fast_verify') if model == 'PSB9000' else ('blocking', 'transport')
+        for mode in modes:
+            device = make_device(model, mode, sim_args)
+            for method, method_args in methods:
+                rate, error = measure(device, method, method_args, args.budget)
+                print('{:<10}{:<14}{:<22}{:>12.1f}  {}'.format(model, mode, method, rate, error))
+                drain(device, args.timeout)
+            if device.__dict__.get('transport') is not None:
+                device.transport.stop()
+
+
+if __name__ == '__main__':
+    main()
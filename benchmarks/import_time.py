@@ -0,0 +1,77 @@
+"""Import time benchmark for the package. Each case is timed in a fresh interpreter so nothing is cached between runs.
+
+Run with: python benchmarks/import_time.py [--repeat N] [--max-ms MS]
+Exits with status 1 if importing the bare package pulls in a heavy dependency or takes longer than --max-ms, so it
+can be used to catch regressions in the lazy loading.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PACKAGE_DIR)
+
+# Modules which must not be imported by a bare "import <package>"
+HEAVY_MODULES = ('pyvisa', 'serial', 'cv2', 'matplotlib', 'scipy', 'numpy')
+
+CASES = {
+    'bare package': '',
+    'EA': 'pkg.PSB9000',
+    'Pico': 'pkg.tc08',
+    'Keithley': 'pkg.DMM6500',
+    'Keysight': 'pkg.DSOX2024A',
+    'TekScope': 'pkg.MSO54',
+    'TestoIRCamera': 'pkg.TestoIR',
+}
+
+SCRIPT = """
+import importlib, sys, time
+sys.path.insert(0, {parent!r})
+t = time.perf_counter()
+pkg = importlib.import_module({package!r})
+try:
+    {access}
+    ok = 'ok'
+except Exception as e:
+    ok = type(e).__name__
+dt = time.perf_counter() - t
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(dt, ok, ','.join(heavy))
+"""
+
+
+def time_case(access):
+    script = SCRIPT.format(parent=os.path.dirname(PACKAGE_DIR), package=PACKAGE, access=access or 'pass',
+                           heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    dt, ok, heavy = (out.stdout.strip().splitlines()[-1].split(' ') + [''])[:3]
+    return float(dt), ok, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters per case')
+    parser.add_argument('--max-ms', type=float, default=50, help='limit on the bare package import time')
+    args = parser.parse_args()
+
+    failed = False
+    print('{:<16}{:>10}{:>10}  {:<10}{}'.format('case', 'best ms', 'mean ms', 'result', 'heavy modules loaded'))
+    for name, access in CASES.items():
+        results = [time_case(access) for _ in range(args.repeat)]
+        times = [r[0] * 1000 for r in results]
+        ok, heavy = results[-1][1], results[-1][2]
+        print('{:<16}{:>10.1f}{:>10.1f}  {:<10}{}'.format(name, min(times), sum(times) / len(times), ok, heavy))
+        if name == 'bare package':
+            if heavy:
+                print('REGRESSION: bare import loaded', heavy)
+                failed = True
+            if min(times) > args.max_ms:
+                print('REGRESSION: bare import took longer than', args.max_ms, 'ms')
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Acquisition throughput of the SCPI drivers (MSO54, DSOX2024A, DMM6500, MM2000), run against the simulated
+instruments in visa_simulator.py. The scope waveforms are also fetched as binary blocks, to compare the transfer formats
+the drivers could use with the ones they do.
+
+Run with: python benchmarks/visa_throughput.py [--latency S] [--bandwidth B/s] [--record-length N] [--budget S]
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+PACKAGE = importlib.import_module(os.path.basename(PACKAGE_DIR))
+
+
+def mso54_binary(scope, encoding, width):
+    """CURVE? of every available channel as a binary block instead of ASCII"""
+    scope.set_channels()
+    for ch in scope.CHAN:
+        scope.inst.write(':Data:Source ' + ch)
+        scope.inst.write(':Data:Encdg ' + encoding)
+        scope.inst.write('Data:Width ' + str(width))
+        scope.inst.query_binary_values('CURVE?', datatype='b' if width == 1 else 'h', is_big_endian=True,
+                                       container=np.array)
+
+
+def keysight_binary(scope, fmt):
+    """:WAV:DATA? of every displayed channel as BYTE or WORD instead of ASCII"""
+    for i, ch in enumerate(scope.CHAN):
+        if ch:
+            scope.inst.write(':WAVEFORM:SOURCE CHAN' + str(i + 1))
+            scope.inst.write(':WAVEFORM:POINTS MAXIMUM')
+            scope.inst.write(':WAVEFORM:FORMAT ' + fmt)
+            scope.query(':WAVeform:PREAMBLE?')
+            scope.inst.query_binary_values(':WAV:DATA?', datatype='B' if fmt == 'BYTE' else 'H', is_big_endian=True,
+                                           container=np.array)
+
+
+def make_cases(sim_args, record_length):
+    rm = PACKAGE.SimulatedResourceManager(**sim_args)
+    with contextlib.redirect_stdout(io.StringIO()):
+        mso = PACKAGE.MSO54(rm=rm)
+        mso.open()
+        keysight = PACKAGE.DSOX2024A(rm=rm)
+        keysight.open()
+        keysight.set_channels()
+        dmm = PACKAGE.DMM6500(rm=rm)
+        dmm.n_samples = record_length
+        dmm.configureBuffers_SCPI_Trig_Digitize()
+        dmm.trigger()
+        mm2000 = PACKAGE.MM2000(rm=rm)
+        mm2000.n_sample = min(record_length, 1024)
+    mm2000.configureBuffers()
+
+    def mm2000_read():
+        mm2000.trigger()
+        mm2000.getBufferedData()
+
+    return [('MSO54', 'read (ASCII)', mso.inst, lambda: mso.read(record_length)),
+            ('MSO54', 'CURVE? RIBinary 1', mso.inst, lambda: mso54_binary(mso, 'RIBinary', 1)),
+            ('MSO54', 'CURVE? RIBinary 2', mso.inst, lambda: mso54_binary(mso, 'RIBinary', 2)),
+            ('DSOX2024A', 'read (ASCII)', keysight.inst, keysight.read),
+            ('DSOX2024A', ':WAV:DATA? BYTE', keysight.inst, lambda: keysight_binary(keysight, 'BYTE')),
+            ('DSOX2024A', ':WAV:DATA? WORD', keysight.inst, lambda: keysight_binary(keysight, 'WORD')),
+            ('DMM6500', 'getBufferedData', dmm.inst, dmm.getBufferedData),
+            ('MM2000', 'trigger + getBufferedData', mm2000.inst, mm2000_read)]
+
+
+def measure(func, inst, budget):
+    """Returns (calls per second, MB read per second, error message or '')"""
+    calls = 0
+    bytes_read = inst.stats['bytes_read']
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the drivers print progress
+        while True:
+            try:
+                func()
+            except Exception as e:
+                return 0.0, 0.0, type(e).__name__ + ': ' + str(e)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= budget:
+                return calls / elapsed, (inst.stats['bytes_read'] - bytes_read) / elapsed / 1e6, ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.0005, help='simulated latency of each write and read, s')
+    parser.add_argument('--bandwidth', type=float, default=30e6, help='simulated bus bandwidth, bytes/s')
+    parser.add_argument('--record-length', type=int, default=10000, help='points per waveform or reading buffer')
+    parser.add_argument('--budget', type=float, default=2.0, help='time spent on each case, s')
+    args = parser.parse_args()
+    sim_args = {'latency': args.latency, 'bandwidth': args.bandwidth, 'record_length': args.record_length,
+                'seed': 0}
+
+    print('{:<11}{:<28}{:>10}{:>10}  {}'.format('device', 'method', 'calls/s', 'MB/s', ''))
+    for device, method, inst, func in make_cases(sim_args, args.record_length):
+        rate, throughput, error = measure(func, inst, args.budget)
+        print('{:<11}{:<28}{:>10.2f}{:>10.2f}  {}'.format(device, method, rate, throughput, error))
+
+
+if __name__ == '__main__':
+    main()
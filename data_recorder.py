@@ -0,0 +1,430 @@
+"""Records any number of instruments to disk against one clock, so a test script no longer has to stitch together
+Keithley buffers, tc08 rows, power supply readings and scope waveforms that each have their own time base.
+
+    recorder = DataRecorder('run_2024_05_01')
+    recorder.add_source('ps', ps.query_output, period=0.5)                     # {'v', 'i', 'p'}
+    recorder.add_source('tc08', logger.record, period=1, columns=['logger_time', 'T1', 'T2'])
+    recorder.add_source('dmm', dmm.getBufferedData, period=10, rows=True, source_time='time')
+    recorder.add_source('scope', lambda: (scope.arm(), scope.read())[1], period=5)  # CH1.Amp, CH1.Time vectors
+    recorder.start()
+    ...
+    recorder.stop()
+    DataStore('run_2024_05_01').read('ps', start=60, stop=120)
+
+Every sample is stamped with t, seconds on the recorder's monotonic clock since start (the midpoint of the read call
+for polled sources). The wall clock time of t = 0 is kept with the recording. A source is polled by its own thread, or
+shares one with the other sources of its group (e.g. both channels of a PS2400B, which share a serial port), so adding
+sources does not slow the others down. Samples are queued for a single writer thread and never wait for the disk.
+
+A sample is flattened to named columns: a number becomes 'value', a list or array the given column names (c0, c1...
+if not given), and a dict its keys, with nested dicts joined by '.'. The name t is kept for the recorder time, so a
+sample field called t is stored as source_t. Scalars are stored as float64 (or strings), and arrays, such as scope
+waveforms, as fixed length vector columns. With rows=True a sample holds many rows, e.g. {'data': [...], 'time': [...]};
+their times are spread back from the read time by the differences of the source_time column, the newest row taking
+the read time.
+
+On disk each source is a directory of append-only chunks, one .npy file per column, each chunk written whole when it
+reaches chunk_rows or flush_interval has passed. index.jsonl lists the chunks with their time range, and a chunk only
+counts once its line has been written, so a crash loses at most the last flush_interval. Reading a time range loads
+only the chunks and columns asked for.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+INDEX_FILE = 'index.jsonl'
+META_FILE = 'recording.json'
+CHUNK_DIR = 'chunk_{:05d}'
+SOURCE_T = 'source_t'  # column a sample field named 't' is stored as, 't' being the recorder time
+
+
+def flatten(sample, columns=None, prefix=''):
+    """Returns a sample as a dict of column name: value, see the module docstring"""
+    if isinstance(sample, dict):
+        flat = {}
+        for key, value in sample.items():
+            if isinstance(value, dict):
+                flat.update(flatten(value, prefix=prefix + str(key) + '.'))
+            else:
+                flat[prefix + str(key)] = value
+        return flat
+    if isinstance(sample, (list, tuple, np.ndarray)):
+        values = list(sample)
+        names = columns if columns is not None else ['c' + str(k) for k in range(len(values))]
+        if len(names) != len(values):
+            raise ValueError("Sample has " + str(len(values)) + " values for " + str(len(names)) + " columns")
+        return {prefix + name: value for name, value in zip(names, values)}
+    return {prefix + 'value': sample}
+
+
+class _Source:
+    def __init__(self, name, read, period, columns, rows, source_time, group):
+        self.name = name
+        self.read = read
+        self.period = period
+        self.columns = columns
+        self.rows = rows
+        self.source_time = source_time
+        self.group = group
+        self.stats = {'samples': 0, 'errors': 0, 'overruns': 0, 'last_error': None}
+
+
+class _SourceWriter:
+    """Pending rows of one source and its chunk directory, used only by the writer thread"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.chunk = len(_read_index(directory))
+        self.times = []
+        self.rows = []
+        self.shapes = {}  # vector column: shape, a chunk only holds one shape per column
+        self.last_flush = time.monotonic()
+
+    def add(self, t, row):
+        if 't' in row:
+            row = dict(row)
+            row[SOURCE_T] = row.pop('t')
+        shapes = {name: np.shape(value) for name, value in row.items() if np.ndim(value) > 0}
+        changed = any(self.shapes.get(name, shape) != shape for name, shape in shapes.items())
+        if changed and self.rows:
+            self.flush()
+        self.shapes.update(shapes)
+        self.times.append(t)
+        self.rows.append(row)
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        names = []
+        for row in self.rows:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+        path = os.path.join(self.directory, CHUNK_DIR.format(self.chunk))
+        os.makedirs(path, exist_ok=True)
+        times = np.array(self.times, dtype=np.float64)
+        np.save(os.path.join(path, 'c0.npy'), times)
+        files = {'t': 'c0.npy'}
+        for k, name in enumerate(names, start=1):
+            files[name] = 'c' + str(k) + '.npy'
+            np.save(os.path.join(path, files[name]), self._column(name))
+        entry = {'chunk': self.chunk, 'rows': len(times), 't_min': float(times.min()), 't_max': float(times.max()),
+                 'files': files}
+        # The index line is written last, so a chunk interrupted part way through is never read
+        with open(os.path.join(self.directory, INDEX_FILE), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.chunk += 1
+        self.times = []
+        self.rows = []
+        self.shapes = {}
+
+    def _column(self, name):
+        shape = self.shapes.get(name)
+        if shape is not None:
+            column = np.full((len(self.rows),) + shape, np.nan)
+            for k, row in enumerate(self.rows):
+                if name in row:
+                    column[k] = row[name]
+            return column
+        values = [row.get(name) for row in self.rows]
+        try:
+            return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.array(['' if value is None else str(value) for value in values])
+
+
+def _read_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # a line cut short by a crash
+    return entries
+
+
+class DataRecorder:
+    def __init__(self, directory, chunk_rows=4096, flush_interval=5.0, queue_length=10000):
+        """
+        directory - str     created if it does not exist, must not already hold a recording
+        chunk_rows - int    rows of a source kept in memory before they are written as a chunk
+        flush_interval - float  seconds after which a source's rows are written even if there are fewer
+        queue_length - int  samples waiting for the writer thread before new ones are dropped
+        """
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            raise IOError("Directory " + directory + " already holds a recording")
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.sources = {}
+        self.stats = {'queued': 0, 'dropped': 0, 'written': 0}
+        self.error = None  # exception which stopped the writer thread
+        self._queue = queue.Queue(maxsize=queue_length)
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._writer = None
+        self._t0 = None
+
+    def clock(self):
+        """Seconds since start on the recorder's monotonic clock, the time base of every sample"""
+        return time.monotonic() - self._t0
+
+    def add_source(self, name, read=None, period=1.0, columns=None, rows=False, source_time=None, group=None):
+        """
+        name - str  name of the source's directory in the recording
+        read - function returning a sample, called every period seconds. None for a source whose samples are given
+            to push, e.g. from a PicoAcquisition subscriber
+        columns - list of str   names of the values of a list or array sample
+        rows - bool     True if each sample holds many rows, as a dict of equal length lists or a 2D array
+        source_time - str   column of a rows sample holding the instrument's own time of each row, in seconds
+        group - sources with the same group are read one after another by one thread, e.g. for instruments sharing
+            a port. Each source has its own thread by default
+        """
+        if self._writer is not None:
+            raise RuntimeError("Sources cannot be added while the recorder is running")
+        if name in self.sources or os.sep in name or name in ('', '.', '..'):
+            raise ValueError("Invalid or duplicate source name " + repr(name))
+        self.sources[name] = _Source(name, read, period, columns, rows, source_time,
+                                     group if group is not None else name)
+
+    def start(self):
+        if self._writer is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._t0 = time.monotonic()
+        with open(os.path.join(self.directory, META_FILE), 'w') as f:
+            json.dump({'t0_wall': time.time(), 'clock': 'time.monotonic',
+                       'sources': {name: {'period': source.period, 'rows': source.rows}
+                                   for name, source in self.sources.items()}}, f, indent=4)
+        self.error = None
+        self._stop_event.clear()
+        self._writer = threading.Thread(target=self._write_loop, name='DataRecorder writer', daemon=True)
+        self._writer.start()
+        groups = {}
+        for source in self.sources.values():
+            if source.read is not None:
+                groups.setdefault(source.group, []).append(source)
+        for group in groups.values():
+            thread = threading.Thread(target=self._poll, args=(group,), name='DataRecorder', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stops polling, writes out every queued sample and closes the recording"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._writer is not None:
+            # Not a plain put: if the writer has died (see error) with the queue full it would block forever
+            while self._writer.is_alive():
+                try:
+                    self._queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self._writer.join()
+            self._writer = None
+
+    def push(self, name, sample, t=None):
+        """Queues a sample of a source, stamped t on the recorder clock (now if not given). Never blocks; returns
+        False and counts the sample as dropped if the writer has fallen queue_length samples behind. Raises IOError
+        once the writer thread has stopped on an error"""
+        if self._writer is None:
+            raise IOError("Recorder not started")
+        if self.error is not None:
+            raise IOError("Recorder stopped after an error: " + str(self.error))
+        source = self.sources[name]
+        try:
+            self._queue.put_nowait((source, self.clock() if t is None else t, sample))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        source.stats['samples'] += 1
+        return True
+
+    def _poll(self, group):
+        due = [time.monotonic()] * len(group)
+        while not self._stop_event.is_set():
+            k = int(np.argmin(due))
+            delay = due[k] - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            source = group[k]
+            started = self.clock()
+            try:
+                sample = source.read()
+            except Exception as e:
+                source.stats['errors'] += 1
+                source.stats['last_error'] = e
+                print('WARNING: Failed to read', source.name, ':', e)
+            else:
+                try:
+                    self.push(source.name, sample, (started + self.clock()) / 2)
+                except IOError:
+                    break  # the writer has stopped, see error
+            due[k] += source.period
+            now = time.monotonic()
+            if due[k] < now:
+                source.stats['overruns'] += 1
+                due[k] += (int((now - due[k]) / source.period) + 1) * source.period  # skip the missed reads
+
+    def _rows(self, source, t, sample):
+        """Returns the (t, row) pairs of a sample"""
+        if not source.rows:
+            return [(t, flatten(sample, source.columns))]
+        if isinstance(sample, dict):
+            flat = flatten(sample)
+            columns = {name: np.asarray(values) for name, values in flat.items()}
+        else:
+            sample = np.asarray(sample)
+            names = source.columns or ['c' + str(k) for k in range(sample.shape[1])]
+            columns = {name: sample[:, k] for k, name in enumerate(names)}
+        n = len(next(iter(columns.values()))) if columns else 0
+        if any(len(values) != n for values in columns.values()):
+            raise ValueError("Columns of a rows sample from " + source.name + " have different lengths")
+        if source.source_time is not None and n:
+            own = np.asarray(columns[source.source_time], dtype=np.float64)
+            times = t - (own[-1] - own)
+        else:
+            times = np.full(n, t)
+        return [(times[k], {name: values[k] for name, values in columns.items()}) for k in range(n)]
+
+    def _write_loop(self):
+        writers = {}
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = False  # nothing arrived, only flush
+                if item is None:
+                    break
+                if item:
+                    source, t, sample = item
+                    writer = writers.get(source.name)
+                    if writer is None:
+                        writer = writers[source.name] = _SourceWriter(os.path.join(self.directory, source.name))
+                    try:
+                        rows = self._rows(source, t, sample)
+                    except Exception as e:
+                        # A malformed sample is lost on its own, the recording carries on
+                        source.stats['errors'] += 1
+                        source.stats['last_error'] = e
+                        print('WARNING: Failed to record a sample of', source.name, ':', e)
+                        rows = []
+                    for row_t, row in rows:
+                        writer.add(row_t, row)
+                        self.stats['written'] += 1
+                    if len(writer.rows) >= self.chunk_rows:
+                        writer.flush()
+                now = time.monotonic()
+                for writer in writers.values():
+                    if now - writer.last_flush >= self.flush_interval:
+                        writer.flush()
+        except Exception as e:
+            self.error = e
+            print('Error occurred while writing recording, recording stopped.\nError:\n', e)
+        finally:
+            for writer in writers.values():
+                writer.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class DataStore:
+    """Read access to a recording made by DataRecorder, which may still be in progress"""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.t0_wall = self.meta['t0_wall']
+        self.refresh()
+
+    def refresh(self):
+        """Rereads the chunk indexes, e.g. to see rows written since by a recording still in progress"""
+        self._index = {}
+        for name in sorted(os.listdir(self.directory)):
+            if os.path.isdir(os.path.join(self.directory, name)):
+                self._index[name] = _read_index(os.path.join(self.directory, name))
+
+    def sources(self):
+        return list(self._index)
+
+    def columns(self, source):
+        names = []
+        for entry in self._index[source]:
+            for name in entry['files']:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def rows(self, source):
+        return sum(entry['rows'] for entry in self._index[source])
+
+    def time_range(self, source):
+        """(first, last) sample time of a source, None if it has no rows"""
+        entries = self._index[source]
+        if not entries:
+            return None
+        return min(entry['t_min'] for entry in entries), max(entry['t_max'] for entry in entries)
+
+    def read(self, source, start=None, stop=None, columns=None):
+        """
+        Returns {column: array} of the rows of a source with start <= t < stop (recorder clock seconds, either may be
+        None), in time order. Only the chunks overlapping the range and the columns asked for are loaded. A column a
+        chunk does not have is NaN (or '') in its rows
+        """
+        names = ['t'] + [name for name in (columns if columns is not None else self.columns(source)) if name != 't']
+        parts = {name: [] for name in names}
+        for entry in self._index[source]:
+            if (start is not None and entry['t_max'] < start) or (stop is not None and entry['t_min'] >= stop):
+                continue
+            path = os.path.join(self.directory, source, CHUNK_DIR.format(entry['chunk']))
+            t = np.load(os.path.join(path, entry['files']['t']), mmap_mode='r')
+            keep = np.ones(len(t), dtype=bool)
+            if start is not None:
+                keep &= t >= start
+            if stop is not None:
+                keep &= t < stop
+            for name in names:
+                if name in entry['files']:
+                    parts[name].append(np.load(os.path.join(path, entry['files'][name]), mmap_mode='r')[keep])
+                else:
+                    parts[name].append(None)
+        result = {}
+        for name in names:
+            found = [part for part in parts[name] if part is not None]
+            if not found:
+                result[name] = np.full(len(np.concatenate(parts['t'])) if parts['t'] else 0, np.nan)
+                continue
+            # Fill chunks without the column to the shape and kind of the ones that have it
+            fill = '' if found[0].dtype.kind == 'U' else np.nan
+            filled = [part if part is not None else np.full((len(t_part),) + found[0].shape[1:], fill)
+                      for part, t_part in zip(parts[name], parts['t'])]
+            try:
+                result[name] = np.concatenate(filled)
+            except ValueError:
+                raise ValueError("Column " + name + " of " + source + " changes shape within the range read")
+        order = np.argsort(result['t'], kind='stable')
+        return {name: values[order] for name, values in result.items()}
+
+    def wall_time(self, t):
+        """Converts recorder clock seconds to time.time() seconds"""
+        return self.t0_wall + np.asarray(t)
@@ -0,0 +1,63 @@
+"""Fixed size ring buffer backed by a NumPy array. Used by the background acquisition services so that several
+consumers can share one instrument without each of them talking to the hardware.
+"""
+
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, length, width, dtype=np.float64):
+        """
+        length - int    number of rows kept before the oldest are overwritten
+        width - int     number of columns in each row, column 0 is expected to be the sample time
+        """
+        if length < 1 or width < 1:
+            raise ValueError("length and width of the ring buffer must be at least 1")
+        self.length = length
+        self.width = width
+        self.data = np.full((length, width), np.nan, dtype=dtype)
+        self.count = 0  # total number of rows ever appended
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        """Appends a row, overwriting the oldest row once the buffer is full"""
+        with self._lock:
+            idx = self.count % self.length
+            self.data[idx] = row
+            # A fresh copy is rebound rather than updated in place so latest() never needs the lock
+            self._latest = self.data[idx].copy()
+            self.count += 1
+
+    def latest(self):
+        """Returns a copy of the newest row or None if nothing has been appended. Does not take the lock"""
+        return self._latest
+
+    def __len__(self):
+        return min(self.count, self.length)
+
+    def last(self, n=None):
+        """Returns the newest n rows (all stored rows if n is None) in time order as a new array"""
+        with self._lock:
+            stored = min(self.count, self.length)
+            if n is None or n > stored:
+                n = stored
+            end = self.count % self.length
+            idx = (np.arange(end - n, end)) % self.length
+            return self.data[idx].copy()
+
+    def window(self, t_start, t_end=None, column=0):
+        """Returns the stored rows whose time (column 0 by default) lies in [t_start, t_end] in time order"""
+        rows = self.last()
+        t = rows[:, column]
+        mask = t >= t_start
+        if t_end is not None:
+            mask &= t <= t_end
+        return rows[mask]
+
+    def clear(self):
+        with self._lock:
+            self.data[:] = np.nan
+            self.count = 0
+            self._latest = None
@@ -0,0 +1,118 @@
+"""Batching of SCPI writes into compound messages, so a setter sending ten commands costs one or two bus transactions
+instead of ten. The VISA drivers offer it as a context manager:
+
+    with scope.batch(opc=True):
+        scope.set_edge_trigger(1, 'RISE', 0.5)
+        scope.set_horizontal_scale(1e-6)
+
+Inside the block the driver's inst is a CommandBatch which queues writes. A query, or the end of the block, sends the
+queued writes joined by ';' in messages of at most max_length characters, so the order of writes and queries is kept.
+Every write is sent with a leading ':' (unless it starts with a common * command), as in a compound message a header
+without one is taken relative to the previous command's path. A write is never split, so one which is itself a
+compound message, quoted arguments included, reaches the instrument as written. With opc=True the last message ends in
+*OPC? and the block only returns once the instrument has answered it.
+
+Instruments generally stop parsing a message at the first command error and discard the rest of it, so inside a batch
+an error can lose the commands queued after the failing one; check the error queue after the block if that matters.
+"""
+
+import contextlib
+
+
+def _absolute(command):
+    command = command.strip()
+    if command.startswith(':') or command.startswith('*'):
+        return command
+    return ':' + command
+
+
+class CommandBatch:
+    """Stands in for a VISA resource, queueing writes and passing everything else to it"""
+    def __init__(self, inst, max_length=1024):
+        """
+        inst - the pyvisa resource (or visa_simulator instrument) the commands are for
+        max_length - int    most characters in one compound message, within the instrument's input buffer
+        """
+        self.__dict__.update(inst=inst, max_length=max_length, pending=[],
+                             stats={'commands': 0, 'messages': 0})
+
+    def write(self, message, *args, **kwargs):
+        if message.strip():
+            self.pending.append(_absolute(message))
+            self.stats['commands'] += 1
+        return len(message)
+
+    def flush(self, opc=False):
+        """Sends the queued commands. With opc, *OPC? is sent last and its answer waited for; raises IOError if it is
+        not 1"""
+        commands = self.pending + (['*OPC?'] if opc else [])
+        self.__dict__['pending'] = []
+        message = ''
+        for command in commands:
+            if message and len(message) + 1 + len(command) > self.max_length:
+                self._send(message)
+                message = ''
+            message = message + ';' + command if message else command
+        if message:
+            self._send(message)
+        if opc:
+            response = self.inst.read().strip()
+            if response != '1':
+                raise IOError("*OPC? after batched commands returned " + repr(response))
+
+    def _send(self, message):
+        self.inst.write(message)
+        self.stats['messages'] += 1
+
+    def _flushed(self, name):
+        func = getattr(self.inst, name)
+
+        def call(*args, **kwargs):
+            self.flush()
+            return func(*args, **kwargs)
+        return call
+
+    def __getattr__(self, name):
+        if name.startswith('query') or name.startswith('read'):
+            return self._flushed(name)
+        return getattr(self.inst, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.inst, name, value)
+
+
+class BatchMixin:
+    """Gives a VISA driver, whose connection is self.inst, a batch method. COMMAND_BUFFER is the most characters its
+    instrument accepts in one message"""
+    COMMAND_BUFFER = 1024
+
+    def batch(self, opc=False):
+        """
+        Context manager sending the writes made inside it as ';'-joined compound messages of up to COMMAND_BUFFER
+        characters, instead of one transaction each. Queries inside the block send the queued writes first. An
+        instrument discards the rest of a compound message after a command error, so one bad setting can lose the
+        writes queued after it
+        opc - bool  end with *OPC? and wait for the instrument to complete the commands
+        """
+        return batched(self, opc, self.COMMAND_BUFFER)
+
+
+@contextlib.contextmanager
+def batched(device, opc=False, max_length=1024, attribute='inst'):
+    """Context manager replacing device.inst with a CommandBatch for the duration of the block. The commands queued
+    are sent at the end even if the block raises, as they would have been without batching, but *OPC? is then
+    skipped. Nested blocks join the outermost batch"""
+    inst = getattr(device, attribute)
+    if isinstance(inst, CommandBatch):
+        yield inst
+        return
+    batch = CommandBatch(inst, max_length)
+    setattr(device, attribute, batch)
+    try:
+        yield batch
+    except BaseException:
+        setattr(device, attribute, inst)
+        batch.flush()
+        raise
+    setattr(device, attribute, inst)
+    batch.flush(opc)
@@ -0,0 +1,110 @@
+"""Detects when a measurement has settled after a setpoint change, so a sweep waits as long as the system needs rather
+than a fixed sleep sized for the worst case. Any function returning a number can be polled, e.g.
+
+    SettlingDetector(lambda: ps.query_output_array()['v'], max_slope=0.01, band=0.05)
+    SettlingDetector(dmm.voltage_measurement, max_std=1e-3)
+    SettlingDetector(lambda: logger.getLatestTemp(1), max_slope=0.05 / 60, window=20, period=1)
+
+The measurement is steady once the last 'window' readings meet every criterion that has been set:
+max_slope - magnitude of the least squares slope of the readings against time, units per second
+max_std - standard deviation of the readings
+band - every reading lies within +/- band of target, or of the mean of the window if no target is given
+"""
+
+import time
+
+import numpy as np
+
+from .ring_buffer import RingBuffer
+
+
+class SettlingDetector:
+    def __init__(self, read, window=10, period=0.1, max_slope=None, max_std=None, band=None, target=None, timeout=60,
+                 min_time=0):
+        """
+        read - function returning the current measurement as a number
+        window - int    number of readings the criteria are evaluated over
+        period - float  seconds between readings
+        timeout - float seconds before wait gives up
+        min_time - float    seconds to wait after the start before steady state may be declared, e.g. a known dead time
+        """
+        if window < 2:
+            raise ValueError("window must be at least 2 readings")
+        if max_slope is None and max_std is None and band is None:
+            raise ValueError("At least one of max_slope, max_std and band must be given")
+        self.read = read
+        self.window = window
+        self.period = period
+        self.max_slope = max_slope
+        self.max_std = max_std
+        self.band = band
+        self.target = target
+        self.timeout = timeout
+        self.min_time = min_time
+        self.buffer = RingBuffer(window, 2)  # host time (time.monotonic), reading
+
+    def reset(self):
+        """Forgets the readings taken so far, call after changing the setpoint if the detector is fed with update"""
+        self.buffer.clear()
+
+    def update(self, value, t=None):
+        """Adds a reading taken elsewhere, for use without wait. Returns True if the readings are now steady"""
+        self.buffer.append((time.monotonic() if t is None else t, value))
+        return self.is_settled()
+
+    def statistics(self):
+        """Returns {'mean', 'std', 'slope', 'deviation'} of the current window, deviation being the largest distance of
+        a reading from the target (or mean). None if fewer than 2 readings have been taken"""
+        rows = self.buffer.last()
+        if len(rows) < 2:
+            return None
+        t = rows[:, 0] - rows[0, 0]
+        y = rows[:, 1]
+        mean = y.mean()
+        t_centred = t - t.mean()
+        spread = (t_centred ** 2).sum()
+        slope = (t_centred * (y - mean)).sum() / spread if spread > 0 else 0.0
+        centre = self.target if self.target is not None else mean
+        return {'mean': float(mean), 'std': float(y.std()), 'slope': float(slope),
+                'deviation': float(np.abs(y - centre).max())}
+
+    def is_settled(self):
+        """True once the window is full and every criterion set is met"""
+        if len(self.buffer) < self.window:
+            return False
+        stats = self.statistics()
+        if self.max_slope is not None and abs(stats['slope']) > self.max_slope:
+            return False
+        if self.max_std is not None and stats['std'] > self.max_std:
+            return False
+        if self.band is not None and stats['deviation'] > self.band:
+            return False
+        return True
+
+    def wait(self, raise_on_timeout=True):
+        """
+        Polls read every period until the readings are steady and returns {'settled', 'elapsed', 'readings', 'mean',
+        'std', 'slope', 'deviation'}, mean being the settled value. On timeout raises TimeoutError, or returns the same
+        dict with settled False if raise_on_timeout is False
+        """
+        self.reset()
+        start = time.monotonic()
+        next_read = start
+        readings = 0
+        while True:
+            delay = next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.monotonic()
+            self.buffer.append((now, self.read()))
+            readings += 1
+            elapsed = now - start
+            settled = elapsed >= self.min_time and self.is_settled()
+            if settled or elapsed >= self.timeout:
+                break
+            next_read += self.period
+        result = {'settled': settled, 'elapsed': elapsed, 'readings': readings}
+        result.update(self.statistics() or {'mean': None, 'std': None, 'slope': None, 'deviation': None})
+        if not settled and raise_on_timeout:
+            raise TimeoutError("Measurement did not settle within " + str(self.timeout) + " s: " + str(result))
+        return result
@@ -0,0 +1,25 @@
+"""Imports the package by the name of its directory, as the benchmarks do, so the tests run from a checkout of the
+submodule under any name: python -m pytest -q"""
+
+import contextlib
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+PACKAGE = importlib.import_module(os.path.basename(PACKAGE_DIR))
+
+
+@pytest.fixture
+def package():
+    return PACKAGE
+
+
+@pytest.fixture
+def quiet():
+    """Context manager swallowing what the drivers print"""
+    return lambda: contextlib.redirect_stdout(io.StringIO())
@@ -0,0 +1,60 @@
+"""Round trips through DataRecorder and DataStore"""
+
+import time
+
+import numpy as np
+import pytest
+
+
+def test_pushed_samples_round_trip(package, tmp_path, quiet):
+    directory = str(tmp_path / 'run')
+    recorder = package.DataRecorder(directory, chunk_rows=3)
+    recorder.add_source('ps')
+    recorder.add_source('dmm', rows=True, source_time='time')
+    with recorder:
+        for k in range(10):
+            recorder.push('ps', {'v': float(k), 'i': {'set': 1.0, 'actual': 0.5}, 't': 100.0 + k}, t=float(k))
+        recorder.push('dmm', {'data': [1.0, 2.0, 3.0], 'time': [0.0, 0.5, 1.0]}, t=20.0)
+    store = package.DataStore(directory)
+    assert sorted(store.sources()) == ['dmm', 'ps']
+    ps = store.read('ps')
+    assert np.array_equal(ps['t'], np.arange(10.0))
+    assert np.array_equal(ps['v'], np.arange(10.0))
+    assert np.array_equal(ps['source_t'], 100.0 + np.arange(10.0))
+    assert np.all(ps['i.actual'] == 0.5)
+    assert np.array_equal(store.read('ps', start=3, stop=6)['v'], [3.0, 4.0, 5.0])
+    dmm = store.read('dmm')
+    assert np.array_equal(dmm['t'], [19.0, 19.5, 20.0])
+    assert np.array_equal(dmm['data'], [1.0, 2.0, 3.0])
+
+
+def test_polled_source(package, tmp_path):
+    directory = str(tmp_path / 'run')
+    readings = iter(range(1000))
+    recorder = package.DataRecorder(directory, flush_interval=0.05)
+    recorder.add_source('counter', lambda: next(readings), period=0.01)
+    with recorder:
+        time.sleep(0.2)
+    values = package.DataStore(directory).read('counter')['value']
+    assert len(values) > 5
+    assert np.array_equal(values, np.arange(len(values)))
+
+
+def test_malformed_sample_is_skipped(package, tmp_path, quiet):
+    directory = str(tmp_path / 'run')
+    recorder = package.DataRecorder(directory)
+    recorder.add_source('dmm', rows=True)
+    with quiet(), recorder:
+        recorder.push('dmm', {'data': [1.0, 2.0], 'time': [0.0]}, t=1.0)
+        recorder.push('dmm', {'data': [3.0, 4.0], 'time': [0.0, 1.0]}, t=2.0)
+    assert recorder.error is None
+    assert recorder.sources['dmm'].stats['errors'] == 1
+    assert np.array_equal(package.DataStore(directory).read('dmm')['data'], [3.0, 4.0])
+
+
+def test_existing_recording_refused(package, tmp_path):
+    directory = str(tmp_path / 'run')
+    with package.DataRecorder(directory):
+        pass
+    with pytest.raises(IOError):
+        package.DataRecorder(directory)
@@ -0,0 +1,119 @@
+"""Smoke tests of the EA drivers against the loopback simulators in EA/EA_simulator.py"""
+
+import pytest
+
+NOMINALS = {'PSI8000': (720, 15, 3000), 'EL9000': (750, 25, 2400), 'PS2400B': (42, 4, 160)}  # as the drivers have
+
+
+@pytest.fixture
+def EA(package):
+    return package.EA
+
+
+def make_device(EA, model, transport):
+    device = EA.PS2400B(*NOMINALS[model][:2]) if model == 'PS2400B' else getattr(EA, model)()
+    device.ser = EA.SimulatedEaSerial(model, *NOMINALS[model], timeout=0.2)  # a stopping transport waits for a read
+    if transport:
+        device.use_transport()
+    return device
+
+
+@pytest.mark.parametrize('transport', [False, True])
+@pytest.mark.parametrize('model', ['PSI8000', 'EL9000'])
+def test_set_and_read_back(EA, quiet, model, transport):
+    device = make_device(EA, model, transport)
+    with quiet():
+        device.set_remote(1)
+        device.set_v(100)
+        device.set_i(5)
+        device.output_on(1)
+        device.query_output()
+    assert device.output['v'] == pytest.approx(100, rel=1e-3)
+    assert device.output['i'] == pytest.approx(5, rel=1e-3)
+    assert device.output['p'] == pytest.approx(500, rel=1e-3)
+    with quiet():
+        device.disconnect()
+
+
+@pytest.mark.parametrize('transport', [False, True])
+def test_ps2400b_channels(EA, quiet, transport):
+    device = make_device(EA, 'PS2400B', transport)
+    with quiet():
+        for channel, voltage in ((1, 12), (2, 24)):
+            device.set_remote(1, channel)
+            device.set_v(voltage, channel)
+            device.set_i(2, channel)
+            device.output_on(1, channel)
+        single = dict(device.query_output(2))
+        both = device.query_all()
+    assert both[1]['V_ps'] == pytest.approx(12, rel=1e-3)
+    assert both[2]['V_ps'] == pytest.approx(24, rel=1e-3)
+    assert single['V_ps'] == both[2]['V_ps'] and single['I_ps'] == both[2]['I_ps']
+    assert both[1]['output_on'] == 1 and both[1]['controller_state'] == 'CV'
+
+
+@pytest.mark.parametrize('fast_verify', [False, True])
+def test_psb9000(EA, quiet, fast_verify):
+    device = EA.PSB9000(fast_verify=fast_verify)
+    device.ser = EA.SimulatedPSB9000Serial()
+    with quiet():
+        device.set_remote(1)
+        device.set_v(48)
+        device.set_i(3, 'SOURCE')
+        device.output_on(1)
+        output = device.query_output_array()
+    assert output['v'] == pytest.approx(48)
+    assert output['i'] == pytest.approx(3)
+
+
+def test_refused_set_is_not_blamed_on_a_query(EA, quiet):
+    device = make_device(EA, 'PSI8000', True)
+    transport = device.transport
+    SD = device.make_SD(2, 1, 0, 3)
+    with quiet():
+        transport.send(device.codec.encode(SD, 1, 99, (0, 0)))  # the simulator refuses an unknown object
+        device.set_v(50)
+        device.output_on(1)
+        device.query_output()
+    assert device.output['v'] == pytest.approx(50, rel=1e-3)
+    assert transport.last_error is not None and transport.last_error.code == 3
+    assert transport.stats['device_errors'] == 1 and transport.stats['unmatched'] == 0
+    with quiet():
+        device.disconnect()
+
+
+def test_shared_transport_outlives_one_device(EA, quiet):
+    first = make_device(EA, 'PSI8000', True)
+    second = EA.PSI8000()
+    second.ser = first.ser
+    second.use_transport(first.transport)
+    transport = first.transport
+    with quiet():
+        first.disconnect()
+        second.set_v(10)
+        second.output_on(1)
+        second.query_output()
+    assert second.output['v'] == pytest.approx(10, rel=1e-2)
+    with quiet():
+        second.disconnect()
+    assert transport._thread is None
+
+
+def test_bus(EA):
+    ser = EA.SimulatedEaSerial('PSI8000', bus_nodes=[1, 2], broadcast_node=31, timeout=0.2)
+    with EA.EaBus(ser, broadcast_node=31) as bus:
+        bus.add(1)
+        bus.add(2)
+        bus.set_v(1, 100).result(1)
+        bus.set_v(2, 200).result(1)
+        bus.broadcast_output(1).result(1)
+        readings = bus.read_all(timeout=1)
+    assert readings[1]['v'] == pytest.approx(100, rel=1e-3)
+    assert readings[2]['v'] == pytest.approx(200, rel=1e-3)
+
+
+def test_bus_broadcast_needs_a_node(EA):
+    with EA.EaBus(EA.SimulatedEaSerial('PSI8000', bus_nodes=[1], timeout=0.2)) as bus:
+        bus.add(1)
+        with pytest.raises(ValueError):
+            bus.broadcast_output(1)
@@ -0,0 +1,56 @@
+"""Round trips through IRCodecWriter and IRCodecReader"""
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return (rng.integers(0, 1000, (37, 4, 5)) - 500).astype(np.int16)
+
+
+def write(package, path, frames, **kwargs):
+    with package.IRCodecWriter(str(path), keyframe_interval=5, **kwargs) as writer:
+        for k, frame in enumerate(frames):
+            assert writer.write(frame, float(k))
+    return writer
+
+
+def test_round_trip(package, tmp_path, frames):
+    writer = write(package, tmp_path / 'a.irc', frames)
+    assert writer.stats['written'] == len(frames)
+    with package.IRCodecReader(str(tmp_path / 'a.irc')) as reader:
+        assert len(reader) == len(frames)
+        assert np.array_equal(reader.frames(), frames)
+        assert np.array_equal(reader.times(), np.arange(float(len(frames))))
+        assert np.array_equal(reader[12], frames[12])
+
+
+@pytest.mark.parametrize('index', [slice(None), slice(None, None, -1), slice(30, 2, -4), slice(1, 30, 3),
+                                   slice(5, 5), slice(9, 2), slice(-3, None)])
+def test_slices_match_list_indexing(package, tmp_path, frames, index):
+    write(package, tmp_path / 'a.irc', frames)
+    with package.IRCodecReader(str(tmp_path / 'a.irc')) as reader:
+        assert np.array_equal(reader[index], frames[index])
+
+
+def test_unclosed_file_is_rescanned(package, tmp_path, frames):
+    path = tmp_path / 'a.irc'
+    write(package, path, frames)
+    data = path.read_bytes()
+    with package.IRCodecReader(str(path)) as reader:
+        end = int(reader._offsets[-1]) + 3  # cut the index and part of the last record
+    path.write_bytes(data[:end])
+    with package.IRCodecReader(str(path)) as reader:
+        assert len(reader) == len(frames) - 1
+        assert np.array_equal(reader.frames(), frames[:-1])
+
+
+def test_mismatched_frame_refused(package, tmp_path, frames):
+    writer = package.IRCodecWriter(str(tmp_path / 'a.irc'))
+    writer.start()
+    writer.write(frames[0])
+    with pytest.raises(ValueError):
+        writer.write(frames[0].astype(np.float32))
+    writer.stop()
@@ -0,0 +1,51 @@
+"""Round trips through IRFrameRecorder and IRFrameStore"""
+
+import time
+
+import numpy as np
+import pytest
+
+
+def record(package, directory, n, chunk_frames=7):
+    frames = [np.full((3, 4), k, dtype=np.uint16) for k in range(n)]
+    with package.IRFrameRecorder(str(directory), chunk_frames=chunk_frames) as recorder:
+        for k, frame in enumerate(frames):
+            assert recorder.write(frame, float(k))
+    return np.array(frames)
+
+
+def test_round_trip(package, tmp_path):
+    frames = record(package, tmp_path, 30)
+    store = package.IRFrameStore(str(tmp_path))
+    assert len(store) == 30
+    assert np.array_equal(store.frames(), frames)
+    assert np.array_equal(store.times(), np.arange(30.0))
+    assert np.array_equal(store[-1], frames[-1])
+
+
+@pytest.mark.parametrize('index', [slice(None), slice(None, None, -1), slice(25, 3, -4), slice(2, 20, 3),
+                                   slice(5, 5), slice(10, 2), slice(-3, None), slice(None, None, -7)])
+def test_slices_match_list_indexing(package, tmp_path, index):
+    frames = record(package, tmp_path, 30)
+    assert np.array_equal(package.IRFrameStore(str(tmp_path))[index], frames[index])
+
+
+def test_existing_recording_refused(package, tmp_path):
+    record(package, tmp_path, 3)
+    with pytest.raises(IOError):
+        package.IRFrameRecorder(str(tmp_path))
+
+
+def test_write_after_writer_error(package, tmp_path, quiet):
+    recorder = package.IRFrameRecorder(str(tmp_path))
+    recorder.start()
+    with quiet():
+        recorder.write(np.zeros((2, 2)), 0.0)
+        recorder.write(np.zeros((3, 3)), 1.0)  # a different shape fails in the writer thread
+        deadline = time.monotonic() + 5
+        while recorder.error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert recorder.error is not None
+    with pytest.raises(IOError):
+        recorder.write(np.zeros((2, 2)))
+    recorder.stop()
@@ -0,0 +1,61 @@
+"""Smoke tests of the SCPI drivers against the simulated instruments in visa_simulator"""
+
+import pytest
+
+
+@pytest.fixture
+def rm(package):
+    return package.SimulatedResourceManager(record_length=500, seed=0)
+
+
+def test_mso54_read(package, rm, quiet):
+    scope = package.MSO54(rm=rm)
+    with quiet():
+        scope.open()
+        waves = scope.read(500)
+    assert sorted(waves) == scope.CHAN
+    for wave in waves.values():
+        assert len(wave['Amp']) == len(wave['Time']) == 500
+
+
+def test_mso54_batch_keeps_quoted_arguments(package, rm, quiet):
+    scope = package.MSO54(rm=rm)
+    with quiet():
+        scope.open()
+    with scope.batch(opc=True):
+        scope.inst.write('DISPLAY:PERSISTENCE "a;b"')
+        scope.set()
+    assert scope.inst.query('DISPLAY:PERSISTENCE?').strip() == '"a;b"'
+    assert scope.inst.query('TRIG:A:EDGE:SLOPE?').strip() == 'FALL'
+
+
+def test_dsox2024a_read(package, rm, quiet):
+    scope = package.DSOX2024A(rm=rm)
+    with quiet():
+        scope.open()
+        scope.set_channels()
+        waves = scope.read()
+    assert len(waves) == sum(scope.CHAN)
+    for wave in waves.values():
+        assert len(wave['Amp']) == len(wave['Time']) > 0
+
+
+def test_dmm6500_buffered_data(package, rm, quiet):
+    dmm = package.DMM6500(rm=rm)
+    dmm.n_samples = 200
+    with quiet():
+        dmm.configureBuffers_SCPI_Trig_Digitize()
+        dmm.trigger()
+        data = dmm.getBufferedData()
+    assert len(data['data']) == len(data['time']) > 0
+
+
+def test_mm2000_buffered_data(package, rm, quiet):
+    dmm = package.MM2000(rm=rm)
+    dmm.n_sample = 100
+    with quiet():
+        dmm.configureBuffers()
+        dmm.trigger()
+        data = dmm.getBufferedData()
+    assert len(data['data']) == len(data['time']) == 100
+    assert dmm.COMMAND_BUFFER == 256
@@ -0,0 +1,372 @@
+"""Opt-in tracing of the commands the drivers send, to find out whether a slow test cycle goes on bus transfers, fixed
+sleeps or processing between them. Nothing is traced, and nothing costs anything, until a device is attached:
+
+    tracer = CommandTracer()
+    tracer.attach(scope)    # wraps scope.inst (VISA drivers) or ps.ser (EA drivers)
+    tracer.trace_sleeps()   # also account for time.sleep in the driver modules
+    ... run the test ...
+    tracer.print_report()
+    tracer.to_csv('trace.csv')
+
+Every write starts an exchange, which lasts until the next traced write made by the same thread, or until the thread
+calls flush. The reads (and the reply half of a query) and time.sleep calls the thread makes in between are added to
+it, so an exchange's time is split into io (time inside write/read/query calls), sleep and other (the rest, mostly
+parsing the reply in the driver). Call flush after the last command, or the last exchange is cut off at its last read.
+Exchanges are aggregated per device and command header (the text before the arguments, e.g. CHAN1:RANGE, or the object
+number of an EA telegram) into a latency histogram with log spaced bins.
+
+Attach an EA device before calling use_transport, as the transport keeps the connection it was created with. Its
+replies are read on the transport's own thread, so only the writes are timed.
+Setting enabled to False keeps the proxies in place but passes calls straight through.
+"""
+
+import bisect
+import csv
+import importlib
+import json
+import threading
+import time
+
+import numpy as np
+
+# Latency histogram bin edges, s: 10 us to 10 s, four bins per decade
+DEFAULT_BINS = tuple(float(edge) for edge in np.logspace(-5, 1, 25))
+# Modules whose time.sleep calls trace_sleeps accounts for, relative to this package
+DRIVER_MODULES = ('EA.EA_comms', 'Keysight.Keysight', 'TekScope.MSO54Comms', 'Keithley.Keithley_comms')
+_EA_TYPES = {1: 'query', 3: 'send'}  # transmission type in the top two bits of an EA start delimiter
+
+
+def command_key(message):
+    """Returns the command header(s) of a message, without arguments. Binary EA telegrams give 'obj <n> <type>'"""
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        message = bytes(message)
+        try:
+            text = message.decode('ascii')
+        except UnicodeDecodeError:
+            text = None
+        if text is None or not text.endswith('\n'):
+            if len(message) < 3:
+                return 'binary'
+            return 'obj ' + str(message[2]) + ' ' + _EA_TYPES.get(message[0] >> 6, 'type ' + str(message[0] >> 6))
+        message = text
+    headers = [part.split(None, 1)[0] for part in message.strip().split(';') if part.strip()]
+    return ';'.join(headers)
+
+
+def _size(result):
+    """Bytes read, from what a read or query returned. The values of query_ascii_values and query_binary_values are
+    counted at their decoded size"""
+    if isinstance(result, int):
+        return result  # readinto
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (list, tuple)):
+        return 8 * len(result)
+    return len(result) if result is not None else 0
+
+
+class _Exchange:
+    __slots__ = ('device', 'command', 'start', 'end', 'io', 'sleep', 'bytes_out', 'bytes_in')
+
+    def __init__(self, device, command, start):
+        self.device = device
+        self.command = command
+        self.start = start
+        self.end = start
+        self.io = 0.0
+        self.sleep = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+
+class _CommandStats:
+    __slots__ = ('count', 'total', 'io', 'sleep', 'minimum', 'maximum', 'bytes_out', 'bytes_in', 'histogram')
+
+    def __init__(self, n_bins):
+        self.count = 0
+        self.total = 0.0
+        self.io = 0.0
+        self.sleep = 0.0
+        self.minimum = float('inf')
+        self.maximum = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.histogram = [0] * n_bins
+
+
+class CommandTracer:
+    def __init__(self, bins=DEFAULT_BINS, keep_exchanges=0):
+        """
+        bins - increasing histogram bin edges in seconds. Bin k counts latencies up to bins[k], the last bin those
+        above bins[-1]
+        keep_exchanges - int    number of the most recent exchanges kept in full in self.exchanges, 0 for none
+        """
+        self.bins = tuple(bins)
+        self.enabled = True
+        self.keep_exchanges = keep_exchanges
+        self.exchanges = []  # (device, command, start time, total, io, sleep, bytes out, bytes in)
+        self.stats = {'unattributed_sleep': 0.0}
+        self._commands = {}  # (device, command): _CommandStats
+        self._attached = {}  # id(device): (device, attribute, original connection)
+        self._patched = {}  # module: its time module
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # Attaching
+    def attach(self, device, name=None, attribute=None):
+        """Wraps the connection of a driver so its commands are traced. attribute is the name of the connection, inst
+        or ser by default, whichever the device has. name labels the device in the results, its class name if not
+        given. Returns the device"""
+        if id(device) in self._attached:
+            return device
+        if attribute is None:
+            attribute = 'inst' if hasattr(device, 'inst') else 'ser'
+        connection = getattr(device, attribute)
+        proxy = TracedConnection(connection, self, name or type(device).__name__)
+        setattr(device, attribute, proxy)
+        self._attached[id(device)] = (device, attribute, connection)
+        return device
+
+    def detach(self, device=None):
+        """Puts back the original connection of a device, or of every attached device if none is given"""
+        devices = [device] if device is not None else [entry[0] for entry in self._attached.values()]
+        for device in devices:
+            entry = self._attached.pop(id(device), None)
+            if entry is not None:
+                setattr(entry[0], entry[1], entry[2])
+        self._close_exchange()
+
+    def trace_sleeps(self, modules=None):
+        """Accounts for the time.sleep calls of driver modules, by default all of DRIVER_MODULES that are importable.
+        modules are module objects or names relative to this package"""
+        for module in modules if modules is not None else DRIVER_MODULES:
+            if isinstance(module, str):
+                try:
+                    module = importlib.import_module('.' + module, __package__)
+                except ImportError:
+                    continue
+            if module not in self._patched and hasattr(module, 'time'):
+                self._patched[module] = module.time
+                module.time = _TracedTime(module.time, self)
+
+    def untrace_sleeps(self):
+        for module, original in self._patched.items():
+            module.time = original
+        self._patched = {}
+
+    def close(self):
+        """Detaches every device and stops tracing sleeps"""
+        self.detach()
+        self.untrace_sleeps()
+
+    # Recording
+    def _start(self, device, command, started, n_bytes):
+        """Ends the thread's current exchange and starts a new one"""
+        self._close_exchange(started)
+        exchange = _Exchange(device, command, started)
+        exchange.bytes_out = n_bytes
+        self._local.exchange = exchange
+        return exchange
+
+    def _io(self, exchange, started, ended, bytes_in=0):
+        exchange.io += ended - started
+        exchange.bytes_in += bytes_in
+        if ended > exchange.end:
+            exchange.end = ended
+
+    def _sleep(self, started, ended):
+        exchange = getattr(self._local, 'exchange', None)
+        if exchange is None:
+            with self._lock:
+                self.stats['unattributed_sleep'] += ended - started
+            return
+        exchange.sleep += ended - started
+        if ended > exchange.end:
+            exchange.end = ended
+
+    def _close_exchange(self, ended=None):
+        """Ends the thread's current exchange at time ended, or at its last I/O or sleep if not given"""
+        exchange = getattr(self._local, 'exchange', None)
+        if exchange is None:
+            return
+        self._local.exchange = None
+        if ended is not None and ended > exchange.end:
+            exchange.end = ended
+        total = exchange.end - exchange.start
+        key = (exchange.device, exchange.command)
+        with self._lock:
+            stats = self._commands.get(key)
+            if stats is None:
+                stats = self._commands[key] = _CommandStats(len(self.bins) + 1)
+            stats.count += 1
+            stats.total += total
+            stats.io += exchange.io
+            stats.sleep += exchange.sleep
+            stats.minimum = min(stats.minimum, total)
+            stats.maximum = max(stats.maximum, total)
+            stats.bytes_out += exchange.bytes_out
+            stats.bytes_in += exchange.bytes_in
+            stats.histogram[bisect.bisect_left(self.bins, total)] += 1
+            if self.keep_exchanges:
+                self.exchanges.append((exchange.device, exchange.command, exchange.start, total, exchange.io,
+                                       exchange.sleep, exchange.bytes_out, exchange.bytes_in))
+                if len(self.exchanges) > self.keep_exchanges:
+                    del self.exchanges[:len(self.exchanges) - self.keep_exchanges]
+
+    def flush(self):
+        """Ends the calling thread's current exchange now, so it is included in the results with the processing done
+        since its last read"""
+        self._close_exchange(time.perf_counter())
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+            self.exchanges = []
+            self.stats['unattributed_sleep'] = 0.0
+
+    # Results
+    def _quantile(self, stats, q):
+        """Upper edge of the histogram bin holding quantile q, or the maximum if that is lower"""
+        target = q * stats.count
+        seen = 0
+        for k, count in enumerate(stats.histogram):
+            seen += count
+            if seen >= target and count:
+                return min(self.bins[k], stats.maximum) if k < len(self.bins) else stats.maximum
+        return stats.maximum
+
+    def summary(self, sort='total'):
+        """
+        Returns a list of dicts, one per device and command, sorted by the given field, largest first:
+        count, total, mean, min, max, p50, p90, p99 - exchange times in s, the percentiles to histogram resolution
+        io, sleep, other - total s inside driver I/O calls, in time.sleep, and neither
+        bytes_out, bytes_in - bytes written and read
+        histogram - count of exchanges in each bin of self.bins
+        """
+        self._close_exchange()
+        rows = []
+        with self._lock:
+            items = list(self._commands.items())
+        for (device, command), stats in items:
+            rows.append({'device': device, 'command': command, 'count': stats.count, 'total': stats.total,
+                         'mean': stats.total / stats.count, 'min': stats.minimum, 'max': stats.maximum,
+                         'p50': self._quantile(stats, 0.5), 'p90': self._quantile(stats, 0.9),
+                         'p99': self._quantile(stats, 0.99), 'io': stats.io, 'sleep': stats.sleep,
+                         'other': stats.total - stats.io - stats.sleep, 'bytes_out': stats.bytes_out,
+                         'bytes_in': stats.bytes_in, 'histogram': list(stats.histogram)})
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'bins': list(self.bins), 'unattributed_sleep': self.stats['unattributed_sleep'],
+                       'commands': self.summary()}, f, indent=2)
+
+    def to_csv(self, path):
+        """One row per device and command, the histogram as one column per bin headed by its upper edge"""
+        rows = self.summary()
+        fields = ['device', 'command', 'count', 'total', 'mean', 'min', 'max', 'p50', 'p90', 'p99', 'io', 'sleep',
+                  'other', 'bytes_out', 'bytes_in']
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields + ['le_%.3g' % edge for edge in self.bins] + ['gt_%.3g' % self.bins[-1]])
+            for row in rows:
+                writer.writerow([row[field] for field in fields] + row['histogram'])
+
+    def print_report(self, n=20):
+        """Prints the n commands with the most total time"""
+        print('{:<12}{:<32}{:>7}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+            'device', 'command', 'count', 'total s', 'mean ms', 'p90 ms', 'io s', 'sleep s', 'other s'))
+        for row in self.summary()[:n]:
+            print('{:<12}{:<32}{:>7}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}'.format(
+                row['device'][:11], row['command'][:31], row['count'], row['total'], row['mean'] * 1e3,
+                row['p90'] * 1e3, row['io'], row['sleep'], row['other']))
+
+
+class TracedConnection:
+    """Proxy for a VISA resource or serial port which reports its traffic to a CommandTracer. Every other attribute,
+    including setting one such as timeout, goes to the wrapped connection"""
+    _WRITES = ('write', 'write_raw')
+    _READS = ('read', 'read_raw', 'read_bytes', 'readline', 'readinto', 'read_all')
+    _QUERIES = ('query', 'query_ascii_values', 'query_binary_values')
+
+    def __init__(self, connection, tracer, device):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_tracer', tracer)
+        object.__setattr__(self, '_device', device)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._connection, name)
+        if name in self._WRITES:
+            traced = self._traced_write(attribute)
+        elif name in self._READS:
+            traced = self._traced_read(attribute)
+        elif name in self._QUERIES:
+            traced = self._traced_query(attribute)
+        else:
+            return attribute
+        object.__setattr__(self, name, traced)  # found directly from now on, without calling __getattr__
+        return traced
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def _traced_write(self, func):
+        tracer = self._tracer
+
+        def write(message, *args, **kwargs):
+            if not tracer.enabled:
+                return func(message, *args, **kwargs)
+            started = time.perf_counter()
+            exchange = tracer._start(self._device, command_key(message), started, len(message))
+            try:
+                return func(message, *args, **kwargs)
+            finally:
+                tracer._io(exchange, started, time.perf_counter())
+        return write
+
+    def _traced_read(self, func):
+        tracer = self._tracer
+
+        def read(*args, **kwargs):
+            exchange = getattr(tracer._local, 'exchange', None)
+            if not tracer.enabled or exchange is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            tracer._io(exchange, started, time.perf_counter(), _size(result))
+            return result
+        return read
+
+    def _traced_query(self, func):
+        tracer = self._tracer
+
+        def query(message, *args, **kwargs):
+            if not tracer.enabled:
+                return func(message, *args, **kwargs)
+            started = time.perf_counter()
+            exchange = tracer._start(self._device, command_key(message), started, len(message))
+            result = None
+            try:
+                result = func(message, *args, **kwargs)
+                return result
+            finally:
+                tracer._io(exchange, started, time.perf_counter(), _size(result))
+        return query
+
+
+class _TracedTime:
+    """Stands in for the time module inside a driver module, timing its sleeps"""
+    def __init__(self, module, tracer):
+        self._module = module
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def sleep(self, seconds):
+        if not self._tracer.enabled:
+            return self._module.sleep(seconds)
+        started = self._module.perf_counter()
+        self._module.sleep(seconds)
+        self._tracer._sleep(started, self._module.perf_counter())
@@ -0,0 +1,695 @@
+"""In-process stand-ins for pyvisa, so the SCPI drivers (MSO54, KeysightScope, Keithley) can be exercised and
+benchmarked without the bench. Pass a SimulatedResourceManager to a driver in place of the pyvisa.ResourceManager it
+creates:
+
+    scope = MSO54(rm=SimulatedResourceManager(latency=0.001, bandwidth=40e6, record_length=100000))
+    dmm = DMM6500(rm=SimulatedResourceManager())
+
+The resource string picks the instrument emulated (Tektronix, Keysight or Keithley USB vendor id, ASRL for the
+Keithley 2000), or instruments can be given explicitly by resource string. Each instrument answers the commands its
+driver sends, including waveform transfer by CURVE?, :WAV:DATA? and :TRACE:DATA? as ASCII or IEEE 488.2 binary blocks.
+Other commands are stored and given back when queried, and a query the instrument does not know gets no response, so
+the read times out as it would on the bench.
+
+Headers are compared in SCPI short form, so e.g. HORIZONTAL:MODE:SCALE and HORizontal:MODE:SCAle are the same setting.
+Every write and read is delayed by the configured latency plus the time to move its bytes at the configured bandwidth.
+"""
+
+import collections
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    from pyvisa.constants import StatusCode
+    from pyvisa.errors import VisaIOError
+
+    def _timeout_error():
+        return VisaIOError(StatusCode.error_timeout)
+except ImportError:
+    def _timeout_error():
+        return TimeoutError("VISA read timed out, the simulated instrument has no response queued")
+
+_VOWELS = 'AEIOU'
+_NODE = re.compile(r'^([A-Z_]+?)(\d*)$')
+
+
+def normalise_header(header):
+    """Returns a SCPI header in short form, upper case, without a leading colon or the query mark"""
+    header = header.strip().upper().lstrip(':').rstrip('?')
+    if header.startswith('*'):
+        return header
+    nodes = []
+    for node in header.split(':'):
+        match = _NODE.match(node)
+        if match is None:
+            nodes.append(node)  # e.g. X1Y1SOURCE, compared as written
+            continue
+        name, suffix = match.groups()
+        if len(name) >= 4:
+            # Four letters, or three if the fourth is a vowel. Not every instrument follows this (WFMOutpre), but any
+            # spelling of a header maps to the same key, which is all that is needed here
+            name = name[:3] if name[3] in _VOWELS else name[:4]
+        nodes.append(name + suffix)
+    return ':'.join(nodes)
+
+
+def _split(text, separator):
+    """Splits on separator outside double or single quotes"""
+    parts = []
+    current = []
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == separator:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current))
+    return parts
+
+
+def ieee_block(data):
+    """Wraps bytes in an IEEE 488.2 definite length block, #<digits><length><data>"""
+    length = str(len(data))
+    return b'#' + str(len(length)).encode('ascii') + length.encode('ascii') + data
+
+
+def parse_ieee_block(message):
+    """Returns the data of an IEEE 488.2 definite length block"""
+    start = message.index(b'#')
+    digits = int(message[start + 1:start + 2])
+    length = int(message[start + 2:start + 2 + digits])
+    begin = start + 2 + digits
+    if len(message) < begin + length:
+        raise IOError("Binary block is shorter than its header says")
+    return message[begin:begin + length]
+
+
+def _channel(value):
+    """Channel number in a source such as CH2, CHAN2 or CHANNEL2"""
+    return int(re.search(r'\d+', value).group())
+
+
+def default_signal(channel, t):
+    """1 MHz sine on every channel, with amplitude and phase set by the channel number"""
+    return 0.5 * channel * np.sin(2 * np.pi * 1e6 * t + channel)
+
+
+class SimulatedInstrument:
+    """pyvisa MessageBasedResource compatible instrument. Subclasses add handlers for commands which do more than store
+    a setting. HANDLERS maps a header to the name of a method called as method(args, query), where args is the list of
+    comma separated arguments; it returns the response of a query as str or bytes"""
+    IDN = 'SIMULATED,INSTRUMENT,0,0'
+    DEFAULTS = {}  # header: value returned when queried before being written
+    HANDLERS = {'*IDN': '_idn', '*OPC': '_opc', '*RST': '_rst', '*CLS': '_cls', '*TRG': '_trg',
+                'SYSTEM:ERROR': '_error'}
+
+    def __init__(self, resource_name='SIM::INSTR', latency=0.0, bandwidth=0.0, record_length=10000, noise=0.001,
+                 acquisition_time=0.0, signal=None, seed=None):
+        """
+        latency - float     seconds added to every write and read, the bus round trip and command processing
+        bandwidth - float   bytes per second moved over the bus, 0 for no limit
+        record_length - int     points in an acquisition or reading buffer unless the driver sets it
+        noise - float   rms noise added to the signal, in volts
+        acquisition_time - float    seconds from arming until an acquisition is complete
+        signal - function (channel, times array) returning the signal in volts, default_signal if not given
+        """
+        self.resource_name = resource_name
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.record_length = record_length
+        self.noise = noise
+        self.acquisition_time = acquisition_time
+        self.signal = signal or default_signal
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = '\n'
+        self.send_end = True
+        self.stats = {'writes': 0, 'reads': 0, 'bytes_written': 0, 'bytes_read': 0, 'acquisitions': 0,
+                      'timeouts': 0}
+        self.errors = collections.deque()  # SCPI error queue
+        self._random = np.random.default_rng(seed)
+        self._responses = collections.deque()
+        self._lock = threading.RLock()
+        self._handlers = {}
+        for cls in reversed(type(self).__mro__):
+            for header, method in getattr(cls, 'HANDLERS', {}).items():
+                self._handlers[normalise_header(header)] = getattr(self, method)
+        self._rst()
+
+    # pyvisa resource interface
+    def write(self, message, termination=None, encoding=None):
+        started = time.perf_counter()
+        with self._lock:
+            responses = []
+            for command in _split(message.strip(), ';'):
+                if command.strip():
+                    response = self._execute(command.strip())
+                    if response is not None:
+                        responses.append(response)
+            if responses:
+                if all(isinstance(response, str) for response in responses):
+                    self._responses.append((';'.join(responses) + '\n').encode('ascii'))
+                else:
+                    self._responses.append(b''.join(response if isinstance(response, bytes)
+                                                    else response.encode('ascii') for response in responses) + b'\n')
+            self.stats['writes'] += 1
+            self.stats['bytes_written'] += len(message) + 1
+        self._wait(started, len(message) + 1)
+        return len(message) + 1
+
+    def write_raw(self, message):
+        return self.write(message.decode('ascii'))
+
+    def read_raw(self, size=None):
+        started = time.perf_counter()
+        with self._lock:
+            if not self._responses:
+                self.stats['timeouts'] += 1
+                raise _timeout_error()
+            response = self._responses.popleft()
+            self.stats['reads'] += 1
+            self.stats['bytes_read'] += len(response)
+        self._wait(started, len(response))
+        return response
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        return self.read_raw()[:count]
+
+    def read(self, termination=None, encoding=None):
+        message = self.read_raw().decode('ascii')
+        termination = termination or self.read_termination
+        if termination and message.endswith(termination):
+            message = message[:-len(termination)]
+        return message
+
+    def query(self, message, delay=None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read()
+
+    def query_ascii_values(self, message, converter='f', separator=',', container=list, delay=None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        text = self.read().strip()
+        if converter == 'f':
+            converter = float
+        elif converter in ('d', 'i'):
+            converter = int
+        values = [converter(item) for item in text.split(separator) if item]
+        if container in (np.array, np.ndarray):
+            return np.array(values)
+        return container(values)
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list, delay=None,
+                            header_fmt='ieee', expect_termination=True, data_points=None, chunk_size=None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        values = np.frombuffer(parse_ieee_block(self.read_raw()), dtype=('>' if is_big_endian else '<') + datatype)
+        if container in (np.array, np.ndarray):
+            return values.copy()
+        return container(values.tolist())
+
+    def set_visa_attribute(self, name, state):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+
+    def close(self):
+        self.clear()
+
+    def _wait(self, started, n_bytes):
+        delay = self.latency + (n_bytes / self.bandwidth if self.bandwidth else 0.0)
+        remaining = started + delay - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    # Command handling
+    def _execute(self, command):
+        parts = command.split(None, 1)
+        query = parts[0].endswith('?')
+        header = normalise_header(parts[0])
+        args = [arg.strip() for arg in _split(parts[1], ',')] if len(parts) > 1 else []
+        handler = self._handlers.get(header)
+        if handler is not None:
+            return handler(args, query)
+        if query:
+            if header in self.settings:
+                return self.settings[header]
+            self.errors.append('-113,"Undefined header;' + command + '"')
+            return None
+        self.settings[header] = ','.join(args)
+        return None
+
+    def setting(self, header, default=None):
+        return self.settings.get(normalise_header(header), default)
+
+    def float_setting(self, header, default=0.0):
+        """The first number in a setting, ignoring units such as the V in CHAN1:RANGE 8.0 V"""
+        value = self.setting(header)
+        if value is None:
+            return default
+        return float(value.split()[0])
+
+    def _idn(self, args, query):
+        return self.IDN
+
+    def _opc(self, args, query):
+        return '1' if query else None
+
+    def _rst(self, args=None, query=False):
+        self.settings = {normalise_header(header): str(value) for header, value in self.DEFAULTS.items()}
+        self._acquisition = {}
+        self._acquired_at = time.time()
+        self._done_at = 0.0
+
+    def _cls(self, args, query):
+        self.errors.clear()
+
+    def _trg(self, args, query):
+        pass
+
+    def _error(self, args, query):
+        return self.errors.popleft() if self.errors else '0,"No error"'
+
+    def _acquire(self):
+        """Starts a new acquisition, waveforms are generated when first read"""
+        self._acquisition = {}
+        self._acquired_at = time.time()
+        self._done_at = time.monotonic() + self.acquisition_time
+        self.stats['acquisitions'] += 1
+
+    def _volts(self, channel, times):
+        values = self.signal(channel, times)
+        if self.noise:
+            values = values + self._random.normal(0.0, self.noise, len(times))
+        return values
+
+
+class SimulatedMSO54(SimulatedInstrument):
+    """Tektronix MSO54 as used by TekScope.MSO54: waveforms by CURVE? in any DATa:ENCdg encoding"""
+    IDN = 'TEKTRONIX,MSO54,C012598,CF:91.1CT FV:1.0.0'
+    DEFAULTS = {'HEADER': '1', 'HORIZONTAL:POSITION': '50', 'HORIZONTAL:DIVISIONS': '10',
+                'HORIZONTAL:MODE:SAMPLERATE': '1.25E+09', 'HORIZONTAL:MODE': 'AUTO', 'ACQUIRE:MODE': 'SAMPLE',
+                'ACQUIRE:STOPAFTER': 'RUNSTOP', 'DATA:SOURCE': 'CH1', 'DATA:ENCDG': 'RIBINARY', 'DATA:WIDTH': '1',
+                'DATA:START': '1', 'DATA:STOP': '10000', 'WFMOUTPRE:BIT_NR': '8'}
+    HANDLERS = {'DATA:SOURCE:AVAILABLE': '_available', 'ACQUIRE:STATE': '_acquire_state', 'CURVE': '_curve',
+                'WFMOUTPRE:YMULT': '_ymult', 'WFMOUTPRE:YOFF': '_yoff', 'WFMOUTPRE:YZERO': '_yzero',
+                'WFMPRE:YZERO': '_yzero', 'WFMOUTPRE:XINCR': '_xincr', 'WFMOUTPRE:NR_PT': '_nr_pt',
+                'HORIZONTAL:MODE:SCALE': '_scale', 'HORIZONTAL:MODE:SAMPLERATE': '_samplerate'}
+    CHANNELS = 4
+    # DATa:ENCdg (first three letters): byte order and kind of the binary data, ASCII if not listed
+    ENCODINGS = {'RIB': '>i', 'RPB': '>u', 'SRI': '<i', 'SRP': '<u', 'FPB': '>f', 'SFP': '<f'}
+
+    def __init__(self, resource_name='USB::0x0699::0x0522::C012598::INSTR', channels=(1, 2, 3, 4), **kwargs):
+        """channels - the channels displayed, and so available to read, at start"""
+        self.channels = channels
+        super().__init__(resource_name, **kwargs)
+
+    def _rst(self, args=None, query=False):
+        super()._rst()
+        for channel in range(1, self.CHANNELS + 1):
+            self.settings[normalise_header('CH%d:SCALE' % channel)] = '1.0'
+            self.settings[normalise_header('CH%d:OFFSET' % channel)] = '0.0'
+            self.settings[normalise_header('CH%d:POSITION' % channel)] = '0.0'
+            self.settings[normalise_header('DISPLAY:WAVEVIEW1:CH%d:STATE' % channel)] = \
+                '1' if channel in self.channels else '0'
+        self._record = self.record_length
+
+    def _available(self, args, query):
+        available = [ch for ch in range(1, self.CHANNELS + 1)
+                     if self.setting('DISPLAY:WAVEVIEW1:CH%d:STATE' % ch) in ('1', 'ON')]
+        return ','.join('CH%d' % ch for ch in available) or 'NONE'
+
+    def _acquire_state(self, args, query):
+        if query:
+            return '1' if time.monotonic() < self._done_at else '0'
+        if args and args[0].upper() in ('1', 'ON', 'RUN'):
+            self._acquire()
+
+    def _samplerate(self, args, query):
+        if query:
+            return self.setting('HORIZONTAL:MODE:SAMPLERATE')
+        self.settings[normalise_header('HORIZONTAL:MODE:SAMPLERATE')] = args[0]
+        self._record = int(round(self.float_setting('HORIZONTAL:DIVISIONS') * self._scale_value() * float(args[0])))
+
+    def _scale(self, args, query):
+        if query:
+            return repr(self._scale_value())
+        # Manual mode keeps the sample rate and changes the record length to fill the screen
+        self._record = int(round(self.float_setting('HORIZONTAL:DIVISIONS') * float(args[0])
+                                 * self.float_setting('HORIZONTAL:MODE:SAMPLERATE')))
+
+    def _scale_value(self):
+        return self._record / (self.float_setting('HORIZONTAL:DIVISIONS')
+                               * self.float_setting('HORIZONTAL:MODE:SAMPLERATE'))
+
+    def _source(self):
+        return _channel(self.setting('DATA:SOURCE'))
+
+    def _width(self):
+        return int(self.float_setting('DATA:WIDTH'))
+
+    def _ymult(self, args, query):
+        return repr(self.float_setting('CH%d:SCALE' % self._source()) * 10 / 2 ** (8 * self._width()))
+
+    def _yoff(self, args, query):
+        return '0.0'
+
+    def _yzero(self, args, query):
+        return self.setting('CH%d:OFFSET' % self._source())
+
+    def _xincr(self, args, query):
+        return repr(1 / self.float_setting('HORIZONTAL:MODE:SAMPLERATE'))
+
+    def _range(self):
+        start = max(int(self.float_setting('DATA:START')), 1)
+        stop = min(int(self.float_setting('DATA:STOP')), self._record)
+        return start, stop
+
+    def _nr_pt(self, args, query):
+        start, stop = self._range()
+        return str(max(stop - start + 1, 0))
+
+    def _codes(self, channel):
+        """16 bit codes of the whole record of the current acquisition, as read at full resolution"""
+        key = ('codes', channel)
+        if key not in self._acquisition:
+            position = self.float_setting('HORIZONTAL:POSITION') / 100
+            times = (np.arange(self._record) - position * self._record) / self.float_setting(
+                'HORIZONTAL:MODE:SAMPLERATE')
+            volts = self._volts(channel, times)
+            ymult = self.float_setting('CH%d:SCALE' % channel) * 10 / 2 ** 16
+            self._acquisition[key] = np.clip(np.round((volts - self.float_setting('CH%d:OFFSET' % channel)) / ymult),
+                                             -2 ** 15, 2 ** 15 - 1).astype(np.int16)
+        return self._acquisition[key]
+
+    def _curve(self, args, query):
+        channel = self._source()
+        start, stop = self._range()
+        encoding = self.setting('DATA:ENCDG').upper()
+        width = self._width()
+        key = ('curve', channel, start, stop, encoding, width)
+        if key not in self._acquisition:
+            codes = self._codes(channel)[start - 1:stop].astype(np.int32)
+            if width == 1:
+                codes = codes >> 8
+            dtype = self.ENCODINGS.get(encoding[:3])
+            if dtype is None:
+                response = ','.join(map(str, codes.tolist()))
+            elif dtype[1] == 'f':
+                response = ieee_block(codes.astype(dtype + '4').tobytes())
+            elif dtype[1] == 'u':
+                response = ieee_block((codes + 2 ** (8 * width - 1)).astype(dtype + str(width)).tobytes())
+            else:
+                response = ieee_block(codes.astype(dtype + str(width)).tobytes())
+            self._acquisition[key] = response
+        return self._acquisition[key]
+
+
+class SimulatedKeysightScope(SimulatedInstrument):
+    """Keysight InfiniiVision scope as used by Keysight.KeysightScope: waveforms by :WAV:DATA? as ASCII, BYTE or WORD"""
+    IDN = 'KEYSIGHT TECHNOLOGIES,DSO-X 2024A,MY56202075,02.50.2019022736'
+    DEFAULTS = {'TIMEBASE:REFERENCE': 'CENT', 'TIMEBASE:MODE': 'MAIN', 'ACQUIRE:TYPE': 'NORM',
+                'WAVEFORM:SOURCE': 'CHAN1', 'WAVEFORM:FORMAT': 'BYTE', 'WAVEFORM:POINTS': '1000',
+                'WAVEFORM:UNSIGNED': '1', 'WAVEFORM:BYTEORDER': 'MSBF', 'MARKER:Y1POSITION': '0.0'}
+    HANDLERS = {':SINGLE': '_single', ':RUN': '_run', ':STOP': '_stop', ':DIGITIZE': '_single',
+                ':OPERATION:CONDITION': '_oper_cond', ':WAVEFORM:PREAMBLE': '_preamble', ':WAVEFORM:DATA': '_data'}
+    CHANNELS = 4
+
+    def __init__(self, resource_name='USB0::0x0957::0x1796::MY56202075::INSTR', samplerate=1e9,
+                 channels=(1, 2, 3, 4), **kwargs):
+        """
+        samplerate - float  samples per second, the timebase range defaults to a record_length record at this rate
+        channels - the channels displayed at start
+        """
+        self.samplerate = samplerate
+        self.channels = channels
+        super().__init__(resource_name, **kwargs)
+
+    def _rst(self, args=None, query=False):
+        super()._rst()
+        for channel in range(1, self.CHANNELS + 1):
+            self.settings[normalise_header('CHAN%d:RANGE' % channel)] = '8.0'
+            self.settings[normalise_header('CHAN%d:OFFSET' % channel)] = '0.0'
+            self.settings[normalise_header('CHAN%d:IMPEDANCE' % channel)] = 'ONEM'
+            self.settings[normalise_header('CHAN%d:DISPLAY' % channel)] = '1' if channel in self.channels else '0'
+        self.settings[normalise_header('TIMEBASE:RANGE')] = repr(self.record_length / self.samplerate)
+        self._running = False
+
+    def _single(self, args, query):
+        self._running = False
+        self._acquire()
+
+    def _run(self, args, query):
+        self._running = True
+        self._acquire()
+
+    def _stop(self, args, query):
+        self._running = False
+
+    def _oper_cond(self, args, query):
+        # Bit 3 is set while the scope is running
+        return '8' if self._running or time.monotonic() < self._done_at else '0'
+
+    def _points(self):
+        points = self.setting('WAVEFORM:POINTS').upper()
+        if points.startswith('MAX') or points.startswith('RAW'):
+            return self.record_length
+        return min(int(float(points)), self.record_length)
+
+    def _format(self):
+        fmt = self.setting('WAVEFORM:FORMAT').upper()
+        return 'ASCII' if fmt.startswith('ASC') else fmt[:4]
+
+    def _source(self):
+        return _channel(self.setting('WAVEFORM:SOURCE'))
+
+    def _scaling(self):
+        """(x increment, x origin, y increment, y origin, y reference) of the current source and format"""
+        points = self._points()
+        time_range = self.float_setting('TIMEBASE:RANGE')
+        reference = {'LEFT': 0.1, 'CENT': 0.5, 'RIGH': 0.9}.get(self.setting('TIMEBASE:REFERENCE').upper()[:4], 0.5)
+        bits = 16 if self._format() == 'WORD' else 8
+        channel = self._source()
+        y_increment = self.float_setting('CHAN%d:RANGE' % channel) / 2 ** bits
+        y_reference = 2 ** (bits - 1) if self.setting('WAVEFORM:UNSIGNED') in ('1', 'ON') else 0
+        return (time_range / points, -reference * time_range, y_increment,
+                self.float_setting('CHAN%d:OFFSET' % channel), y_reference)
+
+    def _preamble(self, args, query):
+        x_increment, x_origin, y_increment, y_origin, y_reference = self._scaling()
+        fmt = {'BYTE': 0, 'WORD': 1, 'ASCII': 4}.get(self._format(), 0)
+        return ','.join([str(fmt), '0', str(self._points()), '1', '%E' % x_increment, '%E' % x_origin, '0',
+                         '%E' % y_increment, '%E' % y_origin, str(y_reference)])
+
+    def _volts_record(self, channel):
+        key = ('volts', channel)
+        if key not in self._acquisition:
+            x_increment, x_origin = self._scaling()[:2]
+            times = x_origin + np.arange(self._points()) * x_increment
+            self._acquisition[key] = self._volts(channel, times)
+        return self._acquisition[key]
+
+    def _data(self, args, query):
+        channel = self._source()
+        fmt = self._format()
+        key = ('data', channel, fmt, self._points(), self.setting('WAVEFORM:UNSIGNED'),
+               self.setting('WAVEFORM:BYTEORDER'))
+        if key not in self._acquisition:
+            volts = self._volts_record(channel)
+            if fmt == 'ASCII':
+                text = ','.join('%+.6E' % value for value in volts.tolist())
+                response = '#8%08d' % len(text) + text
+            else:
+                x_increment, x_origin, y_increment, y_origin, y_reference = self._scaling()
+                bits = 16 if fmt == 'WORD' else 8
+                unsigned = y_reference != 0
+                low, high = (0, 2 ** bits - 1) if unsigned else (-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+                codes = np.clip(np.round((volts - y_origin) / y_increment) + y_reference, low, high)
+                byte_order = '<' if self.setting('WAVEFORM:BYTEORDER').upper().startswith('LSB') else '>'
+                response = ieee_block(codes.astype(byte_order + ('u' if unsigned else 'i') + str(bits // 8)).tobytes())
+            self._acquisition[key] = response
+        return self._acquisition[key]
+
+
+class SimulatedKeithley(SimulatedInstrument):
+    """Reading buffer shared by the Keithley multimeters. :TRACE:DATA? answers in ASCII, or as a binary block of
+    float64 (FORM:DATA REAL) or float32 (FORM:DATA SREAL) in FORM:BORD order"""
+    DEFAULTS = {'FORMAT:DATA': 'ASCII', 'FORMAT:BORDER': 'NORMAL', 'TRIGGER:DELAY': '0.0'}
+    HANDLERS = {':READ': '_read', ':MEASURE': '_read', ':FETCH': '_fetch', ':INIT': '_init',
+                ':TRACE:POINTS': '_points', ':TRACE:CLEAR': '_clear', ':TRACE:ACTUAL': '_actual',
+                ':TRACE:DATA': '_trace_data'}
+
+    def _rst(self, args=None, query=False):
+        super()._rst()
+        self._readings = np.zeros(0)
+        self._times = np.zeros(0)
+        self._buffer_points = self.record_length
+        self._last = 0.0
+
+    def _read(self, args, query):
+        self._last = float(self._volts(1, np.array([time.time() - self._acquired_at]))[0])
+        return '%.9E' % self._last
+
+    def _fetch(self, args, query):
+        return '%.9E' % self._last
+
+    def _points(self, args, query):
+        if query:
+            return str(self._buffer_points)
+        self._buffer_points = int(float(args[0]))
+
+    def _clear(self, args, query):
+        self._readings = np.zeros(0)
+        self._times = np.zeros(0)
+
+    def _actual(self, args, query):
+        return str(len(self._readings))
+
+    def _fill(self, count, interval):
+        """Fills the buffer as if count readings had been taken interval seconds apart. Once the buffer is full the
+        newest readings overwrite the oldest, so the buffer is in time order only until it wraps"""
+        self._acquire()
+        first = max(count - self._buffer_points, 0)
+        order = np.argsort(np.arange(first, count) % self._buffer_points)  # buffer slot each reading is in
+        self._times = (first + order) * float(interval)
+        self._readings = self._volts(1, self._times)
+
+    def _format_values(self, values):
+        fmt = self.setting('FORMAT:DATA').upper()
+        if fmt.startswith('ASC'):
+            return ','.join('%.9E' % value for value in values)
+        byte_order = '<' if self.setting('FORMAT:BORDER').upper().startswith('SWAP') else '>'
+        dtype = byte_order + ('f4' if fmt.startswith('SRE') else 'f8')
+        return ieee_block(np.asarray(values, dtype=dtype).tobytes())
+
+
+class SimulatedDMM6500(SimulatedKeithley):
+    """Keithley DMM6500 as used by Keithley.DMM6500. :INIT starts digitizing into defbuffer1 at :SENS:DIG:VOLT:SRATE
+    and the buffer is full straight away. *TRG ends the acquisition, the readings taken since :INIT having wrapped
+    around the buffer"""
+    IDN = 'KEITHLEY INSTRUMENTS,MODEL DMM6500,04396331,1.7.5b'
+    DEFAULTS = dict(SimulatedKeithley.DEFAULTS, **{':SENSE:DIGITIZE:VOLTAGE:SRATE': '1000000'})
+
+    def __init__(self, resource_name='USB0::0x05E6::0x6500::04396331::INSTR', **kwargs):
+        super().__init__(resource_name, **kwargs)
+
+    def _rst(self, args=None, query=False):
+        super()._rst()
+        self._started = None
+
+    def _srate(self):
+        return self.float_setting(':SENSE:DIGITIZE:VOLTAGE:SRATE')
+
+    def _init(self, args, query):
+        self._started = time.monotonic()
+        self._fill(self._buffer_points, 1 / self._srate())
+
+    def _trg(self, args, query):
+        if self._started is not None:
+            count = max(self._buffer_points, int((time.monotonic() - self._started) * self._srate()))
+            self._fill(count, 1 / self._srate())
+            self._started = None
+
+    def _trace_data(self, args, query):
+        """:TRACE:DATA? start, end, "defbuffer1", elements. Elements are READ and REL, any other is sent as 0"""
+        if not args:
+            return self._format_values(self._readings)
+        start = max(int(float(args[0])), 1)
+        end = min(int(float(args[1])), len(self._readings)) if len(args) > 1 else len(self._readings)
+        if start > end:
+            self.errors.append('-222,"Data out of range"')
+            return None
+        elements = [element.upper() for element in args[3:]] or ['READ']
+        columns = []
+        for element in elements:
+            if element.startswith('READ'):
+                columns.append(self._readings[start - 1:end])
+            elif element.startswith('REL'):
+                columns.append(self._times[start - 1:end])
+            else:
+                columns.append(np.zeros(end - start + 1))
+        return self._format_values(np.stack(columns, axis=1).ravel())
+
+
+class SimulatedMM2000(SimulatedKeithley):
+    """Keithley 2000 as used by Keithley.MM2000, on a serial port. INIT then *TRG takes :SAMPLE:COUNT readings (at most
+    :TRACE:POINTS) TRIG:DELAY apart into the buffer, which :TRACE:DATA? returns whole"""
+    IDN = 'KEITHLEY INSTRUMENTS INC.,MODEL 2000,1234567,A20 /A02'
+    DEFAULTS = dict(SimulatedKeithley.DEFAULTS, **{':SAMPLE:COUNT': '1'})
+
+    def __init__(self, resource_name='ASRL10::INSTR', **kwargs):
+        super().__init__(resource_name, **kwargs)
+
+    def _rst(self, args=None, query=False):
+        super()._rst()
+        self._armed = False
+
+    def _init(self, args, query):
+        self._armed = True
+
+    def _trg(self, args, query):
+        if self._armed:
+            count = min(int(self.float_setting(':SAMPLE:COUNT')), self._buffer_points)
+            self._fill(count, self.float_setting('TRIGGER:DELAY'))
+            self._armed = False
+
+    def _trace_data(self, args, query):
+        if not len(self._readings):
+            return ''
+        return self._format_values(self._readings)
+
+
+# USB vendor id or interface type in a resource string: instrument emulated
+SIMULATORS = {'0X0699': SimulatedMSO54, '0X0957': SimulatedKeysightScope, '0X05E6': SimulatedDMM6500,
+              'ASRL': SimulatedMM2000}
+
+
+class SimulatedResourceManager:
+    """pyvisa ResourceManager whose resources are simulated instruments. An instrument keeps its state when it is
+    closed and opened again, as a real one would"""
+    def __init__(self, instruments=None, **sim_args):
+        """
+        instruments - dict of resource string: SimulatedInstrument, for instruments not picked by resource string or
+            needing their own settings
+        sim_args - passed to the SimulatedInstrument created for any other resource string, e.g. latency, bandwidth,
+            record_length
+        """
+        self.instruments = dict(instruments or {})
+        self.sim_args = sim_args
+
+    def open_resource(self, resource_name, **kwargs):
+        instrument = self.instruments.get(resource_name)
+        if instrument is None:
+            upper = resource_name.upper()
+            for key, simulator in SIMULATORS.items():
+                if key in upper:
+                    instrument = simulator(resource_name, **self.sim_args)
+                    break
+            else:
+                raise ConnectionError("No simulated instrument for resource " + resource_name)
+            self.instruments[resource_name] = instrument
+        for name, value in kwargs.items():
+            setattr(instrument, name, value)
+        return instrument
+
+    def list_resources(self, query='?*::INSTR'):
+        return tuple(self.instruments)
+
+    def close(self):
+        for instrument in self.instruments.values():
+            instrument.close()